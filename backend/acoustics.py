@@ -0,0 +1,176 @@
+"""Streaming acoustic features of a speaker's 16-bit PCM.
+
+`AcousticAnalyzer` buffers a session's audio and analyses it in batches of
+frames, so each call does a bounded amount of vectorized work instead of
+per-sample Python. For each frame it measures level (dBFS), clipped
+samples and, for frames loud enough to be speech, the pitch (F0) from an
+FFT autocorrelation. Rolling histories over the last `window_seconds`
+give the noise floor, speech level, SNR, volume and pitch variability;
+runs of quiet frames give pause lengths.
+"""
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+class AcousticAnalyzer:
+    """Incremental level, SNR, clipping, pitch and pause tracking"""
+
+    def __init__(self, sample_rate: int = 16000, frame_samples: int = 512,
+                 batch_seconds: float = 0.5, window_seconds: float = 10.0,
+                 min_pitch: float = 70.0, max_pitch: float = 400.0,
+                 voicing_threshold: float = 0.45, clip_level: int = 32000,
+                 min_pause: float = 0.25):
+        self.sample_rate = sample_rate
+        self.frame_samples = frame_samples
+        self.frame_seconds = frame_samples / sample_rate
+        self.batch_frames = max(1, int(batch_seconds / self.frame_seconds))
+        self.min_lag = int(sample_rate / max_pitch)
+        self.max_lag = min(frame_samples - 1, int(sample_rate / min_pitch))
+        self.voicing_threshold = voicing_threshold
+        self.clip_level = clip_level
+        self.min_pause_frames = max(1, int(round(min_pause / self.frame_seconds)))
+        self._fft_size = 1 << (2 * frame_samples - 1).bit_length()
+        self._window = np.hanning(frame_samples).astype(np.float32)
+
+        # Samples waiting for a full batch, reused between calls
+        self._pending = np.zeros(self.batch_frames * frame_samples, dtype=np.int16)
+        self._pending_len = 0
+
+        # Per-frame histories over the rolling window (NaN pitch = unvoiced)
+        size = max(self.batch_frames, int(window_seconds / self.frame_seconds))
+        self._levels = np.full(size, np.nan, dtype=np.float32)
+        self._pitches = np.full(size, np.nan, dtype=np.float32)
+        self._clipped = np.zeros(size, dtype=np.int32)
+        self._index = 0
+
+        self.noise_floor = -60.0
+        self._spoken = False
+        self._pause_frames = 0
+        self.pause_count = 0
+        self.pause_total = 0.0
+        self.longest_pause = 0.0
+        self.frames = 0
+
+    def process(self, pcm: np.ndarray) -> Optional[Dict[str, Any]]:
+        """Feed mono int16 samples; returns updated features after each full batch"""
+        features = None
+        offset = 0
+        batch = self.batch_frames * self.frame_samples
+        while offset < len(pcm):
+            take = min(batch - self._pending_len, len(pcm) - offset)
+            self._pending[self._pending_len:self._pending_len + take] = pcm[offset:offset + take]
+            self._pending_len += take
+            offset += take
+            if self._pending_len == batch:
+                self._analyse(self._pending[:batch].reshape(self.batch_frames, self.frame_samples))
+                self._pending_len = 0
+                features = self.features()
+        return features
+
+    def _analyse(self, frames: np.ndarray) -> None:
+        samples = frames.astype(np.float32)
+        rms = np.sqrt(np.mean(samples * samples, axis=1))
+        levels = 20 * np.log10(rms / 32768.0 + 1e-10)
+        clipped = np.count_nonzero(np.abs(samples) >= self.clip_level, axis=1)
+
+        # Pitch only for frames that can plausibly be speech
+        pitches = np.full(len(frames), np.nan, dtype=np.float32)
+        loud = levels > self.noise_floor + 10
+        if loud.any():
+            pitches[loud] = self._pitch(samples[loud])
+
+        n = len(frames)
+        slots = (self._index + np.arange(n)) % len(self._levels)
+        self._levels[slots] = levels
+        self._pitches[slots] = pitches
+        self._clipped[slots] = clipped
+        self._index = (self._index + n) % len(self._levels)
+        self.frames += n
+
+        # The quiet end of the recent level distribution is the noise floor
+        self.noise_floor = float(np.nanpercentile(self._levels, 10))
+        self._track_pauses(levels < self.noise_floor + 6)
+
+    def _pitch(self, samples: np.ndarray) -> np.ndarray:
+        """F0 in Hz per frame from the normalized autocorrelation peak (NaN if unvoiced)"""
+        centered = (samples - samples.mean(axis=1, keepdims=True)) * self._window
+        spectrum = np.fft.rfft(centered, n=self._fft_size)
+        autocorr = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, n=self._fft_size)
+        energy = autocorr[:, :1] + 1e-9
+        search = autocorr[:, self.min_lag:self.max_lag + 1] / energy
+
+        peak = np.argmax(search, axis=1)
+        strength = search[np.arange(len(search)), peak]
+        # Parabolic interpolation around the peak for sub-sample lags
+        inner = np.clip(peak, 1, search.shape[1] - 2)
+        rows = np.arange(len(search))
+        left, mid, right = search[rows, inner - 1], search[rows, inner], search[rows, inner + 1]
+        denom = left - 2 * mid + right
+        shift = np.where(np.abs(denom) > 1e-9, 0.5 * (left - right) / np.where(denom == 0, 1, denom), 0.0)
+        lag = self.min_lag + inner + np.clip(shift, -1, 1)
+
+        return np.where(strength > self.voicing_threshold, self.sample_rate / lag, np.nan)
+
+    def _track_pauses(self, quiet: np.ndarray) -> None:
+        """Carry runs of quiet frames across batches and record finished pauses"""
+        if quiet.all():
+            self._pause_frames += len(quiet)
+            return
+
+        edges = np.diff(np.concatenate(([0], quiet.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        runs = np.flatnonzero(edges == -1) - starts
+        leading = bool(self._pause_frames) or (len(starts) > 0 and starts[0] == 0)
+        if len(starts) and starts[0] == 0:
+            # Continues the pause carried over from the last batch
+            runs[0] += self._pause_frames
+        elif self._pause_frames:
+            runs = np.concatenate(([self._pause_frames], runs))
+
+        # A run reaching the end of the batch is still going
+        if quiet[-1]:
+            self._pause_frames = int(runs[-1])
+            runs = runs[:-1]
+        else:
+            self._pause_frames = 0
+
+        if not self._spoken:
+            # Silence before the first words is not a pause
+            if leading:
+                runs = runs[1:]
+            self._spoken = True
+
+        pauses = runs[runs >= self.min_pause_frames] * self.frame_seconds
+        if len(pauses):
+            self.pause_count += len(pauses)
+            self.pause_total += float(pauses.sum())
+            self.longest_pause = max(self.longest_pause, float(pauses.max()))
+
+    def features(self) -> Dict[str, Any]:
+        filled = min(self.frames, len(self._levels))
+        levels = self._levels[~np.isnan(self._levels)]
+        speech = levels[levels > self.noise_floor + 10]
+        speech_level = float(np.percentile(speech, 50)) if len(speech) else self.noise_floor
+
+        pitches = self._pitches[~np.isnan(self._pitches)]
+        pitch = pitch_variability = None
+        if len(pitches) >= 10:
+            median = float(np.median(pitches))
+            pitch = median
+            pitch_variability = float(np.std(12 * np.log2(pitches / median)))
+
+        return {
+            "level_db": float(self._levels[self._index - 1]) if self.frames else -100.0,
+            "speech_level_db": speech_level,
+            "noise_floor_db": self.noise_floor,
+            "snr_db": speech_level - self.noise_floor,
+            "clipping_percentage": 100.0 * float(self._clipped.sum()) / (filled * self.frame_samples or 1),
+            "pitch_hz": pitch,
+            "pitch_variability": pitch_variability,
+            "volume_variability": float(np.std(speech)) if len(speech) > 1 else 0.0,
+            "current_pause": self._pause_frames * self.frame_seconds if self._spoken else 0.0,
+            "longest_pause": self.longest_pause,
+            "pause_count": self.pause_count,
+            "mean_pause": self.pause_total / self.pause_count if self.pause_count else 0.0
+        }
@@ -0,0 +1,140 @@
+"""Shared AWS clients, created on first use.
+
+Every session and thread gets its clients from one `AWSClients`
+registry, so connections and resolved credentials are reused instead of
+paying for a TLS handshake per session, and modes that never call AWS
+(local face analysis, replayed transcripts) never load boto3 at all.
+
+Connection settings come from the environment when the registry is
+first used, after any .env file has been loaded:
+
+  AWS_MAX_POOL_CONNECTIONS  HTTP connections kept per boto3 client (10)
+  AWS_TCP_KEEPALIVE         keep idle connections alive (on)
+  AWS_CONNECT_TIMEOUT       seconds to open a connection (3)
+  AWS_READ_TIMEOUT          seconds to wait for a response (10)
+  AWS_MAX_ATTEMPTS          tries per boto3 call, including the first (2)
+  TRANSCRIBE_CONNECTIONS    HTTP/2 connections shared by transcription streams (2)
+"""
+import itertools
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.environ.get(name, default).lower() not in ("0", "off", "false", "no")
+
+
+class AWSClients:
+    """Thread-safe registry of boto3 and Transcribe streaming clients
+
+    boto3 clients are thread-safe once built, but building them is not, so
+    each (service, region) client is built once under a lock from the
+    registry's own boto3 session and then shared.
+
+    Transcribe streams are multiplexed as HTTP/2 streams over one
+    connection per TranscribeStreamingClient; new streams are spread round
+    robin over `transcribe_connections` clients so one connection doesn't
+    carry every session's audio.
+    """
+
+    def __init__(self, max_pool_connections: int = 10, tcp_keepalive: bool = True,
+                 connect_timeout: float = 3.0, read_timeout: float = 10.0, max_attempts: int = 2,
+                 transcribe_connections: int = 2):
+        self.max_pool_connections = max_pool_connections
+        self.tcp_keepalive = tcp_keepalive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        # Throttling is retried with backoff by the callers (see throttle.py),
+        # so botocore only gets one quick retry for dropped connections
+        self.max_attempts = max_attempts
+        self.transcribe_connections = max(1, transcribe_connections)
+        self._lock = threading.Lock()
+        self._session = None
+        self._clients: Dict[Tuple[str, Optional[str]], Any] = {}
+        self._transcribe: Dict[str, Tuple[List[Any], "itertools.cycle"]] = {}
+        self.streams_started = 0
+
+    @classmethod
+    def from_env(cls) -> "AWSClients":
+        return cls(
+            max_pool_connections=int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", 10)),
+            tcp_keepalive=_env_flag("AWS_TCP_KEEPALIVE", "on"),
+            connect_timeout=float(os.environ.get("AWS_CONNECT_TIMEOUT", 3.0)),
+            read_timeout=float(os.environ.get("AWS_READ_TIMEOUT", 10.0)),
+            max_attempts=int(os.environ.get("AWS_MAX_ATTEMPTS", 2)),
+            transcribe_connections=int(os.environ.get("TRANSCRIBE_CONNECTIONS", 2))
+        )
+
+    def client(self, service: str, region: Optional[str] = None):
+        """The shared boto3 client for `service` in `region`"""
+        key = (service, region)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = self._build_client(service, region)
+            return self._clients[key]
+
+    def _build_client(self, service: str, region: Optional[str]):
+        import boto3
+        from botocore.config import Config
+
+        if self._session is None:
+            self._session = boto3.session.Session()
+        config = Config(
+            max_pool_connections=self.max_pool_connections,
+            tcp_keepalive=self.tcp_keepalive,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            retries={"mode": "standard", "total_max_attempts": self.max_attempts}
+        )
+        return self._session.client(service, region_name=region, config=config)
+
+    def transcribe(self, region: str):
+        """A Transcribe streaming client for `region`, taking turns over the pool"""
+        with self._lock:
+            if region not in self._transcribe:
+                pool = [self._build_transcribe(region) for _ in range(self.transcribe_connections)]
+                self._transcribe[region] = (pool, itertools.cycle(pool))
+            self.streams_started += 1
+            return next(self._transcribe[region][1])
+
+    def _build_transcribe(self, region: str):
+        from amazon_transcribe.client import TranscribeStreamingClient
+
+        client = TranscribeStreamingClient(region=region)
+        # The library has no option for this; its connections use these socket options
+        socket_options = getattr(getattr(client, "_session_manager", None), "_socket_options", None)
+        if socket_options is not None:
+            socket_options.keep_alive = self.tcp_keepalive
+            socket_options.connect_timeout_ms = int(self.connect_timeout * 1000)
+        return client
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "clients": sorted(f"{service}/{region or 'default'}" for service, region in self._clients),
+                "transcribe_regions": sorted(self._transcribe),
+                "transcribe_streams": self.streams_started
+            }
+
+
+_shared: Optional[AWSClients] = None
+_shared_lock = threading.Lock()
+
+
+def shared_clients() -> AWSClients:
+    """The process-wide registry, configured from the environment on first use"""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = AWSClients.from_env()
+    return _shared
+
+
+def aws_client(service: str, region: Optional[str] = None):
+    """Shortcut for ``shared_clients().client(service, region)``"""
+    return shared_clients().client(service, region)
@@ -1,21 +1,15 @@
 import os
 
 import cv2
-import boto3
 import matplotlib.pyplot as plt
 import seaborn as sns
 import datetime
 from dotenv import load_dotenv
+from awsclients import aws_client
+from sampler import FrameSampler
 
 load_dotenv()
 
-# Initialize AWS Rekognition client
-rekognition = boto3.client(
-    'rekognition',
-    aws_access_key_id=os.eviron['AWS_ACCESS_KEY_ID'],
-    aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
-    region_name=os.environ['AWS_REGION']
-)
 # Initialize Seaborn
 sns.set(style="whitegrid")
 
@@ -57,8 +51,9 @@ def analyze_frame_with_rekognition(frame, confidence):
     _, buffer = cv2.imencode('.jpg', frame)
     image_bytes = buffer.tobytes()
 
-    # Call Rekognition for face analysis
-    response = rekognition.detect_faces(
+    # Call Rekognition for face analysis; the client is created on the first call
+    # and takes AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY from the environment
+    response = aws_client('rekognition', os.environ['AWS_REGION']).detect_faces(
         Image={'Bytes': image_bytes},
         Attributes=['ALL']
     )
@@ -110,7 +105,8 @@ def main():
     confidence = 50  # Start with mid-level confidence
     start_time = datetime.datetime.now()  # Track start time
 
-    frame_interval = 30  # Process every 30th frame to avoid high latency with Rekognition
+    # Only analyze frames where the scene changed (or every 2 s), at most 2 per second
+    frame_sampler = FrameSampler(max_staleness=2.0, max_rate=2.0)
 
     while True:
         ret, frame = cap.read()
@@ -118,8 +114,8 @@ def main():
             print("Failed to capture video frame.")
             break
 
-        # Only process every `frame_interval` frames to reduce latency
-        if int((datetime.datetime.now() - start_time).total_seconds() * 30) % frame_interval == 0:
+        # Skip frames that look like the last one analyzed to reduce latency and API calls
+        if frame_sampler.should_sample(frame):
             # Perform analysis with AWS Rekognition
             eye_contact, confidence = analyze_frame_with_rekognition(frame, confidence)
             eye_contact_data.append(eye_contact)
@@ -0,0 +1,92 @@
+"""Outbound message encoding for the API and WebSocket stream.
+
+Models are turned into plain dicts by serializers compiled once per model
+class, which skip pydantic's generic dict()/validation machinery, and then
+encoded as compact JSON (orjson when installed) or MessagePack. Clients
+pick the wire format with ``?wire=json|msgpack`` when they connect.
+"""
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+from uuid import UUID
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+WIRE_JSON = "json"
+WIRE_MSGPACK = "msgpack"
+
+
+def available_wire_formats() -> Tuple[str, ...]:
+    return (WIRE_JSON, WIRE_MSGPACK) if msgpack is not None else (WIRE_JSON,)
+
+
+def encode_datetime(value: datetime) -> str:
+    return value.isoformat()
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    if hasattr(value, "__dict__"):
+        return dict(value.__dict__)
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def compile_serializer(model_cls, converters: Optional[Dict[str, Callable[[Any], Any]]] = None
+                       ) -> Callable[[Any], Dict[str, Any]]:
+    """Build a fast model -> dict function for `model_cls`.
+
+    Fields without a converter are copied as-is; converted fields pass
+    through their converter unless they are None.
+    """
+    fields = getattr(model_cls, "model_fields", None) or model_cls.__fields__
+    converters = converters or {}
+    steps = tuple((name, converters.get(name)) for name in fields)
+
+    def serialize(obj) -> Dict[str, Any]:
+        values = obj.__dict__
+        out = {}
+        for name, convert in steps:
+            value = values[name]
+            out[name] = value if convert is None or value is None else convert(value)
+        return out
+
+    serialize.__name__ = f"serialize_{model_cls.__name__}"
+    return serialize
+
+
+def dumps_json(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class MessageEncoder:
+    """Encodes and sends payloads in the wire format a client negotiated"""
+
+    def __init__(self, wire: str = WIRE_JSON):
+        if wire not in available_wire_formats():
+            raise ValueError(f"Unsupported wire format: {wire}")
+        self.wire = wire
+
+    def encode(self, payload: Any) -> Union[str, bytes]:
+        if self.wire == WIRE_MSGPACK:
+            return msgpack.packb(payload, default=_default, use_bin_type=True)
+        return dumps_json(payload).decode("utf-8")
+
+    async def send(self, websocket, payload: Any) -> None:
+        data = self.encode(payload)
+        if isinstance(data, bytes):
+            await websocket.send_bytes(data)
+        else:
+            await websocket.send_text(data)
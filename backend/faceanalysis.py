@@ -0,0 +1,623 @@
+"""Face analysis for eye contact and confidence.
+
+The scoring here is the one the desktop apps apply to Rekognition's
+``detect_faces`` response: eye contact when the eyes are open and the head
+faces the camera, and a confidence score that drifts up with positive and
+down with negative expressions. Analyzers return ``FaceDetails``-shaped
+dicts so the same scoring works whichever backend produced them.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from awsclients import aws_client
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+POSITIVE_EMOTIONS = ('HAPPY', 'SURPRISED')
+NEGATIVE_EMOTIONS = ('SAD', 'DISGUSTED', 'ANGRY', 'CONFUSED')
+
+
+def score_face(face: Dict[str, Any], confidence: float) -> Tuple[int, float]:
+    """Eye contact (0 or 100) and the updated confidence for one face"""
+    eye_contact = 0
+
+    # Eye contact is considered high if eyes are open and head is facing forward
+    eyes_open = (face['EyesOpen']['Value'] and face['EyesOpen']['Confidence'] > 80)
+    pitch = abs(face['Pose']['Pitch'])  # Head tilt up/down
+    roll = abs(face['Pose']['Roll'])  # Head tilt left/right
+    yaw = abs(face['Pose']['Yaw'])  # Head turn left/right
+    if eyes_open and pitch < 15 and roll < 15 and yaw < 15:
+        eye_contact = 100
+
+    # Nudge confidence by the balance of positive and negative expressions
+    emotions = face.get('Emotions', [])
+    positive_score = sum(e['Confidence'] for e in emotions if e['Type'] in POSITIVE_EMOTIONS)
+    negative_score = sum(e['Confidence'] for e in emotions if e['Type'] in NEGATIVE_EMOTIONS)
+    if positive_score > negative_score:
+        confidence = min(confidence + 2, 100)
+    elif negative_score > positive_score:
+        confidence = max(confidence - 1, 0)
+
+    return eye_contact, confidence
+
+
+class FaceImage:
+    """A camera frame as JPEG bytes, raw I420 or a BGR array, converted on demand
+
+    Conversions happen on first access, so they run on whichever worker
+    thread analyses the frame rather than on the event loop.
+    """
+
+    def __init__(self, jpeg: Optional[bytes] = None, bgr: Optional[np.ndarray] = None,
+                 i420: Optional[Tuple[Any, int, int]] = None,
+                 crop: Optional[Tuple[float, float, float, float]] = None):
+        if jpeg is None and bgr is None and i420 is None:
+            raise ValueError("FaceImage needs JPEG bytes, I420 pixels or a BGR array")
+        self._jpeg = jpeg
+        self._bgr = bgr
+        self._i420 = i420
+        self._preview: Optional[np.ndarray] = None
+        # Part of the frame worth uploading as (left, top, right, bottom) ratios, see FaceCropTracker
+        self.crop = crop
+
+    @property
+    def jpeg(self) -> bytes:
+        if self._jpeg is None:
+            _, buffer = cv2.imencode('.jpg', self.bgr)
+            self._jpeg = buffer.tobytes()
+        return self._jpeg
+
+    def preview(self) -> np.ndarray:
+        """Cheap grayscale (or already decoded) version for change detection"""
+        if self._bgr is not None:
+            return self._bgr
+        if self._i420 is not None:
+            data, width, height = self._i420
+            # The Y plane is the grayscale image
+            return np.frombuffer(data, dtype=np.uint8, count=width * height).reshape(height, width)
+        if self._preview is None:
+            # Decoded once for both the sampler and the result cache
+            self._preview = cv2.imdecode(np.frombuffer(self._jpeg, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+            if self._preview is None:
+                raise ValueError("Could not decode JPEG frame")
+        return self._preview
+
+    @property
+    def bgr(self) -> np.ndarray:
+        if self._bgr is None:
+            if self._i420 is not None:
+                data, width, height = self._i420
+                yuv = np.frombuffer(data, dtype=np.uint8).reshape(height * 3 // 2, width)
+                self._bgr = cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR_I420)
+            else:
+                self._bgr = cv2.imdecode(np.frombuffer(self._jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if self._bgr is None:
+                    raise ValueError("Could not decode JPEG frame")
+        return self._bgr
+
+    def encode(self, crop: Optional[Tuple[float, float, float, float]] = None,
+               max_side: Optional[int] = None, quality: int = 95) -> bytes:
+        """JPEG of the frame or of `crop`, at most `max_side` pixels on its longer side
+
+        A whole frame that arrived as JPEG is passed through as it is.
+        """
+        if crop is None and self._jpeg is not None:
+            return self._jpeg
+        frame = self.bgr
+        if crop is not None:
+            height, width = frame.shape[:2]
+            left, top, right, bottom = crop
+            frame = frame[int(top * height):int(bottom * height), int(left * width):int(right * width)]
+        if max_side and max(frame.shape[:2]) > max_side:
+            scale = max_side / max(frame.shape[:2])
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buffer.tobytes()
+
+    @property
+    def gray(self) -> np.ndarray:
+        if self._bgr is not None:
+            return cv2.cvtColor(self._bgr, cv2.COLOR_BGR2GRAY)
+        if self._i420 is not None:
+            return self.preview()
+        gray = cv2.imdecode(np.frombuffer(self._jpeg, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError("Could not decode JPEG frame")
+        return gray
+
+
+class FaceAnalyzer:
+    """Finds faces in a frame and describes them like Rekognition's FaceDetails"""
+
+    name = "base"
+    # Frames per second worth analysing; bounded by cost and latency
+    max_rate = 2.0
+
+    def detect_faces(self, image: FaceImage) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+REKOGNITION_MIN_SIDE = 80
+
+
+class RekognitionFaceAnalyzer(FaceAnalyzer):
+    """Amazon Rekognition ``detect_faces`` with all attributes
+
+    When the image has a `crop`, only that part of the frame is uploaded,
+    scaled down to `crop_max_side` pixels, and the boxes and landmarks in
+    the response are mapped back to the whole frame. Frames we encode
+    ourselves use JPEG `quality`.
+    """
+
+    name = "rekognition"
+
+    def __init__(self, client=None, region: Optional[str] = None, quality: int = 80,
+                 crop_max_side: int = 320, full_max_side: int = 640):
+        self._client = client
+        self.region = region or os.environ.get("AWS_REGION")
+        self.quality = quality
+        self.crop_max_side = crop_max_side
+        self.full_max_side = full_max_side
+
+    @property
+    def client(self):
+        # Shared and created on first use, so the server starts without AWS credentials
+        if self._client is None:
+            self._client = aws_client('rekognition', self.region)
+        return self._client
+
+    def detect_faces(self, image: FaceImage) -> List[Dict[str, Any]]:
+        crop = image.crop
+        if crop is not None:
+            height, width = image.bgr.shape[:2]
+            # Rekognition rejects images smaller than this
+            if min((crop[2] - crop[0]) * width, (crop[3] - crop[1]) * height) < REKOGNITION_MIN_SIDE:
+                crop = None
+        if crop is None:
+            payload = image.encode(max_side=self.full_max_side, quality=self.quality)
+        else:
+            payload = image.encode(crop, max_side=self.crop_max_side, quality=self.quality)
+        response = self.client.detect_faces(
+            Image={'Bytes': payload},
+            Attributes=['ALL']
+        )
+        faces = response['FaceDetails']
+        if crop is not None:
+            uncrop_faces(faces, crop)
+        return faces
+
+
+def uncrop_faces(faces: List[Dict[str, Any]], crop: Tuple[float, float, float, float]) -> None:
+    """Map boxes and landmarks found in `crop` back to whole-frame ratios, in place"""
+    left, top, right, bottom = crop
+    scale_x, scale_y = right - left, bottom - top
+    for face in faces:
+        box = face['BoundingBox']
+        box['Left'] = left + box['Left'] * scale_x
+        box['Top'] = top + box['Top'] * scale_y
+        box['Width'] *= scale_x
+        box['Height'] *= scale_y
+        for landmark in face.get('Landmarks', []):
+            landmark['X'] = left + landmark['X'] * scale_x
+            landmark['Y'] = top + landmark['Y'] * scale_y
+
+
+class FaceCropTracker:
+    """Picks the part of the next frame worth analysing from the last face found
+
+    Frames are cropped to the last face's box grown by `padding` (a share
+    of its size) on each side. A whole frame is sent when there is no face
+    to follow, after a crop came back without one, and at least every
+    `full_frame_interval` seconds so the box is checked against the frame.
+    """
+
+    def __init__(self, padding: float = 0.5, full_frame_interval: float = 5.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.padding = padding
+        self.full_frame_interval = full_frame_interval
+        self.clock = clock
+        self._box: Optional[Tuple[float, float, float, float]] = None
+        self._full_frame_at = float("-inf")
+        self.crops = 0
+        self.full_frames = 0
+        self.lost = 0
+
+    def next_crop(self, now: Optional[float] = None) -> Optional[Tuple[float, float, float, float]]:
+        """Crop for the next frame as (left, top, right, bottom) ratios, or None for the whole frame"""
+        now = self.clock() if now is None else now
+        if self._box is None or now - self._full_frame_at >= self.full_frame_interval:
+            self._full_frame_at = now
+            self.full_frames += 1
+            return None
+        left, top, width, height = self._box
+        pad_x, pad_y = width * self.padding, height * self.padding
+        self.crops += 1
+        return (max(0.0, left - pad_x), max(0.0, top - pad_y),
+                min(1.0, left + width + pad_x), min(1.0, top + height + pad_y))
+
+    def update(self, faces: List[Dict[str, Any]], crop: Optional[Tuple[float, float, float, float]]) -> None:
+        """Follow the first face of a result for the frame sent with `crop`"""
+        if faces:
+            box = faces[0]['BoundingBox']
+            self._box = (box['Left'], box['Top'], box['Width'], box['Height'])
+        else:
+            if crop is not None and self._box is not None:
+                self.lost += 1
+            self._box = None
+
+    def stats(self) -> Dict[str, int]:
+        return {"crops": self.crops, "full_frames": self.full_frames, "lost": self.lost}
+
+
+# Generic head in mm for YuNet's five landmarks (right eye, left eye, nose
+# tip, right and left mouth corner) in camera axes: x right, y down, z away
+# from the camera, with the nose tip at the origin
+FACE_MODEL_POINTS = np.array([
+    (-31.5, -45.0, 30.0),
+    (31.5, -45.0, 30.0),
+    (0.0, 0.0, 0.0),
+    (-25.0, 25.0, 22.0),
+    (25.0, 25.0, 22.0)
+], dtype=np.float64)
+LANDMARK_TYPES = ('eyeLeft', 'eyeRight', 'nose', 'mouthLeft', 'mouthRight')
+
+# Where the eyes of a face looking at the camera sit in a Haar face box, as
+# a share of its height, and how far the eyes are in front of the neck
+# relative to half the face width
+HAAR_EYE_LINE = 0.38
+HAAR_EYE_DEPTH = 0.7
+
+# EyesOpen confidence by the number of open eyes found; one eye alone is
+# too weak for score_face to call it eye contact
+EYES_OPEN_CONFIDENCE = (90.0, 70.0, 95.0)
+
+
+def head_pose(landmarks: np.ndarray, width: int, height: int) -> Dict[str, float]:
+    """Pitch, roll and yaw in degrees from YuNet's five (x, y) landmarks
+
+    Fits FACE_MODEL_POINTS to the landmarks with solvePnP for a camera
+    whose focal length is the frame's longer side.
+    """
+    focal = float(max(width, height))
+    camera = np.array([[focal, 0, width / 2], [0, focal, height / 2], [0, 0, 1]], dtype=np.float64)
+    ok, rotation, _ = cv2.solvePnP(FACE_MODEL_POINTS, np.asarray(landmarks, dtype=np.float64).reshape(5, 2),
+                                   camera, None, flags=cv2.SOLVEPNP_SQPNP)
+    if not ok:
+        return {'Pitch': 0.0, 'Roll': 0.0, 'Yaw': 0.0}
+    pitch, yaw, roll = cv2.RQDecomp3x3(cv2.Rodrigues(rotation)[0])[0]
+    # Pitch up and yaw towards the image's right are positive
+    return {'Pitch': float(-pitch), 'Roll': float(roll), 'Yaw': float(-yaw)}
+
+
+def eye_pose(box: Tuple[float, float, float, float], eyes: List[Tuple[float, float]]) -> Dict[str, float]:
+    """Rough pitch, roll and yaw in degrees from two eye centres in a face box"""
+    x, y, w, h = box
+    (left_x, left_y), (right_x, right_y) = eyes
+    roll = np.degrees(np.arctan2(right_y - left_y, right_x - left_x))
+    # Turning the head moves the eyes sideways more than the face outline
+    offset = ((left_x + right_x) / 2 - (x + w / 2)) / (w / 2)
+    yaw = np.degrees(np.arcsin(np.clip(offset / HAAR_EYE_DEPTH, -1, 1)))
+    # Tilting the head back moves the eyes up the box
+    line = ((left_y + right_y) / 2 - y) / h
+    pitch = np.degrees(np.arcsin(np.clip((HAAR_EYE_LINE - line) / HAAR_EYE_DEPTH, -1, 1)))
+    return {'Pitch': float(pitch), 'Roll': float(roll), 'Yaw': float(yaw)}
+
+
+class OpenCVFaceAnalyzer(FaceAnalyzer):
+    """On-box face analysis with OpenCV, no network calls
+
+    Faces come from the YuNet detector when `model_path` (or the
+    FACE_YUNET_MODEL env var) names its ONNX file, and from the Haar
+    cascades that ship with opencv-python otherwise. Head pose is fitted
+    to YuNet's landmarks, or estimated from where the eyes sit in the Haar
+    face box. Eyes count as open when the eye cascade, which is trained on
+    open eyes, finds them. Smiles are reported as HAPPY so confidence still
+    moves; the other emotions need Rekognition. An image `crop` limits the
+    face search to that region.
+    """
+
+    name = "opencv"
+    max_rate = 10.0
+
+    def __init__(self, model_path: Optional[str] = None, cascade_dir: Optional[str] = None,
+                 detect_width: int = 320, min_face: float = 0.1):
+        if cv2 is None:
+            raise RuntimeError("The opencv face backend needs opencv-python")
+        self.model_path = model_path or os.environ.get("FACE_YUNET_MODEL")
+        self.cascade_dir = (cascade_dir or os.environ.get("FACE_CASCADE_DIR")
+                            or getattr(getattr(cv2, "data", None), "haarcascades", ""))
+        # Faces are found on a copy scaled down to this width
+        self.detect_width = detect_width
+        # Smallest face to report, as a share of the frame width
+        self.min_face = min_face
+        # Detectors keep state between calls, so each worker thread gets its own
+        self._local = threading.local()
+        self._detectors()
+
+    def _cascade(self, filename: str):
+        path = os.path.join(self.cascade_dir, filename)
+        if not hasattr(cv2, "CascadeClassifier"):
+            raise RuntimeError("This OpenCV build has no CascadeClassifier; install opencv-python 4.x")
+        cascade = cv2.CascadeClassifier(path)
+        if cascade.empty():
+            raise RuntimeError(f"Could not load {path}; point FACE_CASCADE_DIR at OpenCV's haarcascades")
+        return cascade
+
+    def _detectors(self):
+        local = self._local
+        if not hasattr(local, "eyes"):
+            local.yunet = local.face = local.profile = None
+            if self.model_path:
+                local.yunet = cv2.FaceDetectorYN.create(self.model_path, "", (self.detect_width, self.detect_width))
+            else:
+                local.face = self._cascade("haarcascade_frontalface_default.xml")
+                local.profile = self._cascade("haarcascade_profileface.xml")
+            local.eyes = self._cascade("haarcascade_eye.xml")
+            local.smile = self._cascade("haarcascade_smile.xml")
+        return local
+
+    def detect_faces(self, image: FaceImage) -> List[Dict[str, Any]]:
+        detectors = self._detectors()
+        gray = image.gray
+
+        # Only search the tracked crop when there is one, which is much cheaper
+        left = top = 0
+        area = (slice(None), slice(None))
+        if image.crop is not None:
+            height, width = gray.shape[:2]
+            left, top = int(image.crop[0] * width), int(image.crop[1] * height)
+            area = (slice(top, int(image.crop[3] * height)), slice(left, int(image.crop[2] * width)))
+
+        if detectors.yunet is not None:
+            found = self._yunet_faces(detectors, image.bgr[area])
+        else:
+            found = self._haar_faces(detectors, gray[area])
+        if left or top:
+            found = [(box + (left, top, 0, 0), confidence,
+                      None if landmarks is None else landmarks + (left, top), yaw)
+                     for box, confidence, landmarks, yaw in found]
+        # Most certain first, since callers use the first face
+        found.sort(key=lambda face: face[1], reverse=True)
+        return [self._describe(detectors, gray, *face) for face in found]
+
+    def _scaled(self, frame: np.ndarray) -> Tuple[np.ndarray, float]:
+        scale = min(1.0, self.detect_width / frame.shape[1])
+        if scale < 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return frame, scale
+
+    def _yunet_faces(self, detectors, bgr: np.ndarray) -> list:
+        small, scale = self._scaled(bgr)
+        detectors.yunet.setInputSize((small.shape[1], small.shape[0]))
+        _, rows = detectors.yunet.detect(small)
+        faces = []
+        for row in (rows if rows is not None else []):
+            if row[2] >= self.min_face * small.shape[1]:
+                faces.append((row[:4] / scale, 100.0 * float(row[14]), row[4:14].reshape(5, 2) / scale, None))
+        return faces
+
+    def _haar_faces(self, detectors, gray: np.ndarray) -> list:
+        small, scale = self._scaled(gray)
+        small = cv2.equalizeHist(small)
+        size = max(24, int(self.min_face * small.shape[1]))
+        boxes, neighbours = detectors.face.detectMultiScale2(small, scaleFactor=1.15, minNeighbors=5,
+                                                             minSize=(size, size))
+        faces = [(np.array(box, dtype=np.float64) / scale, min(99.0, 50.0 + 5.0 * float(count)), None, None)
+                 for box, count in zip(boxes, neighbours)]
+        if faces:
+            return faces
+
+        # A face turned well away only matches the profile cascade, which is
+        # trained on faces looking to the image's left
+        for flipped, yaw in ((False, -60.0), (True, 60.0)):
+            view = cv2.flip(small, 1) if flipped else small
+            boxes, neighbours = detectors.profile.detectMultiScale2(view, scaleFactor=1.15, minNeighbors=5,
+                                                                    minSize=(size, size))
+            for (x, y, w, h), count in zip(boxes, neighbours):
+                if flipped:
+                    x = small.shape[1] - x - w
+                box = np.array((x, y, w, h), dtype=np.float64) / scale
+                faces.append((box, min(99.0, 40.0 + 5.0 * float(count)), None, yaw))
+        return faces
+
+    def _describe(self, detectors, gray: np.ndarray, box: np.ndarray, confidence: float,
+                  landmarks: Optional[np.ndarray], yaw: Optional[float]) -> Dict[str, Any]:
+        height, width = gray.shape[:2]
+        x, y, w, h = (float(v) for v in box)
+        left, top = max(0, int(x)), max(0, int(y))
+        crop = gray[top:min(height, int(y + h)), left:min(width, int(x + w))]
+
+        # The eye and smile cascades run on the face scaled to 120 px wide
+        scale = 120.0 / max(1, crop.shape[1])
+        crop = cv2.equalizeHist(cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA))
+        band = int(0.15 * crop.shape[0])
+        eyes = detectors.eyes.detectMultiScale(crop[band:int(0.6 * crop.shape[0])], scaleFactor=1.1,
+                                               minNeighbors=5, minSize=(15, 15))
+        eyes = sorted(eyes, key=lambda eye: eye[2] * eye[3], reverse=True)[:2]
+        centres = sorted((left + (ex + ew / 2) / scale, top + (band + ey + eh / 2) / scale)
+                         for ex, ey, ew, eh in eyes)
+        # Two hits on the same eye are one eye
+        if len(centres) == 2 and centres[1][0] - centres[0][0] < 0.2 * w:
+            centres = centres[:1]
+
+        smiles = detectors.smile.detectMultiScale(crop[int(0.55 * crop.shape[0]):], scaleFactor=1.7,
+                                                  minNeighbors=20, minSize=(25, 15))
+        smiling = len(smiles) > 0
+
+        if landmarks is not None:
+            pose = head_pose(landmarks, width, height)
+            points = landmarks
+        elif yaw is not None:
+            pose = {'Pitch': 0.0, 'Roll': 0.0, 'Yaw': yaw}
+            points = []
+        elif len(centres) == 2:
+            pose = eye_pose((x, y, w, h), centres)
+            points = centres
+        else:
+            pose = {'Pitch': 0.0, 'Roll': 0.0, 'Yaw': 0.0}
+            points = []
+
+        return {
+            'BoundingBox': {'Width': w / width, 'Height': h / height, 'Left': x / width, 'Top': y / height},
+            'Confidence': confidence,
+            'Landmarks': [{'Type': kind, 'X': float(px) / width, 'Y': float(py) / height}
+                          for kind, (px, py) in zip(LANDMARK_TYPES, points)],
+            'Pose': pose,
+            'EyesOpen': {'Value': len(centres) > 0, 'Confidence': EYES_OPEN_CONFIDENCE[len(centres)]},
+            'Smile': {'Value': smiling, 'Confidence': 80.0},
+            'Emotions': [{'Type': 'HAPPY' if smiling else 'CALM', 'Confidence': 80.0}]
+        }
+
+
+def perceptual_hash(gray: np.ndarray) -> int:
+    """64-bit DCT hash: which low frequencies of a 32x32 thumbnail are above their median"""
+    thumb = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(thumb)[:8, :8].flatten()
+    return int.from_bytes(np.packbits(low > np.median(low[1:])).tobytes(), "big")
+
+
+class CachedFaceAnalyzer(FaceAnalyzer):
+    """Reuses a recent result when the face looks the same as it did then
+
+    Each result is stored with a perceptual hash of the region around the
+    face it found (the whole frame if none). A new frame is hashed over the
+    regions of the cached results and reuses the newest one within
+    `max_distance` bits. Results expire `ttl` seconds after they were
+    stored, and at most `max_entries` are kept, least recently used going
+    first. `lookup` and `store` are the two halves of `detect_faces`, for
+    callers that must do something between a miss and the backend call.
+
+    A cache only ever sees one camera: the server gives each video session
+    its own around the shared analyzer, so sessions neither reuse nor
+    evict each other's results.
+    """
+
+    def __init__(self, analyzer: FaceAnalyzer, max_entries: int = 8, ttl: float = 10.0,
+                 max_distance: int = 4, margin: float = 0.25, clock: Callable[[], float] = time.monotonic):
+        self.analyzer = analyzer
+        self.name = analyzer.name
+        self.max_rate = analyzer.max_rate
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        # Share of the face box added on each side, so small head movements stay in the region
+        self.margin = margin
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        # id -> (region, hash, created, faces), least recently used first
+        self._entries: "OrderedDict[int, Tuple[Tuple[float, ...], int, float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _region(self, faces: List[Dict[str, Any]]) -> Tuple[float, ...]:
+        """Face box grown by `margin` as (left, top, right, bottom) frame ratios"""
+        if not faces:
+            return (0.0, 0.0, 1.0, 1.0)
+        box = faces[0]['BoundingBox']
+        grow_x, grow_y = box['Width'] * self.margin, box['Height'] * self.margin
+        # Rounded so nearby boxes share a region and its hash
+        return (round(max(0.0, box['Left'] - grow_x), 2), round(max(0.0, box['Top'] - grow_y), 2),
+                round(min(1.0, box['Left'] + box['Width'] + grow_x), 2),
+                round(min(1.0, box['Top'] + box['Height'] + grow_y), 2))
+
+    @staticmethod
+    def _hash(gray: np.ndarray, region: Tuple[float, ...]) -> int:
+        height, width = gray.shape[:2]
+        left, top, right, bottom = region
+        crop = gray[int(top * height):max(int(top * height) + 1, int(bottom * height)),
+                    int(left * width):max(int(left * width) + 1, int(right * width))]
+        return perceptual_hash(crop)
+
+    @staticmethod
+    def _gray(image: FaceImage) -> np.ndarray:
+        gray = image.preview()
+        return cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY) if gray.ndim == 3 else gray
+
+    def lookup(self, image: FaceImage) -> Optional[List[Dict[str, Any]]]:
+        """Faces cached for a frame that looks like `image`, or None"""
+        gray = self._gray(image)
+        now = self.clock()
+        hashes: Dict[Tuple[float, ...], int] = {}
+
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if now - entry[2] > self.ttl]:
+                del self._entries[key]
+            # Newest first; hashed outside the lock so threads sharing the cache don't queue
+            entries = sorted(self._entries.items(), key=lambda item: item[1][2], reverse=True)
+
+        for key, (region, digest, _, faces) in entries:
+            if region not in hashes:
+                hashes[region] = self._hash(gray, region)
+            if (hashes[region] ^ digest).bit_count() <= self.max_distance:
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                    self.hits += 1
+                return faces
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, image: FaceImage, faces: List[Dict[str, Any]]) -> None:
+        """Remember the backend's `faces` for `image`"""
+        region = self._region(faces)
+        digest = self._hash(self._gray(image), region)
+        with self._lock:
+            self._entries[self._next_id] = (region, digest, self.clock(), faces)
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def detect_faces(self, image: FaceImage) -> List[Dict[str, Any]]:
+        faces = self.lookup(image)
+        if faces is None:
+            faces = self.analyzer.detect_faces(image)
+            self.store(image, faces)
+        return faces
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.analyzer.stats(),
+            "cache_entries": len(self._entries),
+            "cache_hits": self.hits,
+            "cache_misses": self.misses
+        }
+
+
+def create_face_cache(analyzer: FaceAnalyzer) -> Optional[CachedFaceAnalyzer]:
+    """Result cache for one camera's frames, None when FACE_CACHE_TTL is 0"""
+    ttl = float(os.environ.get("FACE_CACHE_TTL", 10.0))
+    if ttl <= 0:
+        return None
+    return CachedFaceAnalyzer(analyzer, max_entries=int(os.environ.get("FACE_CACHE_SIZE", 8)), ttl=ttl,
+                              max_distance=int(os.environ.get("FACE_CACHE_DISTANCE", 4)))
+
+
+def create_face_analyzer(name: Optional[str] = None, cache: bool = True) -> FaceAnalyzer:
+    """Build the face analyzer named by `name` or the FACE_BACKEND env var
+
+    Results are cached (see `create_face_cache`) unless `cache` is False;
+    servers analysing several cameras pass False and cache per camera.
+    """
+    name = name or os.environ.get("FACE_BACKEND", "rekognition")
+    if name == "rekognition":
+        analyzer = RekognitionFaceAnalyzer()
+    elif name == "opencv":
+        analyzer = OpenCVFaceAnalyzer()
+    else:
+        raise ValueError(f"Unknown face backend: {name}")
+
+    return (create_face_cache(analyzer) if cache else None) or analyzer
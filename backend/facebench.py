@@ -0,0 +1,136 @@
+"""Side-by-side benchmark of the face analysis backends.
+
+Runs the same frames through each backend in turn and reports per-frame
+latency, the rate one worker sustains, how often a face was found and eye
+contact was scored, and how closely each backend agrees with the first one
+on eye contact and head pose:
+
+    python facebench.py --camera 0 --frames 100
+    python facebench.py --backends opencv --images photos/*.jpg
+
+Frames are captured up front, so camera and disk time are not counted.
+"""
+import argparse
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from faceanalysis import FaceImage, create_face_analyzer, score_face
+
+
+@dataclass
+class BackendStats:
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    # Per frame: eye contact (0/100) and pose of the first face, None if no face or an error
+    eye_contact: List[Optional[int]] = field(default_factory=list)
+    poses: List[Optional[Dict[str, float]]] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+
+def load_frames(args) -> List[np.ndarray]:
+    if args.images:
+        frames = [cv2.imread(path) for path in args.images]
+        missing = [path for path, frame in zip(args.images, frames) if frame is None]
+        if missing:
+            raise SystemExit(f"Could not read: {', '.join(missing)}")
+        return frames
+
+    cap = cv2.VideoCapture(args.video if args.video else args.camera)
+    frames = []
+    while len(frames) < args.frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise SystemExit("No frames captured")
+    return frames
+
+
+def run_backend(name: str, frames: List[np.ndarray], warmup: int) -> BackendStats:
+    # Uncached, so every frame measures the backend itself
+    analyzer = create_face_analyzer(name, cache=False)
+    stats = BackendStats(analyzer.name)
+
+    # First calls pay for model loading and connection setup
+    for frame in frames[:warmup]:
+        try:
+            analyzer.detect_faces(FaceImage(bgr=frame))
+        except Exception:
+            # Counted in the timed run below
+            pass
+
+    for frame in frames:
+        started = time.perf_counter()
+        try:
+            faces = analyzer.detect_faces(FaceImage(bgr=frame))
+        except Exception as e:
+            stats.errors.append(str(e))
+            stats.eye_contact.append(None)
+            stats.poses.append(None)
+            continue
+        stats.latencies.append(time.perf_counter() - started)
+
+        if faces:
+            eye_contact, _ = score_face(faces[0], 50)
+            stats.eye_contact.append(eye_contact)
+            stats.poses.append(faces[0]['Pose'])
+        else:
+            stats.eye_contact.append(None)
+            stats.poses.append(None)
+    return stats
+
+
+def report(results: List[BackendStats], frames: int):
+    print(f"\n=== Face Analysis Benchmark ({frames} frames) ===")
+    reference = results[0]
+    for stats in results:
+        latencies = np.array(stats.latencies) * 1000
+        found = [contact for contact in stats.eye_contact if contact is not None]
+        print(f"\n{stats.name}")
+        if len(latencies):
+            print(f"  Latency (ms): p50={np.percentile(latencies, 50):.1f} p95={np.percentile(latencies, 95):.1f} "
+                  f"max={latencies.max():.1f}")
+            print(f"  Rate: {1000 / latencies.mean():.1f} frames/s on one worker")
+        print(f"  Faces found: {len(found)}/{frames}")
+        print(f"  Eye contact: {np.mean(found) if found else 0:.0f}% of frames with a face")
+        print(f"  Errors: {len(stats.errors)}")
+        for error in sorted(set(stats.errors))[:3]:
+            print(f"  - {error}")
+
+        if stats is reference:
+            continue
+        both = [(a, b) for a, b in zip(reference.eye_contact, stats.eye_contact) if a is not None and b is not None]
+        if both:
+            agree = sum(a == b for a, b in both) / len(both)
+            print(f"  Eye contact agrees with {reference.name}: {100 * agree:.0f}% of {len(both)} frames")
+        poses = [(a, b) for a, b in zip(reference.poses, stats.poses) if a is not None and b is not None]
+        if poses:
+            errors = {axis: np.mean([abs(a[axis] - b[axis]) for a, b in poses]) for axis in ('Pitch', 'Roll', 'Yaw')}
+            print("  Mean pose difference (deg): " + " ".join(f"{axis}={value:.1f}" for axis, value in errors.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["rekognition", "opencv"],
+                        help="face backends to compare; the first is the reference")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--images", nargs="+", help="image files to analyse")
+    source.add_argument("--video", help="video file to analyse")
+    source.add_argument("--camera", type=int, default=0, help="camera index (default)")
+    parser.add_argument("--frames", type=int, default=100, help="frames to take from a camera or video")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed calls per backend before measuring")
+    args = parser.parse_args()
+
+    frames = load_frames(args)
+    results = [run_backend(name, frames, args.warmup) for name in args.backends]
+    report(results, len(frames))
+
+
+if __name__ == "__main__":
+    main()
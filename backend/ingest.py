@@ -0,0 +1,193 @@
+"""Bounded audio queue between the WebSocket receive loop and Transcribe.
+
+The receive loop puts chunks and a separate task forwards them, so a slow
+transcription stream shows up as queued audio (lag, in seconds) instead of
+silently filling socket buffers. What happens when the queue is full is set
+by the overflow policy:
+
+  block        wait for room, pushing back on the client's socket
+  coalesce     merge the chunk into the newest queued one (fewer, larger sends)
+  drop_oldest  discard the oldest queued audio to stay near real time
+
+With coalesce and drop_oldest, `max_lag` additionally caps the queued audio
+by dropping the oldest chunks.
+
+Chunks can carry the client's capture timestamp; `AudioTimeline` uses it to
+map transcript times (seconds of audio forwarded) back to when that audio
+was captured, so latency can be measured from the speech itself.
+"""
+import asyncio
+from bisect import bisect_left
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple, Union
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_COALESCE = "coalesce"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_COALESCE, OVERFLOW_DROP_OLDEST)
+
+Chunk = Union[bytes, bytearray, memoryview]
+
+
+class AudioIngestQueue:
+    """Per-session queue of PCM chunks with lag accounting"""
+
+    def __init__(self, max_chunks: int = 50, policy: str = OVERFLOW_BLOCK,
+                 max_lag: Optional[float] = None, bytes_per_second: int = 16000 * 2):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        if max_chunks < 1:
+            raise ValueError("max_chunks must be at least 1")
+
+        self.max_chunks = max_chunks
+        self.policy = policy
+        self.max_lag = max_lag
+        self.bytes_per_second = bytes_per_second
+
+        self._chunks: Deque[Chunk] = deque()
+        # Client timestamp of the end of each queued chunk
+        self._timestamps: Deque[Optional[float]] = deque()
+        self._bytes = 0
+        self._closed = False
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+        self.received_bytes = 0
+        self.dropped_bytes = 0
+        self.coalesced = 0
+        # Timestamp of the chunk get() returned last
+        self.last_timestamp: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    @property
+    def lag(self) -> float:
+        """Seconds of audio waiting to be forwarded"""
+        return self._bytes / self.bytes_per_second
+
+    @property
+    def dropped_seconds(self) -> float:
+        return self.dropped_bytes / self.bytes_per_second
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    async def put(self, chunk: Chunk, timestamp: Optional[float] = None) -> None:
+        """Queue `chunk`, captured by the client up to `timestamp`"""
+        if self._closed:
+            raise RuntimeError("Audio ingest queue is closed")
+
+        if len(self._chunks) >= self.max_chunks:
+            if self.policy == OVERFLOW_BLOCK:
+                while len(self._chunks) >= self.max_chunks and not self._closed:
+                    self._not_full.clear()
+                    await self._not_full.wait()
+                if self._closed:
+                    raise RuntimeError("Audio ingest queue is closed")
+                self._append(chunk, timestamp)
+            elif self.policy == OVERFLOW_COALESCE:
+                tail = self._chunks[-1]
+                if not isinstance(tail, bytearray):
+                    tail = bytearray(tail)
+                    self._chunks[-1] = tail
+                tail += chunk
+                self._timestamps[-1] = timestamp
+                self._bytes += len(chunk)
+                self.coalesced += 1
+            else:
+                self._drop_oldest()
+                self._append(chunk, timestamp)
+        else:
+            self._append(chunk, timestamp)
+
+        self.received_bytes += len(chunk)
+        if self.max_lag is not None and self.policy != OVERFLOW_BLOCK:
+            while len(self._chunks) > 1 and self.lag > self.max_lag:
+                self._drop_oldest()
+
+    def _append(self, chunk: Chunk, timestamp: Optional[float]) -> None:
+        self._chunks.append(chunk)
+        self._timestamps.append(timestamp)
+        self._bytes += len(chunk)
+        self._not_empty.set()
+
+    def _drop_oldest(self) -> None:
+        dropped = self._chunks.popleft()
+        self._timestamps.popleft()
+        self._bytes -= len(dropped)
+        self.dropped_bytes += len(dropped)
+
+    async def get(self) -> Optional[Chunk]:
+        """Next chunk, or None once the queue is closed and drained"""
+        while not self._chunks:
+            if self._closed:
+                return None
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+        chunk = self._chunks.popleft()
+        self.last_timestamp = self._timestamps.popleft()
+        self._bytes -= len(chunk)
+        self._not_full.set()
+        return chunk
+
+    def close(self) -> None:
+        """Stop accepting audio; get() drains what is left and then returns None"""
+        self._closed = True
+        self._not_empty.set()
+        self._not_full.set()
+
+    async def forward(self, send: Callable[[Chunk], Awaitable[None]]) -> None:
+        """Pass queued chunks to `send` until the queue is closed and empty"""
+        try:
+            while True:
+                chunk = await self.get()
+                if chunk is None:
+                    return
+                await send(chunk)
+        finally:
+            # A failed send must not leave the receive loop blocked on put()
+            self.close()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "lag_seconds": round(self.lag, 3),
+            "queued_chunks": len(self._chunks),
+            "dropped_seconds": round(self.dropped_seconds, 3),
+            "coalesced": self.coalesced
+        }
+
+
+class AudioTimeline:
+    """Client capture time of the audio forwarded to a transcription stream
+
+    Transcript results are timed in seconds of audio the stream has been
+    sent. `record` notes where each forwarded chunk ends on that clock and
+    on the client's, so `client_time` can tell when the audio at the end of
+    a result was captured. Only the last `max_seconds` are kept.
+    """
+
+    def __init__(self, bytes_per_second: int = 16000 * 2, max_seconds: float = 120.0):
+        self.bytes_per_second = bytes_per_second
+        self.max_seconds = max_seconds
+        self.seconds = 0.0
+        # (stream seconds at the end of a chunk, client timestamp of its end)
+        self._entries: Deque[Tuple[float, float]] = deque()
+
+    def record(self, num_bytes: int, timestamp: Optional[float]) -> None:
+        self.seconds += num_bytes / self.bytes_per_second
+        if timestamp is None:
+            return
+        self._entries.append((self.seconds, timestamp))
+        while len(self._entries) > 1 and self._entries[0][0] < self.seconds - self.max_seconds:
+            self._entries.popleft()
+
+    def client_time(self, seconds: float) -> Optional[float]:
+        """Client timestamp of the chunk holding stream time `seconds`"""
+        if not self._entries:
+            return None
+        index = bisect_left(self._entries, seconds, key=lambda entry: entry[0])
+        return self._entries[min(index, len(self._entries) - 1)][1]
@@ -4,10 +4,7 @@ import numpy as np
 import asyncio
 import time
 import cv2
-import boto3
 import threading
-from collections import deque
-from amazon_transcribe.client import TranscribeStreamingClient
 from amazon_transcribe.handlers import TranscriptResultStreamHandler
 from amazon_transcribe.model import TranscriptEvent
 import tkinter as tk
@@ -17,6 +14,11 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.pyplot as plt
 import warnings
 from dotenv import load_dotenv
+from faceanalysis import create_face_analyzer, score_face
+from sampler import FrameSampler
+from speech import TranscriptAccumulator, WordRateCounter, compile_fillers
+from transcription import create_transcription_backend
+from video import FaceAnalysisWorker
 from datetime import datetime
 
 # Load environment variables
@@ -25,25 +27,21 @@ load_dotenv()
 # Suppress matplotlib warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="matplotlib")
 
-# Initialize AWS clients
-rekognition = boto3.client(
-    'rekognition',
-    aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-    aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
-    region_name=os.environ['AWS_REGION']
-)
+# Face analysis: Rekognition, or FACE_BACKEND=opencv to run it on this machine
+face_analyzer = create_face_analyzer()
+# Frames analysed at once; more hides network latency, each costs a request
+face_analysis_in_flight = int(os.environ.get("FACE_ANALYSIS_IN_FLIGHT", 2))
 
 
 class InterviewMetrics:
     def __init__(self, window_seconds=60):
-        self.filler_words = {
-            'um': 0, 'uh': 0, 'er': 0, 'ah': 0, 'like': 0,
-            'you know': 0, 'sort of': 0, 'kind of': 0
-        }
+        self.fillers = compile_fillers()
+        self.filler_words = dict.fromkeys(self.fillers.phrases, 0)
+        self.transcripts = TranscriptAccumulator(self.fillers)
         self.total_words = 0
         self.window_seconds = window_seconds
-        self.word_timestamps = deque()
         self.start_time = time.time()
+        self.word_rate = WordRateCounter(windows=(window_seconds,))
 
         # Visual metrics
         self.confidence = 50
@@ -56,80 +54,27 @@ class InterviewMetrics:
         self.confidence_values = []
         self.eye_contact_values = []
 
-    def add_words(self, text: str):
-        current_time = time.time()
-        words = text.lower().split()
+    def update_result(self, result_id, text, is_partial):
+        words, fillers = self.transcripts.update(result_id, text, is_partial)
 
-        self.total_words += len(words)
-
-        for _ in words:
-            self.word_timestamps.append(current_time)
-
-        while (self.word_timestamps and
-               current_time - self.word_timestamps[0] > self.window_seconds):
-            self.word_timestamps.popleft()
-
-        for filler in self.filler_words:
-            self.filler_words[filler] += text.lower().count(filler)
+        self.total_words += words
+        self.word_rate.add(words)
+        for filler, count in fillers.items():
+            self.filler_words[filler] += count
 
     def get_speech_rate(self):
-        if not self.word_timestamps:
-            return 0
-
-        current_time = time.time()
-        window_words = len([t for t in self.word_timestamps
-                            if current_time - t <= self.window_seconds])
-
-        minutes = min(self.window_seconds / 60,
-                      (current_time - self.start_time) / 60)
-        return ((window_words / minutes) / 10) if minutes > 0 else 0
+        return self.word_rate.rate(self.window_seconds) / 10
 
     def get_filler_percentage(self):
         total_fillers = sum(self.filler_words.values())
         return (total_fillers / self.total_words) * 100 if self.total_words > 0 else 0
 
-    def analyze_frame_with_rekognition(self, frame):
-        _, buffer = cv2.imencode('.jpg', frame)
-        image_bytes = buffer.tobytes()
-
-        try:
-            response = rekognition.detect_faces(
-                Image={'Bytes': image_bytes},
-                Attributes=['ALL']
-            )
-
-            eye_contact = 0
-
-            if response['FaceDetails']:
-                face = response['FaceDetails'][0]
-
-                eyes_open = (face['EyesOpen']['Value'] and
-                             face['EyesOpen']['Confidence'] > 80)
-                pitch = abs(face['Pose']['Pitch'])
-                roll = abs(face['Pose']['Roll'])
-                yaw = abs(face['Pose']['Yaw'])
-
-                if eyes_open and pitch < 15 and roll < 15 and yaw < 15:
-                    eye_contact = 100
-
-                emotions = face['Emotions']
-                positive_emotions = ['HAPPY', 'SURPRISED']
-                negative_emotions = ['SAD', 'DISGUSTED', 'ANGRY', 'CONFUSED']
-
-                positive_score = sum(emotion['Confidence'] for emotion in emotions
-                                     if emotion['Type'] in positive_emotions)
-                negative_score = sum(emotion['Confidence'] for emotion in emotions
-                                     if emotion['Type'] in negative_emotions)
-
-                if positive_score > negative_score:
-                    self.confidence = min(self.confidence + 2, 100)
-                elif negative_score > positive_score:
-                    self.confidence = max(self.confidence - 1, 0)
-
-            self.eye_contact = eye_contact
-
-        except Exception as e:
-            print(f"Error in Rekognition analysis: {e}")
+    def update_faces(self, faces):
+        # Called by the face analysis worker with each new result
+        eye_contact, confidence = 0, self.confidence
+        if faces:
+            eye_contact, confidence = score_face(faces[0], confidence)
+        self.eye_contact, self.confidence = eye_contact, confidence
 
 
 class MyEventHandler(TranscriptResultStreamHandler):
@@ -142,11 +87,12 @@ class MyEventHandler(TranscriptResultStreamHandler):
         results = transcript_event.transcript.results
 
         for result in results:
-            for alt in result.alternatives:
+            # Only the best alternative is counted
+            for alt in result.alternatives[:1]:
                 words = alt.transcript.strip().split()
                 current_words = set(words)
 
-                self.metrics.add_words(alt.transcript)
+                self.metrics.update_result(result.result_id, alt.transcript, result.is_partial)
 
                 new_words = current_words - self.last_printed_words
                 for word in words:
@@ -219,6 +165,13 @@ class InterviewFeedbackApp:
 
         # Start the camera
         self.cap = cv2.VideoCapture(0)
+        # Only frames where the scene changed are analysed, at the backend's rate
+        self.frame_sampler = FrameSampler(max_rate=face_analyzer.max_rate)
+        # Analysis runs on background threads so the feed never waits for it
+        self.face_worker = FaceAnalysisWorker(
+            face_analyzer, self.metrics.update_faces, in_flight=face_analysis_in_flight,
+            on_error=lambda e: print(f"Error in {face_analyzer.name} analysis: {e}")
+        )
 
         # Set video resolution for the embedded feed
         self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 480)
@@ -234,8 +187,9 @@ class InterviewFeedbackApp:
     def update_video_feed(self):
         ret, frame = self.cap.read()
         if ret:
-            # Analyze frame with Rekognition
-            self.metrics.analyze_frame_with_rekognition(frame)
+            # Analyze the face when the scene changed
+            if self.frame_sampler.should_sample(frame):
+                self.face_worker.submit(frame)
 
             # Convert frame to RGB and then to PhotoImage
             frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
@@ -300,6 +254,7 @@ class InterviewFeedbackApp:
         self.root.after(500, self.update_graphs)
 
     def cleanup(self):
+        self.face_worker.close(timeout=1.0)
         self.cap.release()
         self.root.quit()
 
@@ -322,10 +277,9 @@ class InterviewFeedbackApp:
             await stream.input_stream.end_stream()
 
     async def start_transcription(self):
-        client = TranscribeStreamingClient(region="us-west-2")
-        stream = await client.start_stream_transcription(
+        stream = await create_transcription_backend().start_stream(
             language_code="en-US",
-            media_sample_rate_hz=16000,
+            sample_rate=16000,
             media_encoding="pcm"
         )
         handler = MyEventHandler(stream.output_stream, metrics=self.metrics)
@@ -0,0 +1,267 @@
+"""Headless load generator for the analysis API.
+
+Creates N audio sessions, streams synthetic (or recorded) PCM to each one
+over /ws/{session_id} at real-time or accelerated pace, and reports
+end-to-end suggestion latency, message rates, server CPU/RSS and late or
+dropped chunks. Latency runs from the client's capture time of the audio a
+suggestion refers to (the end of the transcript result that triggered it,
+or the chunk for acoustic suggestions) until the suggestion arrives, so it
+includes ingest, transcription and batching delays.
+
+Run the server against the local replay transcriber so the numbers measure
+this service rather than Amazon Transcribe:
+
+    TRANSCRIPTION_BACKEND=replay uvicorn main:app
+    python loadtest.py --sessions 200 --duration 60
+"""
+import argparse
+import asyncio
+import base64
+import json
+import time
+import wave
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+import requests
+import websockets
+
+from encoding import WIRE_JSON, available_wire_formats
+from ingest import OVERFLOW_POLICIES
+from protocol import AUDIO_FORMAT_BINARY, AUDIO_FORMATS, pack_audio_frame
+
+SAMPLE_RATE = 16000
+
+
+@dataclass
+class SessionStats:
+    chunks_sent: int = 0
+    chunks_late: int = 0
+    chunks_dropped: int = 0
+    messages_received: int = 0
+    latencies: List[float] = field(default_factory=list)
+    max_ingest_lag: float = 0.0
+    error: Optional[str] = None
+
+
+def synthetic_speech(seconds: float, sample_rate: int = SAMPLE_RATE, seed: int = 0) -> np.ndarray:
+    """Voiced-sounding int16 PCM: a harmonic tone gated at a syllable rate"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    f0 = 120 + 20 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) * (np.sin(2 * np.pi * 0.1 * t) > -0.6)
+    signal = 0.3 * voice * envelope + 0.01 * rng.standard_normal(len(t))
+    return (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+
+
+def load_wav(path: str):
+    """Interleaved 16-bit PCM, sample rate and channel count from a WAV file"""
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"{path} must be 16-bit PCM")
+        audio = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+        return audio, wav.getframerate(), wav.getnchannels()
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def server_stats(server_url: str) -> Optional[dict]:
+    try:
+        response = requests.get(f"{server_url}/stats", timeout=5)
+        response.raise_for_status()
+        return response.json()
+    except requests.RequestException:
+        return None
+
+
+class LoadSession:
+    def __init__(self, args, audio: np.ndarray, index: int):
+        self.args = args
+        self.audio = audio
+        self.index = index
+        self.stats = SessionStats()
+
+    async def run(self):
+        try:
+            response = await asyncio.to_thread(
+                requests.post,
+                f"{self.args.server}/sessions/",
+                params={"url": f"loadtest-{self.index}", "media_type": "audio"},
+                timeout=30
+            )
+            response.raise_for_status()
+            session_id = response.json()["session_id"]
+
+            uri = (f"{self.args.websocket}/ws/{session_id}"
+                   f"?audio_format={self.args.format}&wire={self.args.wire}")
+            if self.args.overflow:
+                uri += f"&overflow={self.args.overflow}"
+            async with websockets.connect(uri, max_queue=None) as websocket:
+                receiver = asyncio.create_task(self.receive(websocket))
+                try:
+                    await self.send(websocket)
+                    # Give in-flight suggestions a moment to arrive
+                    await asyncio.sleep(self.args.drain)
+                finally:
+                    receiver.cancel()
+
+            await asyncio.to_thread(requests.delete, f"{self.args.server}/sessions/{session_id}", timeout=30)
+        except Exception as e:
+            self.stats.error = f"{type(e).__name__}: {e}"
+
+    async def send(self, websocket):
+        rate, channels = self.args.rate, self.args.channels
+        # chunk_size counts frames; the audio is interleaved
+        chunk_size = self.args.chunk_size * channels
+        chunk_seconds = self.args.chunk_size / rate
+        interval = chunk_seconds / self.args.speed
+        total_chunks = int(self.args.duration / chunk_seconds)
+        # Stagger sessions so they don't all send on the same tick
+        offset = (self.index * chunk_size) % len(self.audio)
+        start = time.perf_counter() + (self.index % 100) * interval / 100
+
+        for sequence in range(total_chunks):
+            due = start + sequence * interval
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif -delay > self.args.late_threshold:
+                self.stats.chunks_late += 1
+
+            begin = (offset + sequence * chunk_size) % (len(self.audio) - chunk_size)
+            pcm = self.audio[begin:begin + chunk_size].tobytes()
+            # Like a live client, send each chunk once it has been captured
+            now = time.time()
+            if self.args.format == AUDIO_FORMAT_BINARY:
+                payload = pack_audio_frame(sequence, now - chunk_seconds, now, rate, pcm, channels)
+            else:
+                payload = json.dumps({
+                    "start_time": now - chunk_seconds,
+                    "end_time": now,
+                    "audio_data": base64.b64encode(pcm).decode("utf-8"),
+                    "sample_rate": rate,
+                    "channels": channels
+                })
+
+            try:
+                await websocket.send(payload)
+                self.stats.chunks_sent += 1
+            except websockets.ConnectionClosed:
+                self.stats.chunks_dropped += total_chunks - sequence
+                return
+
+    async def receive(self, websocket):
+        async for message in websocket:
+            received = time.time()
+            self.stats.messages_received += 1
+            try:
+                if isinstance(message, bytes):
+                    import msgpack
+                    payload = msgpack.unpackb(message)
+                else:
+                    payload = json.loads(message)
+            except ValueError:
+                continue
+            if isinstance(payload, dict) and payload.get("type") == "ingest":
+                lag = payload["delta"].get("lag_seconds", 0.0)
+                self.stats.max_ingest_lag = max(self.stats.max_ingest_lag, lag)
+                continue
+            for item in payload if isinstance(payload, list) else [payload]:
+                # The server stamps each suggestion with the capture time of its audio
+                if isinstance(item, dict) and "reference_timestamp" in item:
+                    self.stats.latencies.append(received - item["reference_timestamp"])
+
+
+async def run_load(args) -> List[SessionStats]:
+    if args.audio:
+        audio, args.rate, args.channels = load_wav(args.audio)
+    else:
+        audio = synthetic_speech(max(10.0, args.chunk_size / args.rate * 4), args.rate)
+        audio = np.repeat(audio, args.channels)
+
+    sessions = []
+    tasks = []
+    for i in range(args.sessions):
+        session = LoadSession(args, audio, i)
+        sessions.append(session)
+        tasks.append(asyncio.create_task(session.run()))
+        if args.ramp > 0:
+            await asyncio.sleep(args.ramp / args.sessions)
+
+    await asyncio.gather(*tasks)
+    return [s.stats for s in sessions]
+
+
+def report(stats: List[SessionStats], elapsed: float, before: Optional[dict], after: Optional[dict]):
+    latencies = [l * 1000 for s in stats for l in s.latencies]
+    sent = sum(s.chunks_sent for s in stats)
+    received = sum(s.messages_received for s in stats)
+    errors = [s.error for s in stats if s.error]
+
+    print("\n=== Load Test Results ===")
+    print(f"Sessions: {len(stats)} ({len(errors)} failed)")
+    print(f"Elapsed: {elapsed:.1f}s")
+    print(f"Chunks sent: {sent} ({sent / elapsed:.1f}/s)")
+    print(f"Chunks late: {sum(s.chunks_late for s in stats)}")
+    print(f"Chunks dropped: {sum(s.chunks_dropped for s in stats)}")
+    print(f"Messages received: {received} ({received / elapsed:.1f}/s)")
+    print(f"Suggestion latency (ms): p50={percentile(latencies, 50):.1f} "
+          f"p95={percentile(latencies, 95):.1f} p99={percentile(latencies, 99):.1f} "
+          f"(n={len(latencies)})")
+    print(f"Max ingest lag: {max((s.max_ingest_lag for s in stats), default=0.0):.2f}s")
+
+    if before and after:
+        wall = after["timestamp"] - before["timestamp"]
+        cpu = after["cpu_seconds"] - before["cpu_seconds"]
+        print(f"Server CPU: {cpu:.1f}s ({100 * cpu / wall:.0f}% of one core)")
+        if after.get("rss_bytes"):
+            print(f"Server RSS: {before['rss_bytes'] / 2**20:.1f} MiB -> {after['rss_bytes'] / 2**20:.1f} MiB")
+    else:
+        print("Server stats unavailable")
+
+    for error in sorted(set(errors))[:5]:
+        print(f"- {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", default="http://localhost:8000")
+    parser.add_argument("--websocket", default="ws://localhost:8000")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent sessions")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of audio per session")
+    parser.add_argument("--speed", type=float, default=1.0, help="pace multiplier, 1.0 is real time")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="frames per chunk")
+    parser.add_argument("--rate", type=int, default=SAMPLE_RATE, help="declared sample rate of synthetic audio")
+    parser.add_argument("--channels", type=int, default=1, help="channels of synthetic audio")
+    parser.add_argument("--format", choices=AUDIO_FORMATS, default=AUDIO_FORMAT_BINARY)
+    parser.add_argument("--wire", choices=available_wire_formats(), default=WIRE_JSON,
+                        help="server -> client message encoding")
+    parser.add_argument("--overflow", choices=OVERFLOW_POLICIES,
+                        help="server ingest overflow policy (server default if unset)")
+    parser.add_argument("--audio", help="16-bit WAV to stream instead of synthetic audio")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which to open sessions")
+    parser.add_argument("--late-threshold", type=float, default=0.05,
+                        help="seconds behind schedule before a chunk counts as late")
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for trailing messages")
+    args = parser.parse_args()
+
+    before = server_stats(args.server)
+    started = time.perf_counter()
+    stats = asyncio.run(run_load(args))
+    elapsed = time.perf_counter() - started
+    after = server_stats(args.server)
+
+    report(stats, elapsed, before, after)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,55 @@
-from fastapi import FastAPI, HTTPException, WebSocket, Depends, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect, Depends, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Deque
+from typing import Awaitable, Callable, List, Optional, Dict, Tuple
 from datetime import datetime
 import asyncio
+import functools
+import os
+import time
 import uuid
-from collections import deque
 import numpy as np
-from amazon_transcribe.client import TranscribeStreamingClient
 from amazon_transcribe.handlers import TranscriptResultStreamHandler
 from amazon_transcribe.model import TranscriptEvent
 from dotenv import load_dotenv
 import json
 import base64
+from acoustics import AcousticAnalyzer
+from awsclients import shared_clients
+from encoding import MessageEncoder, available_wire_formats, compile_serializer, dumps_json, encode_datetime
+from faceanalysis import CachedFaceAnalyzer, FaceCropTracker, FaceImage, create_face_analyzer, create_face_cache
+from ingest import OVERFLOW_POLICIES, AudioIngestQueue, AudioTimeline
+from protocol import AUDIO_FORMATS, AUDIO_FORMAT_BINARY, VIDEO_ENCODING_JPEG, unpack_audio_frame, unpack_video_frame
+from registry import WORKER_ID, AsyncRegistry, UnknownSessionError, create_session_registry
+from resample import AudioConverter
+from rollover import SupervisedStream
+from sessions import SessionLimitError, SessionStore
+from speech import TranscriptAccumulator, WordRateCounter, compile_fillers
+from suggestions import ACOUSTIC_RULES, VIDEO_RULES, MetricsDeltaTracker, SuggestionGate
+from transcription import WarmStreamPool, create_transcription_backend
+from sampler import FrameSampler
+from vad import VoiceActivityGate
+from video import FrameAnalysisPool, LatestFrameSlot, VisualTracker
+from throttle import CircuitBreaker, CircuitOpenError, FairShareLimiter
 
 
 load_dotenv()
 
+# Chosen per deployment with TRANSCRIPTION_BACKEND (aws or replay).
+# TRANSCRIPTION_WARM_STREAMS streams can be kept open ahead of time so a new
+# session transcribes at once, for TRANSCRIPTION_WARM_ACTIVE_SECONDS after the
+# last session started. With aws every warm stream is billed and replaced
+# every few seconds (see WarmStreamPool), so warming is opt-in there
+transcription_provider = create_transcription_backend()
+transcription_backend = WarmStreamPool(
+    transcription_provider,
+    size=int(os.environ.get("TRANSCRIPTION_WARM_STREAMS", 0 if transcription_provider.name == "aws" else 2)),
+    max_idle=float(os.environ.get("TRANSCRIPTION_WARM_MAX_IDLE", 10.0)),
+    active_for=float(os.environ.get("TRANSCRIPTION_WARM_ACTIVE_SECONDS", 300.0)),
+    keys=[("en-US", 16000, "pcm")]
+)
+
 app = FastAPI(
     title="Media Analysis API",
     description="Backend API for Chrome extension that provides real-time ML-powered suggestions for video and audio content",
@@ -45,14 +78,41 @@ class AudioSegment(BaseModel):
     end_time: float
     audio_data: str  # Base64 encoded audio data
     sample_rate: int = Field(default=44100)
+    channels: int = Field(default=1)  # interleaved when > 1
 
 
 class SpeechMetrics(BaseModel):
     speech_rate: float
+    speech_rates: Dict[str, float] = Field(default_factory=dict)  # per window, e.g. "10s", "session"
     filler_percentage: float
     total_words: int
     filler_words: Dict[str, int]
 
+class AcousticMetrics(BaseModel):
+    level_db: float
+    speech_level_db: float
+    noise_floor_db: float
+    snr_db: float
+    clipping_percentage: float
+    pitch_hz: Optional[float] = None  # None until enough voiced audio
+    pitch_variability: Optional[float] = None  # semitones
+    volume_variability: float  # dB
+    current_pause: float
+    longest_pause: float
+    pause_count: int
+    mean_pause: float
+
+class VisualMetrics(BaseModel):
+    eye_contact: float  # % of recently analysed frames
+    confidence: float
+    face_detected: bool
+    frames_received: int
+    frames_analyzed: int
+    frames_dropped: int  # replaced by a newer frame before analysis
+    frames_unchanged: int  # skipped because the scene hadn't changed
+    frames_over_budget: int = 0  # due for analysis but over the sampler's rate budget
+    analysis_paused: bool = False  # backend kept failing; the metrics are the last known ones
+
 class MLSuggestion(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     timestamp: datetime = Field(default_factory=datetime.utcnow)
@@ -69,50 +129,51 @@ class AnalysisSession(BaseModel):
     start_time: datetime = Field(default_factory=datetime.utcnow)
     media_type: str  # "video" or "audio"
     status: str = "active"
+    filler_lexicon: Optional[List[str]] = None  # None uses the default fillers
+
+# --- Serializers ---
+
+serialize_speech_metrics = compile_serializer(SpeechMetrics)
+serialize_acoustic_metrics = compile_serializer(AcousticMetrics)
+serialize_visual_metrics = compile_serializer(VisualMetrics)
+serialize_suggestion = compile_serializer(MLSuggestion, {
+    "timestamp": encode_datetime,
+    "speech_metrics": serialize_speech_metrics
+})
+serialize_session = compile_serializer(AnalysisSession, {"start_time": encode_datetime})
+
+
+def json_response(payload) -> Response:
+    """Encode a response body with the fast serializers instead of FastAPI's encoder"""
+    return Response(content=dumps_json(payload), media_type="application/json")
 
 # --- Speech Analysis Components ---
 
 class SpeechAnalyzer:
-    def __init__(self, window_seconds=60):
-        self.filler_words = {
-            'um': 0, 'uh': 0, 'er': 0, 'ah': 0, 'like': 0,
-            'you know': 0, 'sort of': 0, 'kind of': 0
-        }
+    def __init__(self, window_seconds=60, rate_resolution=1.0, filler_lexicon=None):
+        # Compiled matchers are shared between sessions using the same lexicon
+        self.fillers = compile_fillers(filler_lexicon)
+        self.filler_words = dict.fromkeys(self.fillers.phrases, 0)
+        self.transcripts = TranscriptAccumulator(self.fillers)
         self.total_words = 0
         self.window_seconds = window_seconds
-        self.word_timestamps: Deque[float] = deque()
         self.start_time = datetime.utcnow()
 
-    def add_words(self, text: str) -> None:
-        current_time = datetime.utcnow().timestamp()
-        words = text.lower().split()
+        # Bucketed word counts for the short, configured and session windows
+        self.word_rate = WordRateCounter(windows=(10, window_seconds),
+                                         resolution=rate_resolution)
 
-        self.total_words += len(words)
+    def update_result(self, result_id: str, text: str, is_partial: bool) -> None:
+        """Account for a partial or final transcript result incrementally"""
+        words, fillers = self.transcripts.update(result_id, text, is_partial)
 
-        # Record timestamps for speech rate calculation
-        for _ in words:
-            self.word_timestamps.append(current_time)
-
-        # Remove outdated timestamps
-        while (self.word_timestamps and
-               current_time - self.word_timestamps[0] > self.window_seconds):
-            self.word_timestamps.popleft()
-
-        # Update filler word counts
-        for filler in self.filler_words:
-            self.filler_words[filler] += text.lower().count(filler)
+        self.total_words += words
+        self.word_rate.add(words)
+        for filler, count in fillers.items():
+            self.filler_words[filler] += count
 
     def get_speech_rate(self) -> float:
-        if not self.word_timestamps:
-            return 0.0
-
-        current_time = datetime.utcnow().timestamp()
-        window_words = len([t for t in self.word_timestamps
-                          if current_time - t <= self.window_seconds])
-
-        minutes = min(self.window_seconds / 60,
-                     (current_time - self.start_time.timestamp()) / 60)
-        return (window_words / minutes) if minutes > 0 else 0.0
+        return self.word_rate.rate(self.window_seconds)
 
     def get_filler_percentage(self) -> float:
         total_fillers = sum(self.filler_words.values())
@@ -121,17 +182,57 @@ class SpeechAnalyzer:
     def get_metrics(self) -> SpeechMetrics:
         return SpeechMetrics(
             speech_rate=self.get_speech_rate(),
+            speech_rates=self.word_rate.rates(),
             filler_percentage=self.get_filler_percentage(),
             total_words=self.total_words,
             filler_words=self.filler_words
         )
 
 class TranscriptionHandler(TranscriptResultStreamHandler):
-    def __init__(self, *args, speech_analyzer: SpeechAnalyzer, websocket: WebSocket, **kwargs):
+    def __init__(self, *args, speech_analyzer: SpeechAnalyzer, websocket: WebSocket,
+                 encoder: Optional[MessageEncoder] = None,
+                 record_suggestions: Optional[Callable[[List[Dict]], Awaitable[None]]] = None,
+                 suggestion_gate: Optional[SuggestionGate] = None,
+                 acoustic_gate: Optional[SuggestionGate] = None, batch_interval: float = 0.5,
+                 audio_timeline: Optional[AudioTimeline] = None, **kwargs):
         super().__init__(*args, **kwargs)
         self.speech_analyzer = speech_analyzer
         self.websocket = websocket
-        self.last_words = set()
+        self.encoder = encoder or MessageEncoder()
+        # Appends sent suggestions to the session's history
+        self.record_suggestions = record_suggestions
+        # Client timestamp of the newest audio chunk, the reference for
+        # suggestions from acoustic features
+        self.last_audio_time: Optional[float] = None
+        # Maps transcript times back to when their audio was captured, so
+        # transcript suggestions refer to the speech that triggered them
+        self.audio_timeline = audio_timeline
+
+        # Transcript events only update the analyzer; suggestions and metric
+        # deltas are evaluated and sent together at most once per batch_interval
+        self.suggestion_gate = suggestion_gate or SuggestionGate()
+        # Acoustic features arrive from the audio path via observe_acoustics
+        self.acoustic_gate = acoustic_gate or SuggestionGate(ACOUSTIC_RULES)
+        self.acoustic_metrics: Optional[AcousticMetrics] = None
+        self.metrics_deltas = MetricsDeltaTracker(tolerances={"speech_rate": 1.0, "acoustics": 1.0})
+        self.batch_interval = batch_interval
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_flush = 0.0
+        self._batch_reference: Optional[float] = None
+
+    def reference_timestamp(self) -> float:
+        if self.last_audio_time is not None:
+            return self.last_audio_time
+        return datetime.utcnow().timestamp()
+
+    def transcript_reference(self, results) -> float:
+        """Client capture time of the end of the newest audio in `results`"""
+        ends = [result.end_time for result in results if result.end_time is not None]
+        if self.audio_timeline is not None and ends:
+            captured = self.audio_timeline.client_time(max(ends))
+            if captured is not None:
+                return captured
+        return self.reference_timestamp()
 
     async def handle_transcript_event(self, transcript_event: TranscriptEvent):
         # print("\nReceived transcript event")
@@ -139,201 +240,624 @@ class TranscriptionHandler(TranscriptResultStreamHandler):
         
         for result in results:
             try:
-                for alt in result.alternatives:
-                    words = alt.transcript.strip().split()
-                    current_words = set(words)
-                    
-                    print(f"\nTranscribed text: {alt.transcript}")
-                    
-                    # Process words and update metrics
-                    self.speech_analyzer.add_words(alt.transcript)
-                    
-                    # Get updated metrics
-                    metrics = self.speech_analyzer.get_metrics()
-                    print(f"Current metrics: speech_rate={metrics.speech_rate:.1f}, filler_percentage={metrics.filler_percentage:.1f}%")
-                    
-                    # Create suggestions based on metrics
-                    suggestions = []
-                    
-                    # Check speech rate
-                    if metrics.speech_rate > 160:  # Threshold for fast speech
-                        suggestions.append(MLSuggestion(
-                            category="speech_rate",
-                            confidence=0.9,
-                            suggestion="Consider slowing down your speech rate",
-                            reference_timestamp=int(datetime.utcnow().timestamp()),
-                            metadata={"current_rate": metrics.speech_rate},
-                            speech_metrics=metrics
-                        ))
-                    
-                    # Check filler word usage
-                    if metrics.filler_percentage > 10:  # Threshold for high filler word usage
-                        suggestions.append(MLSuggestion(
-                            category="filler_words",
-                            confidence=0.85,
-                            suggestion="Try to reduce filler word usage",
-                            reference_timestamp=int(datetime.utcnow().timestamp()),
-                            metadata={"filler_counts": metrics.filler_words},
-                            speech_metrics=metrics
-                        ))
-                    
-                    # Send suggestions through websocket if any exist
-                    if suggestions:
-                        try:
-                            print(f"\nSending {len(suggestions)} suggestions to client")
-                            message = [s.dict() for s in suggestions]
-                            print(f"Message content: {json.dumps(message, indent=2, default=str)}")
-                            await self.websocket.send_json(message)
-                            print("Successfully sent suggestions to client")
-                        except Exception as e:
-                            print(f"Error sending suggestions to client: {str(e)}")
-                            import traceback
-                            print(traceback.format_exc())
-                    
-                    self.last_words = current_words if not result.is_partial else set()
+                if not result.alternatives:
+                    continue
+                # Alternatives are competing hypotheses, only the best one counts
+                alt = result.alternatives[0]
+                
+                # Apply only what changed since this result's last partial
+                self.speech_analyzer.update_result(result.result_id, alt.transcript, result.is_partial)
             except Exception as e:
                 print(f"Error processing transcript result: {str(e)}")
                 import traceback
                 print(traceback.format_exc())
 
+        # Suggestions in a batch refer to the audio that opened it
+        if self._batch_reference is None:
+            self._batch_reference = self.transcript_reference(results)
+        self._schedule_flush()
+
+    def observe_acoustics(self, metrics: AcousticMetrics) -> None:
+        """Take the latest acoustic features; they are evaluated with the next batch"""
+        self.acoustic_metrics = metrics
+        if self._batch_reference is None:
+            self._batch_reference = self.reference_timestamp()
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        delay = max(0.0, self._last_flush + self.batch_interval - time.monotonic())
+        self._flush_task = asyncio.create_task(self._flush_after(delay))
+
+    async def _flush_after(self, delay: float) -> None:
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._last_flush = time.monotonic()
+        await self.flush()
+
+    def cancel_flush(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+
+    def _suggestion_metadata(self, category: str, value: float, metrics: SpeechMetrics) -> Dict:
+        if category == "speech_rate":
+            return {"current_rate": value}
+        if category == "filler_words":
+            return {"filler_counts": {k: v for k, v in metrics.filler_words.items() if v}}
+        if category == "background_noise":
+            return {"snr_db": value, "decibel_level": self.acoustic_metrics.noise_floor_db}
+        return {"value": value}
+
+    async def flush(self) -> None:
+        """Send newly triggered suggestions and changed metrics to the client"""
+        metrics = self.speech_analyzer.get_metrics()
+        reference = self._batch_reference or self.reference_timestamp()
+        self._batch_reference = None
+
+        suggestions = [
+            MLSuggestion(
+                category=rule.category,
+                confidence=rule.confidence,
+                suggestion=rule.suggestion,
+                reference_timestamp=reference,
+                metadata=self._suggestion_metadata(rule.category, value, metrics)
+            )
+            for rule, value in self.suggestion_gate.observe(metrics) + (
+                self.acoustic_gate.observe(self.acoustic_metrics) if self.acoustic_metrics else []
+            )
+        ]
+        values = {
+            "speech_rate": metrics.speech_rate,
+            "speech_rates": metrics.speech_rates,
+            "filler_percentage": metrics.filler_percentage,
+            "total_words": metrics.total_words,
+            "filler_words": metrics.filler_words
+        }
+        if self.acoustic_metrics is not None:
+            values["acoustics"] = serialize_acoustic_metrics(self.acoustic_metrics)
+        delta = self.metrics_deltas.delta(values)
+
+        payload = [serialize_suggestion(s) for s in suggestions]
+        try:
+            if payload:
+                print(f"Sending {len(payload)} suggestions to client")
+                await self.encoder.send(self.websocket, payload)
+            if delta:
+                await self.encoder.send(self.websocket, {"type": "metrics", "delta": delta})
+        except Exception as e:
+            print(f"Error sending suggestions to client: {str(e)}")
+
+        # Recorded after sending so a slow shared registry doesn't hold up the client
+        if payload and self.record_suggestions is not None:
+            try:
+                await self.record_suggestions(payload)
+            except Exception as e:
+                print(f"Error recording suggestions: {str(e)}")
+
+
+class VideoAnalysisHandler:
+    """Analyses the newest frame of a video session whenever the pool is free"""
+
+    def __init__(self, websocket: WebSocket, pool: FrameAnalysisPool, encoder: Optional[MessageEncoder] = None,
+                 record_suggestions: Optional[Callable[[List[Dict]], Awaitable[None]]] = None,
+                 suggestion_gate: Optional[SuggestionGate] = None, sampler: Optional[FrameSampler] = None,
+                 cache: Optional[CachedFaceAnalyzer] = None, session_id: str = ""):
+        self.websocket = websocket
+        self.pool = pool
+        self.session_id = session_id
+        self.encoder = encoder or MessageEncoder()
+        self.record_suggestions = record_suggestions
+        self.suggestion_gate = suggestion_gate or SuggestionGate(VIDEO_RULES)
+        self.metrics_deltas = MetricsDeltaTracker(default_tolerance=1.0)
+        # Frames that arrive during an analysis replace each other here
+        self.frames = LatestFrameSlot()
+        self.visual = VisualTracker()
+        # Only frames that changed (or whose last result went stale) are analysed
+        self.sampler = sampler or FrameSampler(max_rate=pool.analyzer.max_rate)
+        # Follows the face so most frames upload only the region around it
+        self.tracker = FaceCropTracker()
+        # Recent results for this session's camera only
+        self.cache = cache
+        self.frames_analyzed = 0
+        self.analysis_paused = False
+        # (timestamp, image) being analysed
+        self._current: Optional[Tuple[float, FaceImage]] = None
+
+    def get_metrics(self) -> VisualMetrics:
+        return VisualMetrics(
+            eye_contact=self.visual.eye_contact,
+            confidence=self.visual.confidence,
+            face_detected=self.visual.face_detected,
+            frames_received=self.frames.offered,
+            frames_analyzed=self.frames_analyzed,
+            frames_dropped=self.frames.dropped,
+            frames_unchanged=self.sampler.unchanged,
+            frames_over_budget=self.sampler.over_budget,
+            analysis_paused=self.analysis_paused
+        )
+
+    async def run(self) -> None:
+        while True:
+            item = await self.frames.take()
+            if item is None:
+                return
+            timestamp, image = item
+            try:
+                # Decoding the preview and comparing it take milliseconds per frame,
+                # too long to spend on the event loop serving every socket
+                if not await asyncio.to_thread(self._should_sample, image):
+                    continue
+                self._current = item
+                # Sessions whose scene changed get the next call before routine refreshes
+                faces = await self.pool.analyze(image, key=self.session_id, priority=self.sampler.scene_changed,
+                                                refresh=self._newest_frame, cache=self.cache,
+                                                tracker=self.tracker)
+            except CircuitOpenError:
+                # Keep the last metrics and tell the client once
+                if not self.analysis_paused:
+                    self.analysis_paused = True
+                    await self.flush(timestamp)
+                continue
+            except Exception as e:
+                print(f"Error analyzing video frame: {str(e)}")
+                continue
+            timestamp, _ = self._current
+            self.analysis_paused = False
+            self.frames_analyzed += 1
+            self.visual.update(faces)
+            await self.flush(timestamp)
+
+    def _should_sample(self, image: FaceImage) -> bool:
+        return self.sampler.should_sample(image.preview())
+
+    def _newest_frame(self) -> Optional[FaceImage]:
+        """Swap in a frame that arrived while waiting for the call budget"""
+        item = self.frames.poll()
+        if item is None:
+            return None
+        self.frames.dropped += 1
+        self._current = item
+        return item[1]
+
+    async def flush(self, reference: float) -> None:
+        metrics = self.get_metrics()
+        suggestions = [
+            MLSuggestion(
+                category=rule.category,
+                confidence=rule.confidence,
+                suggestion=rule.suggestion,
+                reference_timestamp=reference,
+                metadata={"value": value}
+            )
+            for rule, value in self.suggestion_gate.observe(metrics)
+        ]
+        payload = [serialize_suggestion(s) for s in suggestions]
+        delta = self.metrics_deltas.delta(serialize_visual_metrics(metrics))
+
+        try:
+            if payload:
+                await self.encoder.send(self.websocket, payload)
+            if delta:
+                await self.encoder.send(self.websocket, {"type": "video", "delta": delta})
+        except Exception as e:
+            print(f"Error sending video metrics to client: {str(e)}")
+
+        if payload and self.record_suggestions is not None:
+            try:
+                await self.record_suggestions(payload)
+            except Exception as e:
+                print(f"Error recording suggestions: {str(e)}")
 
 
 # --- In-Memory Storage (replace with proper database in production) ---
-active_sessions: Dict[str, AnalysisSession] = {}
-suggestions_cache: Dict[str, List[MLSuggestion]] = {}
+session_store = SessionStore(
+    max_sessions=int(os.environ.get("MAX_SESSIONS", 10000)),
+    max_suggestions=int(os.environ.get("MAX_SUGGESTIONS_PER_SESSION", 500)),
+    idle_ttl=float(os.environ.get("SESSION_IDLE_TTL", 30 * 60)),
+    absolute_ttl=float(os.environ.get("SESSION_ABSOLUTE_TTL", 6 * 60 * 60)),
+    # Long sessions move older suggestions to disk when this is set
+    spill_dir=os.environ.get("SUGGESTION_SPILL_DIR")
+)
 
-# --- Helper Functions ---
 
-async def analyze_video(video_frame: VideoFrame) -> List[MLSuggestion]:
-    """Stub for ML-powered video analysis"""
-    # Simulate processing delay
-    await asyncio.sleep(0.1)
+# Audio waits in a bounded per-session queue between the socket and Transcribe;
+# AUDIO_INGEST_POLICY picks what happens when it fills (block, coalesce or drop_oldest)
+ingest_policy = os.environ.get("AUDIO_INGEST_POLICY", "block")
+ingest_max_chunks = int(os.environ.get("AUDIO_INGEST_MAX_CHUNKS", 50))
+ingest_max_lag = float(os.environ.get("AUDIO_INGEST_MAX_LAG", 5.0))
+ingest_report_interval = 0.5
+
+# Transcribe ends streams after 4 hours; sessions move to a fresh stream before that
+stream_rollover_seconds = float(os.environ.get("TRANSCRIPTION_ROLLOVER_SECONDS", 3 * 60 * 60 + 50 * 60))
+stream_overlap_seconds = float(os.environ.get("TRANSCRIPTION_ROLLOVER_OVERLAP", 30.0))
+stream_tail_seconds = float(os.environ.get("TRANSCRIPTION_REPLAY_SECONDS", 5.0))
+
+# Silence is gated out before it is queued for Transcribe unless AUDIO_VAD=off
+vad_enabled = os.environ.get("AUDIO_VAD", "on").lower() not in ("0", "off", "false", "no")
+
+# Face analysis for video sessions runs on a shared thread pool; FACE_BACKEND
+# picks the analyzer. FACE_ANALYSIS_RATE caps calls per second over all
+# sessions (Rekognition's account TPS limit); 0 means no cap, the default
+# for the local backend. Each session caches its own results (FACE_CACHE_*)
+face_analyzer = create_face_analyzer(cache=False)
+frame_pool = FrameAnalysisPool(
+    face_analyzer,
+    workers=int(os.environ.get("VIDEO_ANALYSIS_WORKERS", 4)),
+    limiter=FairShareLimiter(
+        rate=float(os.environ.get("FACE_ANALYSIS_RATE", 5.0 if face_analyzer.name == "rekognition" else 0.0))),
+    breaker=CircuitBreaker(failure_threshold=int(os.environ.get("FACE_BREAKER_FAILURES", 5)),
+                           reset_timeout=float(os.environ.get("FACE_BREAKER_RESET_SECONDS", 30.0)))
+)
+
+# Shared with the other workers when SESSION_REGISTRY is sqlite:// or redis://;
+# the worker holding a session's stream lease keeps its hot state in memory
+session_registry = AsyncRegistry(create_session_registry(max_suggestions=session_store.max_suggestions))
+session_lease = float(os.environ.get("SESSION_LEASE_SECONDS", 30))
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    asyncio.create_task(session_store.run_sweeper())
+    asyncio.create_task(transcription_backend.run())
+    if session_registry.shared:
+        asyncio.create_task(renew_session_leases())
+
+
+@app.on_event("shutdown")
+async def close_warm_streams():
+    await transcription_backend.close()
+
+
+async def renew_session_leases():
+    """Keep the stream leases of this worker's connected sessions alive"""
+    while True:
+        await asyncio.sleep(session_lease / 3)
+        for entry in session_store:
+            if entry.connected:
+                try:
+                    await session_registry.claim(entry.session.session_id, WORKER_ID, session_lease)
+                except UnknownSessionError:
+                    # Deleted through another worker; the stream runs until the client leaves
+                    pass
+        removed = await session_registry.expire(session_store.absolute_ttl)
+        if removed:
+            print(f"Session registry expired {removed} sessions")
+
+
+async def load_session(session_id: str):
+    """Local session entry, hydrated from the shared registry if another worker created it"""
+    entry = session_store.get(session_id)
+    if entry is None and session_registry.shared:
+        data = await session_registry.get_session(session_id)
+        if data is not None:
+            entry = session_store.create(AnalysisSession(**data))
+    return entry
+
+
+async def record_suggestions(session_id: str, items: List[Dict]) -> None:
+    await session_store.add_suggestions(session_id, items)
+    await session_registry.append_suggestions(session_id, items)
+
+# --- Helper Functions ---
 
-    return [
-        MLSuggestion(
-            category="composition",
-            confidence=0.92,
-            suggestion="Adjust framing to follow rule of thirds",
-            reference_timestamp=int(video_frame.timestamp),
-            metadata={"detected_objects": ["person", "microphone"]}
-        )
-    ]
 
 
 async def analyze_audio(audio_segment: AudioSegment) -> List[MLSuggestion]:
-    """Stub for ML-powered audio analysis"""
-    # Simulate processing delay
-    await asyncio.sleep(0.1)
-    
+    """Acoustic analysis of a single audio segment"""
+    pcm = np.frombuffer(base64.b64decode(audio_segment.audio_data), dtype=np.int16)
+    pcm = AudioConverter(audio_segment.sample_rate, audio_segment.channels, out_rate=16000).process(pcm)
+
+    # The whole segment is one batch
+    analyzer = AcousticAnalyzer(sample_rate=16000, batch_seconds=len(pcm) / 16000)
+    features = analyzer.process(pcm)
+    if features is None:
+        return []
+    metrics = AcousticMetrics(**features)
+
     return [
         MLSuggestion(
-            category="speech_clarity",
-            confidence=0.85,
-            suggestion="Consider reducing background noise",
-            reference_timestamp=int(audio_segment.start_time),
-            metadata={"decibel_level": -20}
+            category=rule.category,
+            confidence=rule.confidence,
+            suggestion=rule.suggestion,
+            reference_timestamp=audio_segment.start_time,
+            metadata={"value": value, "acoustics": serialize_acoustic_metrics(metrics)}
         )
+        for rule, value in SuggestionGate(ACOUSTIC_RULES).observe(metrics)
     ]
 
 async def analyze_video(video_frame: VideoFrame) -> List[MLSuggestion]:
-    """Stub for ML-powered video analysis"""
-    # Simulate processing delay
-    await asyncio.sleep(0.1)
-    
+    """Face analysis of a single JPEG frame"""
+    image = FaceImage(jpeg=base64.b64decode(video_frame.frame_data))
+    faces = await frame_pool.analyze(image)
+    if not faces:
+        return []
+
+    visual = VisualTracker()
+    visual.update(faces)
+    metrics = VisualMetrics(eye_contact=visual.eye_contact, confidence=visual.confidence,
+                            face_detected=True, frames_received=1, frames_analyzed=1, frames_dropped=0,
+                            frames_unchanged=0, frames_over_budget=0)
     return [
         MLSuggestion(
-            category="composition",
-            confidence=0.92,
-            suggestion="Adjust framing to follow rule of thirds",
-            reference_timestamp=int(video_frame.timestamp),
-            metadata={"detected_objects": ["person", "microphone"]}
+            category=rule.category,
+            confidence=rule.confidence,
+            suggestion=rule.suggestion,
+            reference_timestamp=video_frame.timestamp,
+            metadata={"value": value}
         )
+        for rule, value in SuggestionGate(VIDEO_RULES).observe(metrics)
     ]
 
+def _current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
 # --- API Endpoints ---
 
 @app.post("/sessions/", response_model=AnalysisSession)
-async def create_session(url: str, media_type: str):
+async def create_session(url: str, media_type: str, fillers: Optional[List[str]] = Query(default=None)):
     """Create a new analysis session for a specific URL"""
     if media_type not in ["video", "audio"]:
         raise HTTPException(status_code=400, detail="Invalid media type")
     
-    session = AnalysisSession(url=url, media_type=media_type)
-    active_sessions[session.session_id] = session
-    suggestions_cache[session.session_id] = []
-    return session
+    session = AnalysisSession(url=url, media_type=media_type, filler_lexicon=fillers)
+    try:
+        session_store.create(session)
+    except SessionLimitError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    data = serialize_session(session)
+    await session_registry.put_session(session.session_id, data)
+    return json_response(data)
 
 @app.get("/sessions/{session_id}/suggestions/", response_model=List[MLSuggestion])
-async def get_suggestions(session_id: str):
-    """Get all suggestions for a specific session"""
-    if session_id not in active_sessions:
-        raise HTTPException(status_code=404, detail="Session not found")
-    return suggestions_cache[session_id]
+async def get_suggestions(request: Request, session_id: str, since: int = Query(default=0, ge=0),
+                          limit: int = Query(default=100, ge=1, le=1000)):
+    """Get suggestions for a session starting at cursor `since`
+
+    The X-Next-Cursor header is the `since` to poll with next. Entries never
+    change once written, so the returned range doubles as the ETag and an
+    unchanged poll with If-None-Match gets an empty 304. With a shared
+    registry any worker can answer, whichever one owns the stream.
+    """
+    if session_registry.shared:
+        if await session_registry.get_session(session_id) is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        items, start, end = await session_registry.read_suggestions(session_id, since, limit)
+    else:
+        entry = session_store.get(session_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        log = entry.suggestions
+        start, end = log.window(since, limit)
+        items = None
+
+    headers = {"ETag": f'"{start}-{end}"', "X-Next-Cursor": str(end)}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+
+    if items is None:
+        items, _ = await log.read(since, limit)
+    return Response(content=dumps_json(items), media_type="application/json", headers=headers)
 
 @app.websocket("/ws/{session_id}")
-async def websocket_endpoint(websocket: WebSocket, session_id: str):
-    """WebSocket endpoint for real-time media analysis"""
-    if session_id not in active_sessions:
+async def websocket_endpoint(websocket: WebSocket, session_id: str, audio_format: str = "json",
+                             wire: str = "json", overflow: Optional[str] = None):
+    """WebSocket endpoint for real-time media analysis
+
+    Clients are sent {"type": "ingest", "delta": {...}} messages with the
+    seconds of audio queued for transcription (lag_seconds), dropped and
+    skipped as silence so far, and may choose the queue's overflow policy
+    with ?overflow=.
+    """
+    try:
+        entry = await load_session(session_id)
+    except SessionLimitError as e:
+        print(f"Cannot load session {session_id}: {str(e)}")
+        await websocket.close(code=1013)
+        return
+    if entry is None:
+        print(f"Session {session_id} not found")
+        await websocket.close(code=4000)
+        return
+
+    if audio_format not in AUDIO_FORMATS:
+        print(f"Unsupported audio format {audio_format}")
+        await websocket.close(code=1003)
+        return
+
+    if wire not in available_wire_formats():
+        print(f"Unsupported wire format {wire}")
+        await websocket.close(code=1003)
+        return
+
+    overflow = overflow or ingest_policy
+    if overflow not in OVERFLOW_POLICIES:
+        print(f"Unsupported overflow policy {overflow}")
+        await websocket.close(code=1003)
+        return
+
+    # Only one worker streams a session at a time
+    try:
+        owner = await session_registry.claim(session_id, WORKER_ID, session_lease)
+    except UnknownSessionError:
         print(f"Session {session_id} not found")
         await websocket.close(code=4000)
         return
+    if owner != WORKER_ID:
+        print(f"Session {session_id} is streaming on worker {owner}")
+        await websocket.close(code=4001)
+        return
 
-    await websocket.accept()
-    session = active_sessions[session_id]
-    print(f"\nWebSocket connected for session {session_id}")
+    encoder = MessageEncoder(wire)
+    session = entry.session
+    # Set as each part starts, so teardown only touches what exists
+    ingest = forward_task = stream = handler = handler_task = None
+    video_handler = video_task = None
 
     try:
+        await websocket.accept()
+        session_store.attach(session_id)
+        print(f"\nWebSocket connected for session {session_id}")
+
         if session.media_type == "audio":
             # Initialize speech analyzer
-            speech_analyzer = SpeechAnalyzer()
+            speech_analyzer = SpeechAnalyzer(filler_lexicon=session.filler_lexicon)
             print("Speech analyzer initialized")
 
-            # Set up Amazon Transcribe client
-            client = TranscribeStreamingClient(region="us-west-2")
-            print("Amazon Transcribe client initialized")
-            
-            stream = await client.start_stream_transcription(
+            # Open a stream on the deployment's transcription backend, moved to a
+            # fresh one before provider limits or after a failure
+            stream = await SupervisedStream(
+                transcription_backend,
                 language_code="en-US",
-                media_sample_rate_hz=16000,
-                media_encoding="pcm"
-            )
-            print("Transcription stream started")
+                sample_rate=16000,
+                media_encoding="pcm",
+                max_stream_seconds=stream_rollover_seconds,
+                overlap_seconds=stream_overlap_seconds,
+                tail_seconds=stream_tail_seconds
+            ).start()
+            print(f"Transcription stream started ({transcription_backend.name})")
 
             # Initialize handler with speech analyzer and websocket
+            timeline = AudioTimeline(bytes_per_second=16000 * 2)
             handler = TranscriptionHandler(
                 stream.output_stream,
                 speech_analyzer=speech_analyzer,
-                websocket=websocket
+                websocket=websocket,
+                encoder=encoder,
+                record_suggestions=functools.partial(record_suggestions, session_id),
+                audio_timeline=timeline
             )
 
             # Start the handler in the background
             handler_task = asyncio.create_task(handler.handle_events())
             print("Handler task started")
 
+            # Forward queued audio to Transcribe from its own task so a slow
+            # stream shows up as lag instead of stalling the receive loop
+            ingest = AudioIngestQueue(max_chunks=ingest_max_chunks, policy=overflow,
+                                      max_lag=ingest_max_lag, bytes_per_second=16000 * 2)
+
+            async def send_chunk(chunk) -> None:
+                timeline.record(len(chunk), ingest.last_timestamp)
+                await stream.input_stream.send_audio_event(audio_chunk=chunk)
+
+            forward_task = asyncio.create_task(ingest.forward(send_chunk))
+            ingest_deltas = MetricsDeltaTracker(default_tolerance=0.1)
+            vad = VoiceActivityGate(sample_rate=16000) if vad_enabled else None
+            acoustics = AcousticAnalyzer(sample_rate=16000)
+            # Rebuilt whenever the client's declared rate or channel count changes
+            converter: Optional[AudioConverter] = None
+            last_ingest_report = 0.0
+
             # Process incoming audio data
             while True:
                 try:
-                    data = await websocket.receive_text()
-                    audio_segment = AudioSegment(**json.loads(data))
-                    
-                    # print(f"\nReceived audio segment: {len(base64.b64decode(audio_segment.audio_data))} bytes")
-                    
-                    # Debug: check audio data stats
-                    audio_data = base64.b64decode(audio_segment.audio_data)
-                    audio_array = np.frombuffer(audio_data, dtype=np.int16)
+                    if audio_format == AUDIO_FORMAT_BINARY:
+                        # Header + raw PCM, forwarded as a view without copying
+                        data = await websocket.receive_bytes()
+                        header, audio_data = unpack_audio_frame(data)
+                        handler.last_audio_time = header.start_time
+                        captured = header.end_time
+                        audio_format_declared = (header.sample_rate, header.channels)
+                    else:
+                        data = await websocket.receive_text()
+                        audio_segment = AudioSegment(**json.loads(data))
+                        audio_data = base64.b64decode(audio_segment.audio_data)
+                        handler.last_audio_time = audio_segment.start_time
+                        captured = audio_segment.end_time
+                        audio_format_declared = (audio_segment.sample_rate, audio_segment.channels)
+
+                    # print(f"\nReceived audio segment: {len(audio_data)} bytes")
+
+                    # Convert to the stream's 16 kHz mono
+                    if converter is None or converter.format != audio_format_declared:
+                        converter = AudioConverter(*audio_format_declared, out_rate=16000)
+                    audio_array = converter.process(np.frombuffer(audio_data, dtype=np.int16))
                     # print(f"Audio stats - min: {np.min(audio_array)}, max: {np.max(audio_array)}, mean: {np.mean(audio_array):.2f}")
-                    
-                    # Send to Transcribe
-                    await stream.input_stream.send_audio_event(audio_chunk=audio_data)
 
+                    # Level, pitch and pause features, evaluated in half-second batches
+                    features = acoustics.process(audio_array)
+                    if features is not None:
+                        handler.observe_acoustics(AcousticMetrics(**features))
+
+                    # Queue for Transcribe, leaving out silence
+                    if vad is not None:
+                        voiced = vad.process(audio_array)
+                        if voiced is not None:
+                            await ingest.put(voiced.tobytes(), captured)
+                    elif converter.passthrough:
+                        await ingest.put(audio_data, captured)
+                    else:
+                        await ingest.put(audio_array.tobytes(), captured)
+
+                    now = time.monotonic()
+                    if now - last_ingest_report >= ingest_report_interval:
+                        last_ingest_report = now
+                        delta = ingest_deltas.delta({
+                            "lag_seconds": ingest.lag,
+                            "dropped_seconds": ingest.dropped_seconds,
+                            "skipped_seconds": vad.skipped_samples / vad.sample_rate if vad else 0.0
+                        })
+                        if delta:
+                            await encoder.send(websocket, {"type": "ingest", "delta": delta})
+
+                except WebSocketDisconnect:
+                    raise
                 except json.JSONDecodeError as e:
                     print(f"Error decoding JSON data: {str(e)}")
+                except ValueError as e:
+                    print(f"Error decoding audio frame: {str(e)}")
                 except Exception as e:
                     print(f"Error processing audio data: {str(e)}")
                     import traceback
                     print(traceback.format_exc())
                     break
 
+        elif session.media_type == "video":
+            video_handler = VideoAnalysisHandler(
+                websocket,
+                frame_pool,
+                encoder=encoder,
+                record_suggestions=functools.partial(record_suggestions, session_id),
+                cache=create_face_cache(frame_pool.analyzer),
+                session_id=session_id
+            )
+            video_task = asyncio.create_task(video_handler.run())
+
+            # Binary frames (JPEG or I420 with a header) or JSON VideoFrame messages
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+                try:
+                    if message.get("bytes") is not None:
+                        header, payload = unpack_video_frame(message["bytes"])
+                        if header.encoding == VIDEO_ENCODING_JPEG:
+                            image = FaceImage(jpeg=bytes(payload))
+                        else:
+                            image = FaceImage(i420=(payload, header.width, header.height))
+                        timestamp = header.timestamp
+                    else:
+                        video_frame = VideoFrame(**json.loads(message["text"]))
+                        image = FaceImage(jpeg=base64.b64decode(video_frame.frame_data))
+                        timestamp = video_frame.timestamp
+
+                    # Latest frame wins; anything older still waiting is dropped
+                    video_handler.frames.offer((timestamp, image))
+                except ValueError as e:
+                    print(f"Error decoding video frame: {str(e)}")
+
     except WebSocketDisconnect:
         print("\nWebSocket disconnected")
     except Exception as e:
@@ -341,30 +865,74 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
         import traceback
         print(traceback.format_exc())
     finally:
-        if session.media_type == "audio":
-            print("\nCleaning up audio session...")
-            await stream.input_stream.end_stream()
-            handler_task.cancel()  # Cancel the handler task
-        if session_id in active_sessions:
-            active_sessions[session_id].status = "completed"
-            print(f"Session {session_id} completed")
+        try:
+            if ingest is not None:
+                print("\nCleaning up audio session...")
+                # Let queued audio reach Transcribe before ending the stream
+                ingest.close()
+                if forward_task is not None:
+                    try:
+                        await asyncio.wait_for(forward_task, timeout=ingest_max_lag)
+                    except asyncio.TimeoutError:
+                        print(f"Dropped {ingest.lag:.1f}s of queued audio")
+                    except Exception as e:
+                        print(f"Error forwarding audio: {str(e)}")
+            if stream is not None:
+                try:
+                    await stream.input_stream.end_stream()
+                except Exception as e:
+                    print(f"Error ending transcription stream: {str(e)}")
+                print(f"Transcription streams: {stream.stats()}")
+            if handler_task is not None:
+                handler_task.cancel()
+            if handler is not None:
+                handler.cancel_flush()
+            if video_handler is not None:
+                video_handler.frames.close()
+            if video_task is not None:
+                video_task.cancel()
+            if session.media_type == "video":
+                frame_pool.limiter.forget(session_id)
+        finally:
+            # Whatever failed above, the session is finished and its lease freed
+            if session_id in session_store:
+                session_store.complete(session_id)
+                print(f"Session {session_id} completed")
+            await session_registry.set_status(session_id, "completed")
+            await session_registry.release(session_id, WORKER_ID)
 
 
 @app.delete("/sessions/{session_id}")
 async def end_session(session_id: str):
     """End an analysis session and cleanup resources"""
-    if session_id not in active_sessions:
+    entry = session_store.remove(session_id)
+    if entry is None and await session_registry.get_session(session_id) is None:
         raise HTTPException(status_code=404, detail="Session not found")
-    
-    session = active_sessions[session_id]
-    session.status = "completed"
-    
+    await session_registry.delete_session(session_id)
+
     # Cleanup (in production, you might want to archive instead of delete)
-    del active_sessions[session_id]
-    del suggestions_cache[session_id]
+    if entry is not None:
+        entry.session.status = "completed"
     
     return {"status": "success", "message": "Session ended successfully"}
 
+@app.get("/stats")
+async def get_stats():
+    """Process-level load figures for capacity testing"""
+    return {
+        "pid": os.getpid(),
+        "timestamp": time.time(),
+        "cpu_seconds": time.process_time(),
+        "rss_bytes": _current_rss_bytes(),
+        "worker_id": WORKER_ID,
+        "session_store": session_store.stats(),
+        "session_registry": session_registry.name,
+        "frame_analysis": frame_pool.stats(),
+        "transcription_backend": transcription_backend.name,
+        "transcription_streams": transcription_backend.stats(),
+        "aws_clients": shared_clients().stats()
+    }
+
 # --- ML Model Management Endpoints ---
 
 @app.post("/models/reload")
@@ -0,0 +1,87 @@
+"""Binary framing for the /ws/{session_id} audio and video streams.
+
+Clients that connect with ``?audio_format=binary`` send every chunk as a
+single binary WebSocket message: a fixed little-endian header followed by
+the raw 16-bit PCM samples. Clients that don't ask for it keep using the
+JSON + base64 ``AudioSegment`` messages.
+
+Video sessions send one binary message per camera frame: a fixed header
+followed by either a JPEG image or raw I420 (YUV 4:2:0 planar) pixels.
+"""
+import struct
+from typing import NamedTuple, Tuple
+
+AUDIO_FORMAT_JSON = "json"
+AUDIO_FORMAT_BINARY = "binary"
+AUDIO_FORMATS = (AUDIO_FORMAT_JSON, AUDIO_FORMAT_BINARY)
+
+# sequence (u32), start_time (f64), end_time (f64), sample_rate (u32),
+# channels (u16), reserved (u16)
+AUDIO_HEADER = struct.Struct("<IddIHH")
+AUDIO_HEADER_SIZE = AUDIO_HEADER.size
+
+
+class AudioFrameHeader(NamedTuple):
+    sequence: int
+    start_time: float
+    end_time: float
+    sample_rate: int
+    channels: int
+
+
+def pack_audio_frame(sequence: int, start_time: float, end_time: float,
+                     sample_rate: int, pcm: bytes, channels: int = 1) -> bytes:
+    """Build a binary audio frame from a header and raw PCM bytes"""
+    header = AUDIO_HEADER.pack(sequence & 0xFFFFFFFF, start_time, end_time,
+                               sample_rate, channels, 0)
+    return header + pcm
+
+
+def unpack_audio_frame(data: bytes) -> Tuple[AudioFrameHeader, memoryview]:
+    """Split a binary audio frame into its header and a zero-copy PCM view"""
+    if len(data) < AUDIO_HEADER_SIZE:
+        raise ValueError(f"Audio frame too short: {len(data)} bytes")
+
+    sequence, start_time, end_time, sample_rate, channels, _ = AUDIO_HEADER.unpack_from(data)
+    header = AudioFrameHeader(sequence, start_time, end_time, sample_rate, channels)
+    return header, memoryview(data)[AUDIO_HEADER_SIZE:]
+
+
+VIDEO_ENCODING_JPEG = 0
+VIDEO_ENCODING_I420 = 1
+VIDEO_ENCODINGS = (VIDEO_ENCODING_JPEG, VIDEO_ENCODING_I420)
+
+# sequence (u32), timestamp (f64), width (u16), height (u16), encoding (u8),
+# reserved (u8 + u16)
+VIDEO_HEADER = struct.Struct("<IdHHBBH")
+VIDEO_HEADER_SIZE = VIDEO_HEADER.size
+
+
+class VideoFrameHeader(NamedTuple):
+    sequence: int
+    timestamp: float
+    width: int
+    height: int
+    encoding: int
+
+
+def pack_video_frame(sequence: int, timestamp: float, width: int, height: int,
+                     payload: bytes, encoding: int = VIDEO_ENCODING_JPEG) -> bytes:
+    """Build a binary video frame from a header and the encoded image"""
+    header = VIDEO_HEADER.pack(sequence & 0xFFFFFFFF, timestamp, width, height, encoding, 0, 0)
+    return header + payload
+
+
+def unpack_video_frame(data: bytes) -> Tuple[VideoFrameHeader, memoryview]:
+    """Split a binary video frame into its header and a zero-copy image view"""
+    if len(data) < VIDEO_HEADER_SIZE:
+        raise ValueError(f"Video frame too short: {len(data)} bytes")
+
+    sequence, timestamp, width, height, encoding, _, _ = VIDEO_HEADER.unpack_from(data)
+    if encoding not in VIDEO_ENCODINGS:
+        raise ValueError(f"Unknown video encoding: {encoding}")
+    header = VideoFrameHeader(sequence, timestamp, width, height, encoding)
+    payload = memoryview(data)[VIDEO_HEADER_SIZE:]
+    if encoding == VIDEO_ENCODING_I420 and len(payload) != width * height * 3 // 2:
+        raise ValueError(f"I420 frame of {width}x{height} must be {width * height * 3 // 2} bytes, got {len(payload)}")
+    return header, payload
@@ -0,0 +1,442 @@
+"""Session registry shared between worker processes.
+
+Session metadata, the current stream owner and the suggestion history live
+in a backend every worker can reach, so a session created on one worker
+can be streamed on another and read from any of them. The worker that owns
+a session's WebSocket keeps the hot analysis state in its own memory and
+holds a renewable lease on the session while the stream is open.
+
+Chosen with SESSION_REGISTRY:
+  local                    single process, no sharing (default)
+  sqlite:///path/to.db     workers on one machine
+  redis://host:6379/0      any Redis-compatible server (needs `redis`)
+
+Each session keeps its newest MAX_SUGGESTIONS_PER_SESSION suggestions;
+sequence numbers keep counting as older ones are dropped. The server
+reaches the registry through `AsyncRegistry`, which runs the blocking
+sqlite3 and Redis calls on a small thread pool instead of the event loop.
+"""
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class UnknownSessionError(Exception):
+    """Raised when claiming a session the registry has no record of"""
+
+
+class SessionRegistry:
+    """Shared session metadata, stream ownership and suggestion history"""
+
+    name = "base"
+    shared = True
+    max_suggestions = 500
+
+    def put_session(self, session_id: str, data: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def set_status(self, session_id: str, status: str) -> None:
+        raise NotImplementedError
+
+    def delete_session(self, session_id: str) -> None:
+        raise NotImplementedError
+
+    def claim(self, session_id: str, worker_id: str, lease: float) -> Optional[str]:
+        """Take or renew the stream lease, returning the worker that holds it
+
+        Raises UnknownSessionError if the session isn't registered.
+        """
+        raise NotImplementedError
+
+    def release(self, session_id: str, worker_id: str) -> None:
+        raise NotImplementedError
+
+    def owner(self, session_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def append_suggestions(self, session_id: str, items: List[Dict[str, Any]]) -> None:
+        """Add entries, dropping the oldest beyond `max_suggestions`"""
+        raise NotImplementedError
+
+    def read_suggestions(self, session_id: str, since: int, limit: int
+                         ) -> Tuple[List[Dict[str, Any]], int, int]:
+        """Entries from `since` on, with the [start, end) range they cover
+
+        `start` is later than `since` when older entries have been dropped.
+        """
+        raise NotImplementedError
+
+    def expire(self, max_age: float) -> int:
+        """Drop sessions created more than `max_age` seconds ago that no worker is streaming"""
+        raise NotImplementedError
+
+
+class LocalRegistry(SessionRegistry):
+    """Single-process deployments: the local SessionStore is authoritative"""
+
+    name = "local"
+    shared = False
+
+    def put_session(self, session_id, data):
+        pass
+
+    def get_session(self, session_id):
+        return None
+
+    def set_status(self, session_id, status):
+        pass
+
+    def delete_session(self, session_id):
+        pass
+
+    def claim(self, session_id, worker_id, lease):
+        return worker_id
+
+    def release(self, session_id, worker_id):
+        pass
+
+    def owner(self, session_id):
+        return None
+
+    def append_suggestions(self, session_id, items):
+        pass
+
+    def read_suggestions(self, session_id, since, limit):
+        return [], since, since
+
+    def expire(self, max_age):
+        return 0
+
+
+class SQLiteRegistry(SessionRegistry):
+    """Registry in a SQLite database file shared by workers on one machine"""
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            owner TEXT,
+            lease_expires REAL
+        );
+        CREATE TABLE IF NOT EXISTS suggestions (
+            session_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (session_id, seq)
+        );
+    """
+
+    def __init__(self, path: str, max_suggestions: int = 500):
+        self.path = path
+        self.max_suggestions = max_suggestions
+        self._local = threading.local()
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put_session(self, session_id, data):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO sessions (session_id, data, created_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(data), time.time())
+        )
+
+    def get_session(self, session_id):
+        row = self._connect().execute(
+            "SELECT data FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_status(self, session_id, status):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row:
+                data = json.loads(row[0])
+                data["status"] = status
+                conn.execute("UPDATE sessions SET data = ? WHERE session_id = ?",
+                             (json.dumps(data), session_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete_session(self, session_id):
+        conn = self._connect()
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM suggestions WHERE session_id = ?", (session_id,))
+
+    def claim(self, session_id, worker_id, lease):
+        now = time.time()
+        conn = self._connect()
+        updated = conn.execute(
+            "UPDATE sessions SET owner = ?, lease_expires = ? WHERE session_id = ? "
+            "AND (owner IS NULL OR owner = ? OR lease_expires < ?)",
+            (worker_id, now + lease, session_id, worker_id, now)
+        ).rowcount
+        if updated:
+            return worker_id
+        # Either another worker holds a live lease or there is no such session
+        row = conn.execute("SELECT owner FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            raise UnknownSessionError(session_id)
+        return row[0]
+
+    def release(self, session_id, worker_id):
+        self._connect().execute(
+            "UPDATE sessions SET owner = NULL, lease_expires = NULL WHERE session_id = ? AND owner = ?",
+            (session_id, worker_id)
+        )
+
+    def owner(self, session_id):
+        row = self._connect().execute(
+            "SELECT owner FROM sessions WHERE session_id = ? AND lease_expires >= ?",
+            (session_id, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def append_suggestions(self, session_id, items):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            (next_seq,) = conn.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM suggestions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            conn.executemany(
+                "INSERT INTO suggestions (session_id, seq, data) VALUES (?, ?, ?)",
+                [(session_id, next_seq + i, json.dumps(item)) for i, item in enumerate(items)]
+            )
+            conn.execute("DELETE FROM suggestions WHERE session_id = ? AND seq < ?",
+                         (session_id, next_seq + len(items) - self.max_suggestions))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def read_suggestions(self, session_id, since, limit):
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT seq, data FROM suggestions WHERE session_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+            (session_id, since, limit)
+        ).fetchall()
+        if rows:
+            return [json.loads(data) for _, data in rows], rows[0][0], rows[-1][0] + 1
+        (next_seq,) = conn.execute(
+            "SELECT COALESCE(MAX(seq) + 1, 0) FROM suggestions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        start = min(since, next_seq)
+        return [], start, start
+
+    def expire(self, max_age):
+        conn = self._connect()
+        now = time.time()
+        expired = [row[0] for row in conn.execute(
+            "SELECT session_id FROM sessions WHERE created_at < ? "
+            "AND (lease_expires IS NULL OR lease_expires < ?)", (now - max_age, now))]
+        for session_id in expired:
+            self.delete_session(session_id)
+        return len(expired)
+
+
+class RedisRegistry(SessionRegistry):
+    """Registry in a Redis-compatible server, for workers on several machines"""
+
+    name = "redis"
+
+    # Take the lease if it is free, renew it if we hold it; returns the holder,
+    # or nothing when the session (KEYS[2]) isn't registered
+    CLAIM = """
+        if redis.call('EXISTS', KEYS[2]) == 0 then
+            return false
+        end
+        if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+            return ARGV[1]
+        end
+        local owner = redis.call('GET', KEYS[1])
+        if owner == ARGV[1] then
+            redis.call('PEXPIRE', KEYS[1], ARGV[2])
+        end
+        return owner
+    """
+    RELEASE = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('DEL', KEYS[1])
+        end
+        return 0
+    """
+    # KEYS[2] counts the entries trimmed off the front, so sequence numbers
+    # are that count plus the list index
+    APPEND = """
+        local length = redis.call('RPUSH', KEYS[1], unpack(ARGV, 2))
+        local excess = length - tonumber(ARGV[1])
+        if excess > 0 then
+            redis.call('LTRIM', KEYS[1], excess, -1)
+            redis.call('INCRBY', KEYS[2], excess)
+        end
+        return length
+    """
+    READ = """
+        local offset = tonumber(redis.call('GET', KEYS[2]) or '0')
+        local total = offset + redis.call('LLEN', KEYS[1])
+        local start = math.min(math.max(tonumber(ARGV[1]), offset), total)
+        local stop = math.min(start + tonumber(ARGV[2]), total)
+        local items = {}
+        if stop > start then
+            items = redis.call('LRANGE', KEYS[1], start - offset, stop - offset - 1)
+        end
+        return {start, stop, items}
+    """
+
+    def __init__(self, url: str, prefix: str = "interview-lens", max_suggestions: int = 500):
+        import redis
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.max_suggestions = max_suggestions
+        self._claim = self.redis.register_script(self.CLAIM)
+        self._release = self.redis.register_script(self.RELEASE)
+        self._append = self.redis.register_script(self.APPEND)
+        self._read = self.redis.register_script(self.READ)
+
+    def _key(self, kind: str, session_id: str) -> str:
+        return f"{self.prefix}:{kind}:{session_id}"
+
+    def put_session(self, session_id, data):
+        pipe = self.redis.pipeline()
+        pipe.set(self._key("session", session_id), json.dumps(data))
+        pipe.zadd(f"{self.prefix}:created", {session_id: time.time()})
+        pipe.execute()
+
+    def get_session(self, session_id):
+        data = self.redis.get(self._key("session", session_id))
+        return json.loads(data) if data else None
+
+    def set_status(self, session_id, status):
+        data = self.get_session(session_id)
+        if data is not None:
+            data["status"] = status
+            self.redis.set(self._key("session", session_id), json.dumps(data), xx=True)
+
+    def delete_session(self, session_id):
+        self.redis.delete(self._key("session", session_id), self._key("owner", session_id),
+                          self._key("suggestions", session_id), self._key("trimmed", session_id))
+        self.redis.zrem(f"{self.prefix}:created", session_id)
+
+    def claim(self, session_id, worker_id, lease):
+        owner = self._claim(keys=[self._key("owner", session_id), self._key("session", session_id)],
+                            args=[worker_id, int(lease * 1000)])
+        if owner is None:
+            raise UnknownSessionError(session_id)
+        return owner
+
+    def release(self, session_id, worker_id):
+        self._release(keys=[self._key("owner", session_id)], args=[worker_id])
+
+    def owner(self, session_id):
+        return self.redis.get(self._key("owner", session_id))
+
+    def append_suggestions(self, session_id, items):
+        if items:
+            self._append(keys=[self._key("suggestions", session_id), self._key("trimmed", session_id)],
+                         args=[self.max_suggestions] + [json.dumps(item) for item in items])
+
+    def read_suggestions(self, session_id, since, limit):
+        start, end, items = self._read(
+            keys=[self._key("suggestions", session_id), self._key("trimmed", session_id)],
+            args=[since, limit]
+        )
+        return [json.loads(item) for item in items], start, end
+
+    def expire(self, max_age):
+        expired = [session_id for session_id in
+                   self.redis.zrangebyscore(f"{self.prefix}:created", 0, time.time() - max_age)
+                   if not self.redis.exists(self._key("owner", session_id))]
+        for session_id in expired:
+            self.delete_session(session_id)
+        return len(expired)
+
+
+class AsyncRegistry:
+    """Awaitable front for a SessionRegistry
+
+    Shared registries block on sqlite3 or the network, so their calls run
+    on a small thread pool of their own; a slow registry then delays only
+    the requests waiting on it, not every socket on the event loop. The
+    local registry does no I/O and is called directly.
+    """
+
+    def __init__(self, registry: SessionRegistry, workers: int = 4):
+        self.registry = registry
+        self.name = registry.name
+        self.shared = registry.shared
+        self._executor = (ThreadPoolExecutor(max_workers=workers, thread_name_prefix="registry")
+                          if registry.shared else None)
+
+    async def _run(self, method, *args):
+        if self._executor is None:
+            return method(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, method, *args)
+
+    async def put_session(self, session_id: str, data: Dict[str, Any]) -> None:
+        await self._run(self.registry.put_session, session_id, data)
+
+    async def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self.registry.get_session, session_id)
+
+    async def set_status(self, session_id: str, status: str) -> None:
+        await self._run(self.registry.set_status, session_id, status)
+
+    async def delete_session(self, session_id: str) -> None:
+        await self._run(self.registry.delete_session, session_id)
+
+    async def claim(self, session_id: str, worker_id: str, lease: float) -> Optional[str]:
+        return await self._run(self.registry.claim, session_id, worker_id, lease)
+
+    async def release(self, session_id: str, worker_id: str) -> None:
+        await self._run(self.registry.release, session_id, worker_id)
+
+    async def owner(self, session_id: str) -> Optional[str]:
+        return await self._run(self.registry.owner, session_id)
+
+    async def append_suggestions(self, session_id: str, items: List[Dict[str, Any]]) -> None:
+        await self._run(self.registry.append_suggestions, session_id, items)
+
+    async def read_suggestions(self, session_id: str, since: int, limit: int
+                               ) -> Tuple[List[Dict[str, Any]], int, int]:
+        return await self._run(self.registry.read_suggestions, session_id, since, limit)
+
+    async def expire(self, max_age: float) -> int:
+        return await self._run(self.registry.expire, max_age)
+
+
+def create_session_registry(url: Optional[str] = None, max_suggestions: int = 500) -> SessionRegistry:
+    """Build the registry named by `url` or the SESSION_REGISTRY env var"""
+    url = url or os.environ.get("SESSION_REGISTRY", "local")
+    if url == "local":
+        return LocalRegistry()
+    if url.startswith("sqlite:///"):
+        return SQLiteRegistry(url[len("sqlite:///"):], max_suggestions=max_suggestions)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisRegistry(url, max_suggestions=max_suggestions)
+    raise ValueError(f"Unknown session registry: {url}")
@@ -0,0 +1,107 @@
+"""Streaming sample-rate conversion and channel downmixing for int16 PCM.
+
+Transcribe is always opened at 16 kHz mono, while clients declare whatever
+their capture produces (browser tab capture is typically 48 kHz stereo).
+`AudioConverter` downmixes interleaved channels and resamples by the
+rational factor up/down with a polyphase windowed-sinc filter. Filter
+history and the output phase carry over between chunks, so chunk
+boundaries don't produce clicks, and the working buffer is reused.
+"""
+from functools import lru_cache
+from math import gcd
+from typing import Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+@lru_cache(maxsize=32)
+def polyphase_filter(up: int, down: int, taps_per_phase: int = 24, beta: float = 8.0) -> np.ndarray:
+    """Low-pass prototype split into `up` phases, each reversed for a dot product.
+
+    Row p holds the taps applied to the input window ending at the newest
+    sample for outputs that fall on phase p of the upsampled grid.
+    """
+    length = up * taps_per_phase
+    cutoff = 0.5 / max(up, down) * 0.9
+    n = np.arange(length) - (length - 1) / 2
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, beta)
+    h *= up / h.sum()
+    phases = h.reshape(taps_per_phase, up).T
+    return np.ascontiguousarray(phases[:, ::-1], dtype=np.float32)
+
+
+class StreamingResampler:
+    """Stateful rational resampler for mono float32 blocks"""
+
+    def __init__(self, in_rate: int, out_rate: int, taps_per_phase: int = 24):
+        divisor = gcd(in_rate, out_rate)
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.up = out_rate // divisor
+        self.down = in_rate // divisor
+        # Downsampling narrows the passband, so the filter needs proportionally more taps
+        taps_per_phase *= -(-self.down // self.up)
+        self.taps = polyphase_filter(self.up, self.down, taps_per_phase)
+        self.history = taps_per_phase - 1
+
+        # History followed by the current block; grown only when a block is larger
+        self._buffer = np.zeros(self.history + 4096, dtype=np.float32)
+        # Position of the next output on the upsampled grid, relative to the block start
+        self._position = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        n = len(samples)
+        if self.history + n > len(self._buffer):
+            grown = np.zeros(self.history + 2 * n, dtype=np.float32)
+            grown[:self.history] = self._buffer[:self.history]
+            self._buffer = grown
+        buffer = self._buffer
+        buffer[self.history:self.history + n] = samples
+
+        positions = np.arange(self._position, n * self.up, self.down)
+        if len(positions):
+            windows = sliding_window_view(buffer[:self.history + n], self.history + 1)
+            inputs, phases = np.divmod(positions, self.up)
+            out = np.einsum("ij,ij->i", windows[inputs], self.taps[phases])
+            self._position = int(positions[-1]) + self.down - n * self.up
+        else:
+            out = np.zeros(0, dtype=np.float32)
+            self._position -= n * self.up
+
+        buffer[:self.history] = buffer[n:n + self.history]
+        return out
+
+
+class AudioConverter:
+    """Converts interleaved int16 PCM at a declared format to mono `out_rate`"""
+
+    def __init__(self, in_rate: int, channels: int = 1, out_rate: int = 16000):
+        if in_rate <= 0 or channels <= 0:
+            raise ValueError(f"Invalid audio format: {in_rate} Hz, {channels} channels")
+        self.in_rate = in_rate
+        self.channels = channels
+        self.out_rate = out_rate
+        self.resampler = StreamingResampler(in_rate, out_rate) if in_rate != out_rate else None
+
+    @property
+    def format(self) -> Tuple[int, int]:
+        return self.in_rate, self.channels
+
+    @property
+    def passthrough(self) -> bool:
+        return self.resampler is None and self.channels == 1
+
+    def process(self, pcm: np.ndarray) -> np.ndarray:
+        if self.passthrough:
+            return pcm
+
+        if self.channels > 1:
+            frames = len(pcm) // self.channels
+            mono = pcm[:frames * self.channels].reshape(frames, self.channels).mean(axis=1, dtype=np.float32)
+        else:
+            mono = pcm.astype(np.float32)
+
+        if self.resampler is not None:
+            mono = self.resampler.process(mono)
+        return np.clip(np.rint(mono), -32768, 32767).astype(np.int16)
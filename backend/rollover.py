@@ -0,0 +1,430 @@
+"""Transcription streams that outlive any one provider stream.
+
+Transcribe ends a stream after four hours, and a stream can fail at any
+point, which used to end the session's transcript. `SupervisedStream`
+looks like a single stream to the session but moves it to fresh ones:
+
+  rollover  before the current stream is `max_stream_seconds` old a
+            replacement is opened, fed the last `tail_seconds` of audio
+            and then the live audio next to the old stream, and takes over
+            once the old stream has finished its open utterances (or
+            after `overlap_seconds`)
+  failover  when the current stream fails, a replacement is opened at
+            once and fed the audio since the failed stream's last final
+            result, up to `tail_seconds`; partial results the failed
+            stream never finished are retracted
+
+Every stretch of audio is transcribed by exactly one stream: a result is
+kept only if it starts in the time its stream is responsible for. Results
+come out of one `output_stream` with times on the session's audio clock
+and ids that are unique across streams, so the session's metrics carry on
+without a gap or double counting.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from amazon_transcribe.model import Alternative, Result, Transcript, TranscriptEvent
+
+from throttle import backoff_delay
+from transcription import TranscriptionBackend
+
+
+class _Leg:
+    """One provider stream and the stretch of audio it is responsible for"""
+
+    def __init__(self, number: int, stream, offset: float, started: float):
+        self.number = number
+        self.stream = stream
+        # Session audio time of the first audio sent to this stream
+        self.offset = offset
+        self.started = started
+        # Results starting in [owns_from, owns_until) belong to this stream
+        self.owns_from = offset
+        self.owns_until = float("inf")
+        # Session audio time up to which audio has been sent
+        self.sent_until = offset
+        self.catching_up = True
+        # Results of a replacement held back until the handover decides which it keeps
+        self.held: Optional[List[Result]] = None
+        # Partial results passed on and not yet final: id -> session start time
+        self.open: Dict[str, float] = {}
+        # Whether each result id seen so far is kept, decided on its first appearance
+        self.kept: Dict[str, bool] = {}
+        # Session end time of the newest final result passed on
+        self.final_end = offset
+        self.ending = False
+        self.reader: Optional[asyncio.Task] = None
+
+
+class _SupervisedInput:
+    def __init__(self, supervisor: "SupervisedStream"):
+        self._supervisor = supervisor
+
+    async def send_audio_event(self, audio_chunk: Optional[bytes]):
+        await self._supervisor.send_audio(audio_chunk)
+
+    async def end_stream(self):
+        await self._supervisor.end()
+
+
+class SupervisedStream:
+    """A transcription stream for one session, rolled over and restarted as needed
+
+    Audio must be 16-bit mono PCM at `sample_rate`, which is what the
+    session sends. Replacement streams come from `backend` like the first
+    one; a replacement that cannot be opened after `max_restarts` tries
+    ends the output with the error.
+    """
+
+    def __init__(self, backend: TranscriptionBackend, language_code: str = "en-US", sample_rate: int = 16000,
+                 media_encoding: str = "pcm", max_stream_seconds: float = 13800.0, overlap_seconds: float = 30.0,
+                 tail_seconds: float = 5.0, max_restarts: int = 5, clock=time.monotonic):
+        self.backend = backend
+        self.language_code = language_code
+        self.sample_rate = sample_rate
+        self.media_encoding = media_encoding
+        self.max_stream_seconds = max_stream_seconds
+        self.overlap_seconds = overlap_seconds
+        self.tail_seconds = tail_seconds
+        self.max_restarts = max_restarts
+        self.clock = clock
+        self.input_stream = _SupervisedInput(self)
+
+        # Seconds of audio sent so far; result times are on this clock
+        self.audio_seconds = 0.0
+        # Recent audio for replacements to catch up on: (start, end, chunk)
+        self._tail: Deque[Tuple[float, float, bytes]] = deque()
+        self._events: "asyncio.Queue[Any]" = asyncio.Queue()
+        self._current: Optional[_Leg] = None
+        # Replacement overlapping the current stream during a rollover
+        self._next: Optional[_Leg] = None
+        self._replacing: Optional[asyncio.Task] = None
+        # Start of the audio a replacement being opened will be sent, kept in the tail
+        self._replay_hold: Optional[float] = None
+        self._rollover_at = float("inf")
+        self._legs = 0
+        self._error: Optional[Exception] = None
+        self._closed = False
+
+        self.rollovers = 0
+        self.failovers = 0
+        self.dropped_results = 0
+        self.retracted_results = 0
+
+    async def start(self) -> "SupervisedStream":
+        self._current = await self._open(0.0)
+        await self._catch_up(self._current)
+        self._rollover_at = self._current.started + self.max_stream_seconds
+        return self
+
+    # --- Audio ---
+
+    async def send_audio(self, chunk: Optional[bytes]) -> None:
+        if self._error is not None:
+            raise self._error
+        if self._closed or not chunk:
+            return
+        start = self.audio_seconds
+        self.audio_seconds = end = start + len(chunk) / (2 * self.sample_rate)
+        self._tail.append((start, end, chunk))
+        self._trim_tail()
+
+        if self._replacing is None and self.clock() >= self._rollover_at:
+            self._replacing = asyncio.create_task(self._roll_over())
+
+        for leg in (self._current, self._next):
+            # A chunk a catch-up already sent is not sent again
+            if leg is not None and not leg.catching_up and not leg.ending and start >= leg.sent_until:
+                await self._send(leg, start, end, chunk)
+
+    def _trim_tail(self) -> None:
+        keep_from = self.audio_seconds - self.tail_seconds
+        if self._replay_hold is not None:
+            keep_from = min(keep_from, self._replay_hold)
+        for leg in (self._current, self._next):
+            if leg is not None and leg.catching_up:
+                keep_from = min(keep_from, leg.sent_until)
+        while self._tail and self._tail[0][1] <= keep_from:
+            self._tail.popleft()
+
+    def _replay_from(self, since: float) -> float:
+        """Start of the oldest buffered chunk with audio after `since`"""
+        since = max(since, self.audio_seconds - self.tail_seconds)
+        for start, end, _ in self._tail:
+            if end > since:
+                return start
+        return self.audio_seconds
+
+    async def _send(self, leg: _Leg, start: float, end: float, chunk: bytes) -> None:
+        try:
+            await leg.stream.input_stream.send_audio_event(audio_chunk=chunk)
+        except Exception as e:
+            self._on_failure(leg, e)
+            return
+        leg.sent_until = end
+
+    async def _catch_up(self, leg: _Leg) -> None:
+        """Send a new stream the buffered audio it hasn't had, then switch it to live audio"""
+        while True:
+            pending = [item for item in self._tail if item[0] >= leg.sent_until]
+            if not pending:
+                break
+            for start, end, chunk in pending:
+                await self._send(leg, start, end, chunk)
+                if leg.ending:
+                    return
+        # Nothing awaits between the last check and here, so no live chunk is missed
+        leg.catching_up = False
+
+    # --- Stream lifecycle ---
+
+    async def _open(self, offset: float) -> _Leg:
+        """Start a stream for audio from session time `offset`, retrying failures"""
+        self._replay_hold = offset
+        try:
+            for attempt in range(self.max_restarts):
+                try:
+                    stream = await self.backend.start_stream(self.language_code, self.sample_rate,
+                                                             self.media_encoding)
+                    break
+                except Exception as e:
+                    if attempt == self.max_restarts - 1:
+                        raise
+                    print(f"Could not open a transcription stream ({e}), retrying")
+                    await asyncio.sleep(backoff_delay(attempt, base=0.5))
+        finally:
+            self._replay_hold = None
+
+        self._legs += 1
+        leg = _Leg(self._legs, stream, offset, self.clock())
+        leg.reader = asyncio.create_task(self._read(leg))
+        return leg
+
+    async def _roll_over(self) -> None:
+        """Overlap a replacement with the current stream, then hand over"""
+        try:
+            await self._overlap(self._current)
+        finally:
+            # The task stays cancellable by end() until it is done, even after
+            # the handover, since it may still be catching the new stream up
+            if self._replacing is asyncio.current_task():
+                self._replacing = None
+
+    async def _overlap(self, old: _Leg) -> None:
+        try:
+            leg = await self._open(self._replay_from(self.audio_seconds))
+        except Exception as e:
+            print(f"Transcription rollover postponed: {e}")
+            self._rollover_at = self.clock() + self.overlap_seconds
+            return
+        if self._closed or old is not self._current:
+            self._end(leg)
+            return
+
+        leg.held = []
+        self._next = leg
+        await self._catch_up(leg)
+        # A failure of either stream while catching up has already settled the handover
+        if self._next is not leg or self._current is not old:
+            return
+        if not old.open:
+            self._hand_over(old, leg, old.final_end)
+            return
+        # Otherwise the handover happens when the old stream's open utterances finish
+        await asyncio.sleep(self.overlap_seconds)
+        if self._next is leg and self._current is old:
+            self._force_hand_over(old, leg)
+
+    def _force_hand_over(self, old: _Leg, leg: _Leg) -> None:
+        # Open utterances the new stream heard from their start are left to it;
+        # anything older stays with the old stream, which finishes what it heard
+        earliest = min(old.open.values(), default=old.final_end)
+        if earliest >= leg.offset:
+            self._retract(old)
+            self._hand_over(old, leg, earliest)
+        else:
+            self._hand_over(old, leg, self.audio_seconds)
+
+    def _hand_over(self, old: _Leg, leg: _Leg, boundary: float) -> None:
+        old.owns_until = boundary
+        leg.owns_from = boundary
+        held, leg.held = leg.held or [], None
+        self._current, self._next = leg, None
+        self._rollover_at = leg.started + self.max_stream_seconds
+        self.rollovers += 1
+        print(f"Transcription stream {leg.number} took over at {boundary:.1f}s of audio")
+        self._emit(self._accept(leg, held))
+        self._end(old)
+
+    def _on_failure(self, leg: _Leg, error: Optional[Exception]) -> None:
+        if leg.ending or self._closed:
+            return
+        print(f"Transcription stream {leg.number} failed: {error or 'ended unexpectedly'}")
+        leg.ending = True
+        if leg is self._next:
+            # The rollover is retried later; the current stream carries on
+            self._next = None
+            self._rollover_at = self.clock() + self.overlap_seconds
+            return
+        if leg is not self._current:
+            return
+
+        self.failovers += 1
+        self._retract(leg)
+        leg.owns_until = leg.final_end
+        if self._next is not None:
+            if self._next.offset <= leg.final_end:
+                # A rollover was under way and its stream heard everything not
+                # yet final: it takes over straight away, while the rollover
+                # task finishes sending it the buffered audio
+                self._hand_over(leg, self._next, leg.final_end)
+                return
+            # It started after an utterance the failed stream never finished,
+            # so a fresh stream replays that audio instead
+            self._end(self._next)
+            self._next = None
+        if self._replacing is not None:
+            self._replacing.cancel()
+        self._replacing = asyncio.create_task(self._fail_over(leg))
+
+    async def _fail_over(self, old: _Leg) -> None:
+        try:
+            leg = await self._open(self._replay_from(old.final_end))
+        except Exception as e:
+            self._error = e
+            self._events.put_nowait(e)
+            return
+        finally:
+            self._replacing = None
+        if self._closed:
+            self._end(leg)
+            return
+        leg.owns_from = max(old.final_end, leg.offset)
+        self._current = leg
+        self._rollover_at = leg.started + self.max_stream_seconds
+        print(f"Transcription stream {leg.number} replaced stream {old.number} "
+              f"from {leg.offset:.1f}s of audio")
+        await self._catch_up(leg)
+
+    def _end(self, leg: _Leg) -> None:
+        leg.ending = True
+        asyncio.create_task(self._end_input(leg))
+
+    async def _end_input(self, leg: _Leg) -> None:
+        try:
+            await leg.stream.input_stream.end_stream()
+        except Exception:
+            pass
+
+    async def end(self) -> None:
+        """End every stream; results they still send are passed on"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._replacing is not None:
+            self._replacing.cancel()
+        legs = [leg for leg in (self._current, self._next) if leg is not None]
+        for leg in legs:
+            leg.ending = True
+        await asyncio.gather(*(self._end_input(leg) for leg in legs))
+        readers = [leg.reader for leg in legs if leg.reader is not None]
+        if readers:
+            asyncio.create_task(self._finish(readers))
+        else:
+            self._events.put_nowait(None)
+
+    async def _finish(self, readers: List[asyncio.Task]) -> None:
+        await asyncio.wait(readers)
+        self._events.put_nowait(None)
+
+    # --- Results ---
+
+    async def _read(self, leg: _Leg) -> None:
+        error = None
+        try:
+            async for event in leg.stream.output_stream:
+                if isinstance(event, TranscriptEvent):
+                    self._on_event(leg, event)
+        except Exception as e:
+            error = e
+        self._on_failure(leg, error)
+
+    def _on_event(self, leg: _Leg, event: TranscriptEvent) -> None:
+        results = event.transcript.results
+        if leg.held is not None:
+            leg.held.extend(results)
+            return
+        self._emit(self._accept(leg, results))
+
+        # A rollover waits for the old stream to finish its open utterances
+        if leg is self._current and self._next is not None and self._next.held is not None \
+                and not leg.open and not self._next.catching_up:
+            self._hand_over(leg, self._next, leg.final_end)
+
+    def _accept(self, leg: _Leg, results: List[Result]) -> List[Result]:
+        """The results `leg` is responsible for, moved onto the session clock"""
+        accepted = []
+        for result in results:
+            start = leg.offset + (result.start_time or 0.0)
+            end = leg.offset + (result.end_time or 0.0)
+            kept = leg.kept.get(result.result_id)
+            if kept is None:
+                kept = leg.kept[result.result_id] = leg.owns_from <= start < leg.owns_until
+                if not kept:
+                    self.dropped_results += 1
+            if not result.is_partial:
+                leg.kept.pop(result.result_id, None)
+            if not kept:
+                continue
+
+            result_id = f"{leg.number}-{result.result_id}"
+            if result.is_partial:
+                leg.open[result.result_id] = start
+            else:
+                leg.open.pop(result.result_id, None)
+                leg.final_end = max(leg.final_end, end)
+            accepted.append(Result(result_id=result_id, start_time=start, end_time=end,
+                                   is_partial=result.is_partial, alternatives=result.alternatives,
+                                   channel_id=result.channel_id, language_code=result.language_code))
+        return accepted
+
+    def _retract(self, leg: _Leg) -> None:
+        """Replace a stream's unfinished partial results with empty final ones"""
+        retracted = []
+        for result_id, start in leg.open.items():
+            leg.kept[result_id] = False
+            retracted.append(Result(result_id=f"{leg.number}-{result_id}", start_time=start, end_time=start,
+                                    is_partial=False,
+                                    alternatives=[Alternative(transcript="", items=[], entities=[])]))
+        self.retracted_results += len(retracted)
+        leg.open.clear()
+        self._emit(retracted)
+
+    def _emit(self, results: List[Result]) -> None:
+        if results:
+            self._events.put_nowait(TranscriptEvent(transcript=Transcript(results=results)))
+
+    @property
+    def output_stream(self):
+        return self._iter_events()
+
+    async def _iter_events(self):
+        while True:
+            event = await self._events.get()
+            if event is None:
+                return
+            if isinstance(event, Exception):
+                raise event
+            yield event
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "stream": self._current.number if self._current else 0,
+            "audio_seconds": round(self.audio_seconds, 1),
+            "rollovers": self.rollovers,
+            "failovers": self.failovers,
+            "dropped_results": self.dropped_results,
+            "retracted_results": self.retracted_results
+        }
@@ -0,0 +1,114 @@
+"""Decides which camera frames are worth a face analysis call.
+
+Consecutive webcam frames are nearly identical, so analysing every one
+mostly pays for the same answer again. `FrameSampler` compares a tiny
+grayscale thumbnail of each frame with the one last analysed and samples
+a frame only when enough of the thumbnail changed by more than the
+camera's own noise, or when the last result is older than `max_staleness`. A token bucket caps
+the sampled frames at `max_rate` per second either way.
+"""
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+def frame_thumbnail(frame: np.ndarray, size: Tuple[int, int] = (32, 24)) -> np.ndarray:
+    """Grayscale float32 thumbnail of a BGR or grayscale frame"""
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if cv2 is not None else frame.mean(axis=2)
+    if cv2 is not None:
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    # Block averages without OpenCV
+    width, height = size
+    rows = frame.shape[0] // height * height
+    cols = frame.shape[1] // width * width
+    blocks = frame[:rows, :cols].reshape(height, rows // height, width, cols // width)
+    return blocks.mean(axis=(1, 3)).astype(np.float32)
+
+
+class FrameSampler:
+    """Change-driven frame sampling with a staleness bound and a rate budget"""
+
+    def __init__(self, change_threshold: float = 0.05, pixel_delta: float = 10.0,
+                 max_staleness: float = 2.0, max_rate: float = 2.0, noise_factor: float = 4.0,
+                 size: Tuple[int, int] = (32, 24), clock: Callable[[], float] = time.monotonic):
+        # Share of thumbnail pixels that must move by more than pixel_delta levels
+        self.change_threshold = change_threshold
+        self.pixel_delta = pixel_delta
+        self.max_staleness = max_staleness
+        self.max_rate = max_rate
+        self.noise_factor = noise_factor
+        self.size = size
+        self.clock = clock
+
+        self._reference: Optional[np.ndarray] = None
+        self._previous: Optional[np.ndarray] = None
+        self._reference_time = 0.0
+        # Mean frame-to-frame change of a static scene in gray levels, i.e. sensor noise
+        self.noise = 0.0
+        self._tokens = 1.0
+        self._refilled = None
+
+        self.seen = 0
+        self.sampled = 0
+        # Frames passed over because nothing changed, and frames that were due
+        # but arrived with the rate budget spent
+        self.unchanged = 0
+        self.over_budget = 0
+        self.last_change = 0.0
+        # Whether the last sampled frame was taken for a change rather than staleness
+        self.scene_changed = False
+
+    def should_sample(self, frame: np.ndarray, now: Optional[float] = None) -> bool:
+        now = self.clock() if now is None else now
+        thumb = frame_thumbnail(frame, self.size)
+        self.seen += 1
+
+        if self._refilled is not None:
+            self._tokens = min(1.0, self._tokens + (now - self._refilled) * self.max_rate)
+        self._refilled = now
+
+        if self._previous is not None:
+            step = float(np.mean(np.abs(thumb - self._previous)))
+            # Falls quickly and rises slowly, so motion doesn't read as noise
+            self.noise += (0.2 if step < self.noise else 0.01) * (step - self.noise)
+        self._previous = thumb
+
+        if self._reference is None:
+            changed = due = True
+        else:
+            pixel_delta = max(self.pixel_delta, self.noise_factor * self.noise)
+            self.last_change = float(np.mean(np.abs(thumb - self._reference) > pixel_delta))
+            changed = self.last_change > self.change_threshold
+            due = changed or now - self._reference_time >= self.max_staleness
+
+        if not due:
+            self.unchanged += 1
+            return False
+        if self._tokens < 1.0:
+            self.over_budget += 1
+            return False
+
+        self.scene_changed = changed
+        self._tokens -= 1.0
+        self._reference = thumb
+        self._reference_time = now
+        self.sampled += 1
+        return True
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "seen": self.seen,
+            "sampled": self.sampled,
+            "unchanged": self.unchanged,
+            "over_budget": self.over_budget,
+            "noise": round(self.noise, 4),
+            "last_change": round(self.last_change, 4)
+        }
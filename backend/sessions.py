@@ -0,0 +1,309 @@
+"""Bounded in-memory session registry with TTL and LRU eviction, plus the
+per-session append-only suggestion logs."""
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+
+class SessionLimitError(Exception):
+    """Raised when the store is full and no completed session can be evicted"""
+
+
+def estimate_size(obj: Any, _depth: int = 0) -> int:
+    """Rough deep size in bytes of a model, container or scalar"""
+    size = sys.getsizeof(obj)
+    if _depth > 4:
+        return size
+    if isinstance(obj, dict):
+        return size + sum(estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, deque)):
+        return size + sum(estimate_size(v, _depth + 1) for v in obj)
+    if hasattr(obj, "__dict__") and not isinstance(obj, type):
+        return size + estimate_size(obj.__dict__, _depth + 1)
+    return size
+
+
+class SuggestionLog:
+    """Append-only suggestion history for one session.
+
+    Every entry gets a sequence number that never changes, so clients can
+    poll with `since` cursors and the range [start, end) of a response
+    identifies its content. At most `max_in_memory` entries are kept in
+    memory; older ones (and ones older than `spill_after` seconds) move to
+    an append-only JSON-lines file when `spill_path` is set, or are dropped.
+
+    Spilled entries are buffered by `append` and written by `flush` on a
+    worker thread, and `read` fetches them from the file the same way, so
+    a slow disk never stalls the event loop. Their byte offsets are kept
+    in memory.
+    """
+
+    def __init__(self, max_in_memory: int, spill_path: Optional[str] = None,
+                 spill_after: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.max_in_memory = max_in_memory
+        self.spill_path = spill_path
+        self.spill_after = spill_after
+        self.clock = clock
+
+        self._entries: Deque[Tuple[float, Dict[str, Any]]] = deque()
+        self.next_seq = 0
+        self._memory_start = 0
+        # Byte offset of every spilled entry, indexed by seq - _spill_start
+        self._spill_start = 0
+        self._spill_offsets: List[int] = []
+        # Encoded entries not yet written, and the file size once they are
+        self._pending: List[bytes] = []
+        self._spill_size = 0
+        self._flush_lock = asyncio.Lock()
+        self._flushing = False
+        self._discarded = False
+
+    @property
+    def first_seq(self) -> int:
+        """Oldest sequence number still readable"""
+        return self._spill_start if self._spill_offsets else self._memory_start
+
+    def __len__(self) -> int:
+        return self.next_seq - self.first_seq
+
+    def append(self, entry: Dict[str, Any]) -> Tuple[int, int]:
+        """Add an entry, returning (its seq, change in in-memory bytes)"""
+        now = self.clock()
+        self._entries.append((now, entry))
+        seq = self.next_seq
+        self.next_seq += 1
+        delta = estimate_size(entry)
+
+        while self._entries and (
+            len(self._entries) > self.max_in_memory
+            or (self.spill_after is not None and now - self._entries[0][0] > self.spill_after)
+        ):
+            _, old = self._entries.popleft()
+            delta -= estimate_size(old)
+            self._spill(self._memory_start, old)
+            self._memory_start += 1
+        return seq, delta
+
+    def _spill(self, seq: int, entry: Dict[str, Any]) -> None:
+        if self.spill_path is None:
+            return
+        if not self._spill_offsets:
+            self._spill_start = seq
+        line = json.dumps(entry, separators=(",", ":")).encode("utf-8") + b"\n"
+        self._spill_offsets.append(self._spill_size)
+        self._spill_size += len(line)
+        self._pending.append(line)
+
+    async def flush(self) -> None:
+        """Write buffered spilled entries to the file"""
+        async with self._flush_lock:
+            if not self._pending or self._discarded:
+                return
+            data, self._pending = b"".join(self._pending), []
+            self._flushing = True
+            try:
+                await asyncio.to_thread(self._write, data)
+            finally:
+                self._flushing = False
+            if self._discarded:
+                # Discarded while writing; the write recreated the file
+                await asyncio.to_thread(self._remove)
+
+    def _write(self, data: bytes) -> None:
+        with open(self.spill_path, "ab") as f:
+            f.write(data)
+
+    def _read_spilled(self, offset: int, count: int) -> List[Dict[str, Any]]:
+        with open(self.spill_path, "rb") as f:
+            f.seek(offset)
+            return [json.loads(f.readline()) for _ in range(count)]
+
+    def _remove(self) -> None:
+        try:
+            os.remove(self.spill_path)
+        except OSError:
+            pass
+
+    def window(self, since: int, limit: int) -> Tuple[int, int]:
+        """The [start, end) sequence range a read from `since` returns"""
+        start = min(max(since, self.first_seq), self.next_seq)
+        return start, min(start + limit, self.next_seq)
+
+    async def read(self, since: int, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Entries from `since` on (at most `limit`) and the next cursor"""
+        start, end = self.window(since, limit)
+
+        # Taken before waiting on the file, while the in-memory part is still in memory
+        memory_from = max(start, self._memory_start)
+        memory_items = [self._entries[i][1]
+                        for i in range(memory_from - self._memory_start, end - self._memory_start)]
+
+        spill_end = min(end, self._memory_start)
+        if start >= spill_end:
+            return memory_items, end
+        offset = self._spill_offsets[start - self._spill_start]
+        await self.flush()
+        items = await asyncio.to_thread(self._read_spilled, offset, spill_end - start)
+        return items + memory_items, end
+
+    def discard(self) -> None:
+        """Delete the spill file, if any"""
+        if self.spill_path and self._spill_offsets and not self._discarded:
+            self._discarded = True
+            self._pending = []
+            if not self._flushing:
+                # Unlinking is quick; only writes and reads wait on the disk
+                self._remove()
+
+
+class SessionEntry:
+    """A session plus the state the server keeps for it"""
+
+    def __init__(self, session: Any, suggestions: SuggestionLog, now: float):
+        self.session = session
+        self.suggestions = suggestions
+        self.created_at = now
+        self.last_access = now
+        self.connected = False
+        self.size = estimate_size(session)
+
+    def add_suggestion(self, suggestion: Dict[str, Any]) -> int:
+        """Append a serialized suggestion, returning the change in estimated bytes"""
+        _, delta = self.suggestions.append(suggestion)
+        self.size += delta
+        return delta
+
+
+class SessionStore:
+    """Holds analysis sessions with idle/absolute TTLs and a size cap.
+
+    Sessions that have gone quiet for `idle_ttl` seconds or are older than
+    `absolute_ttl` are dropped by `sweep`, which `run_sweeper` calls
+    periodically. Neither applies while a session has an open WebSocket:
+    a live interview past `absolute_ttl` keeps its history and is dropped
+    by the first sweep after its stream completes. When the store is full,
+    the least recently used completed session is evicted to make room.
+    """
+
+    def __init__(self, max_sessions: int = 10000, max_suggestions: int = 500,
+                 idle_ttl: float = 30 * 60, absolute_ttl: float = 6 * 60 * 60,
+                 sweep_interval: float = 60.0, spill_dir: Optional[str] = None,
+                 spill_after: float = 60 * 60, clock: Callable[[], float] = time.monotonic):
+        self.max_sessions = max_sessions
+        self.max_suggestions = max_suggestions
+        self.spill_dir = spill_dir
+        self.spill_after = spill_after
+        self.idle_ttl = idle_ttl
+        self.absolute_ttl = absolute_ttl
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+
+        self._entries: Dict[str, SessionEntry] = {}
+        # Completed sessions in least-recently-used order, the eviction candidates
+        self._completed: "OrderedDict[str, None]" = OrderedDict()
+        self._bytes = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[SessionEntry]:
+        return iter(list(self._entries.values()))
+
+    def create(self, session: Any) -> SessionEntry:
+        if len(self._entries) >= self.max_sessions:
+            if not self._completed:
+                raise SessionLimitError(f"Session limit of {self.max_sessions} reached")
+            oldest, _ = self._completed.popitem(last=False)
+            self._drop(oldest)
+            self.evicted += 1
+
+        spill_path = None
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            spill_path = os.path.join(self.spill_dir, f"{session.session_id}.jsonl")
+        log = SuggestionLog(self.max_suggestions, spill_path,
+                            self.spill_after if spill_path else None, self.clock)
+        entry = SessionEntry(session, log, self.clock())
+        self._entries[session.session_id] = entry
+        self._bytes += entry.size
+        return entry
+
+    def get(self, session_id: str) -> Optional[SessionEntry]:
+        entry = self._entries.get(session_id)
+        if entry is not None:
+            entry.last_access = self.clock()
+            if session_id in self._completed:
+                self._completed.move_to_end(session_id)
+        return entry
+
+    def remove(self, session_id: str) -> Optional[SessionEntry]:
+        self._completed.pop(session_id, None)
+        return self._drop(session_id)
+
+    def _drop(self, session_id: str) -> Optional[SessionEntry]:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+            entry.suggestions.discard()
+        return entry
+
+    def attach(self, session_id: str) -> None:
+        """Mark a session as having an open stream, exempt from idle expiry"""
+        entry = self.get(session_id)
+        if entry is not None:
+            entry.connected = True
+
+    def complete(self, session_id: str) -> None:
+        """Mark a session's stream as finished, making it evictable"""
+        entry = self.get(session_id)
+        if entry is not None:
+            entry.connected = False
+            entry.session.status = "completed"
+            self._completed[session_id] = None
+            self._completed.move_to_end(session_id)
+
+    async def add_suggestions(self, session_id: str, suggestions: List[Dict[str, Any]]) -> None:
+        entry = self._entries.get(session_id)
+        if entry is not None:
+            for suggestion in suggestions:
+                self._bytes += entry.add_suggestion(suggestion)
+            await entry.suggestions.flush()
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop expired sessions, returning how many were removed"""
+        now = self.clock() if now is None else now
+        expired = [
+            session_id for session_id, entry in self._entries.items()
+            if not entry.connected
+            and (now - entry.created_at > self.absolute_ttl or now - entry.last_access > self.idle_ttl)
+        ]
+        for session_id in expired:
+            self.remove(session_id)
+        self.expired += len(expired)
+        return len(expired)
+
+    async def run_sweeper(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            removed = self.sweep()
+            if removed:
+                print(f"Session sweeper removed {removed} expired sessions")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._entries),
+            "connected_sessions": sum(1 for e in self._entries.values() if e.connected),
+            "completed_sessions": len(self._completed),
+            "approx_bytes": self._bytes,
+            "evicted": self.evicted,
+            "expired": self.expired
+        }
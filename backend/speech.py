@@ -0,0 +1,276 @@
+"""Shared speech metric building blocks used by the API and the desktop apps."""
+import re
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_FILLERS = ('um', 'uh', 'er', 'ah', 'like', 'you know', 'sort of', 'kind of')
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+# Same tokens, matched on the original text so offsets line up with it
+_ANYCASE_TOKEN_PATTERN = re.compile(r"[a-z0-9']+", re.IGNORECASE)
+
+# Trie key marking the end of a filler phrase; tokens are never empty
+_PHRASE_END = ""
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with punctuation stripped"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class FillerMatcher:
+    """Counts filler words and phrases in a single pass over transcript tokens.
+
+    The lexicon is compiled into a token trie. Matching walks the tokens once,
+    taking the longest filler that starts at each position and skipping past
+    it, so "like" never matches inside "likely" and "you know" is one filler.
+    The cost per token depends on the longest phrase, not the lexicon size.
+    """
+
+    def __init__(self, lexicon: Iterable[str] = DEFAULT_FILLERS):
+        self._trie: Dict[str, dict] = {}
+        phrases = []
+        for entry in lexicon:
+            words = tokenize(entry)
+            if not words:
+                continue
+            phrase = " ".join(words)
+            node = self._trie
+            for word in words:
+                node = node.setdefault(word, {})
+            if _PHRASE_END not in node:
+                node[_PHRASE_END] = phrase
+                phrases.append(phrase)
+
+        self.phrases: Tuple[str, ...] = tuple(phrases)
+        self.max_length = max((len(p.split()) for p in phrases), default=0)
+
+    def match(self, tokens: List[str], start: int = 0) -> List[Tuple[int, int, str]]:
+        """Non-overlapping (start, end, phrase) filler matches from `start` on"""
+        trie = self._trie
+        matches = []
+        n = len(tokens)
+        i = start
+        while i < n:
+            node = trie.get(tokens[i])
+            if node is None:
+                i += 1
+                continue
+
+            end, phrase = (i + 1, node[_PHRASE_END]) if _PHRASE_END in node else (None, None)
+            j = i + 1
+            while j < n:
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                j += 1
+                if _PHRASE_END in node:
+                    end, phrase = j, node[_PHRASE_END]
+
+            if end is None:
+                i += 1
+            else:
+                matches.append((i, end, phrase))
+                i = end
+        return matches
+
+    def count(self, text: str) -> Tuple[int, Dict[str, int]]:
+        """Word count and per-filler counts for `text`"""
+        tokens = tokenize(text)
+        counts: Dict[str, int] = {}
+        for _, _, phrase in self.match(tokens):
+            counts[phrase] = counts.get(phrase, 0) + 1
+        return len(tokens), counts
+
+
+@lru_cache(maxsize=64)
+def _compile_fillers(lexicon: Tuple[str, ...]) -> FillerMatcher:
+    return FillerMatcher(lexicon)
+
+
+def compile_fillers(lexicon: Optional[Iterable[str]] = None) -> FillerMatcher:
+    """Shared compiled matcher for a filler lexicon (the default one if None)"""
+    return _compile_fillers(tuple(DEFAULT_FILLERS if lexicon is None else lexicon))
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    # Binary search with startswith, only comparing the undecided part
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if b.startswith(a[lo:mid], lo):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class UtteranceTracker:
+    """Incremental word and filler accounting for one transcript result.
+
+    Streaming transcription re-sends a growing hypothesis for the same
+    utterance many times. Only the tokens after the part shared with the
+    previous hypothesis are re-tokenized and re-matched, and `update` returns
+    the change in word and filler counts rather than absolute totals.
+    """
+
+    def __init__(self, fillers: FillerMatcher):
+        self.fillers = fillers
+        self.text = ""
+        self.tokens: List[str] = []
+        self.token_ends: List[int] = []
+        self.matches: List[Tuple[int, int, str]] = []
+
+    def update(self, text: str) -> Tuple[int, Dict[str, int]]:
+        """Replace the hypothesis with `text`, returning (word delta, filler deltas)"""
+        old_text = self.text
+        common = len(old_text) if text.startswith(old_text) else _common_prefix_length(old_text, text)
+
+        # Tokens ending strictly inside the shared prefix can't have changed
+        keep = bisect_left(self.token_ends, common)
+        resume_char = self.token_ends[keep - 1] if keep else 0
+
+        old_count = len(self.tokens)
+        del self.tokens[keep:]
+        del self.token_ends[keep:]
+        for m in _ANYCASE_TOKEN_PATTERN.finditer(text, resume_char):
+            self.tokens.append(m.group().lower())
+            self.token_ends.append(m.end())
+        self.text = text
+
+        # A match only looks `max_length` tokens ahead, so matches that finish
+        # their lookahead inside the kept tokens are still valid
+        deltas: Dict[str, int] = {}
+        lookahead = self.fillers.max_length
+        while self.matches and self.matches[-1][0] + lookahead > keep:
+            _, _, phrase = self.matches.pop()
+            deltas[phrase] = deltas.get(phrase, 0) - 1
+
+        resume = max(self.matches[-1][1] if self.matches else 0, keep - lookahead + 1, 0)
+        for match in self.fillers.match(self.tokens, resume):
+            self.matches.append(match)
+            deltas[match[2]] = deltas.get(match[2], 0) + 1
+
+        return len(self.tokens) - old_count, {k: v for k, v in deltas.items() if v}
+
+
+class TranscriptAccumulator:
+    """Tracks in-flight transcript results by result id.
+
+    Partial results update their utterance's tracker in place; the final
+    result reconciles it one last time and releases it.
+    """
+
+    def __init__(self, fillers: FillerMatcher):
+        self.fillers = fillers
+        self._utterances: Dict[str, UtteranceTracker] = {}
+
+    def update(self, result_id: str, text: str, is_partial: bool) -> Tuple[int, Dict[str, int]]:
+        """Apply a partial or final result, returning (word delta, filler deltas)"""
+        tracker = self._utterances.get(result_id)
+        if tracker is None:
+            tracker = self._utterances[result_id] = UtteranceTracker(self.fillers)
+
+        deltas = tracker.update(text)
+        if not is_partial:
+            del self._utterances[result_id]
+        return deltas
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._utterances)
+
+
+class WordRateCounter:
+    """Words-per-minute over several sliding windows at once.
+
+    Word counts are kept in a ring of fixed-width time buckets with a running
+    sum per window, so adding words, expiring old buckets and querying a
+    rate are all constant time no matter how fast or how long someone talks.
+    """
+
+    def __init__(self, windows: Iterable[float] = (10, 60), resolution: float = 1.0,
+                 clock: Callable[[], float] = time.time):
+        if resolution <= 0:
+            raise ValueError("resolution must be positive")
+
+        self.resolution = resolution
+        self.clock = clock
+        self.windows = tuple(sorted(set(windows)))
+        if not self.windows:
+            raise ValueError("at least one window is required")
+
+        self._window_buckets = {w: max(1, int(round(w / resolution))) for w in self.windows}
+        self._size = max(self._window_buckets.values())
+        self._ring: List[int] = [0] * self._size
+        self._sums: Dict[float, int] = {w: 0 for w in self.windows}
+        self._head: Optional[int] = None
+
+        self.total = 0
+        self.start_time = clock()
+
+    def _advance(self, now: float) -> None:
+        bucket = int(now // self.resolution)
+        if self._head is None:
+            self._head = bucket
+            return
+
+        steps = bucket - self._head
+        if steps <= 0:
+            return
+
+        if steps >= self._size:
+            # Everything has expired, start over from an empty ring
+            self._ring = [0] * self._size
+            self._sums = {w: 0 for w in self.windows}
+            self._head = bucket
+            return
+
+        ring, size = self._ring, self._size
+        for _ in range(steps):
+            self._head += 1
+            for w, n in self._window_buckets.items():
+                self._sums[w] -= ring[(self._head - n) % size]
+            ring[self._head % size] = 0
+
+    def add(self, count: int, now: Optional[float] = None) -> None:
+        """Record `count` words spoken at `now` (negative counts retract words)"""
+        if not count:
+            return
+        now = self.clock() if now is None else now
+        self._advance(now)
+
+        self._ring[self._head % self._size] += count
+        for w in self.windows:
+            self._sums[w] += count
+        self.total += count
+
+    def count(self, window: float, now: Optional[float] = None) -> int:
+        """Number of words in the trailing `window` seconds"""
+        self._advance(self.clock() if now is None else now)
+        return max(self._sums[window], 0)
+
+    def rate(self, window: float, now: Optional[float] = None) -> float:
+        """Words per minute over the trailing `window` seconds"""
+        now = self.clock() if now is None else now
+        words = self.count(window, now)
+        if not words:
+            return 0.0
+
+        minutes = min(window, now - self.start_time) / 60
+        return (words / minutes) if minutes > 0 else 0.0
+
+    def session_rate(self, now: Optional[float] = None) -> float:
+        """Words per minute since the counter was created"""
+        now = self.clock() if now is None else now
+        minutes = (now - self.start_time) / 60
+        return (max(self.total, 0) / minutes) if minutes > 0 else 0.0
+
+    def rates(self, now: Optional[float] = None) -> Dict[str, float]:
+        """Rates for every configured window plus the whole session"""
+        now = self.clock() if now is None else now
+        rates = {f"{w:g}s": self.rate(w, now) for w in self.windows}
+        rates["session"] = self.session_rate(now)
+        return rates
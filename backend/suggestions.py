@@ -0,0 +1,144 @@
+"""Per-session suggestion state machine and metric delta tracking."""
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class SuggestionRule:
+    """Raise `suggestion` when `metric` rises above `rise`.
+
+    The rule stays active until the metric drops below `fall`, so a value
+    hovering around the threshold doesn't toggle the suggestion on and off.
+    With `below=True` the directions flip: the rule triggers when the metric
+    drops below `rise` and clears once it climbs back above `fall`.
+    """
+
+    def __init__(self, category: str, metric: str, rise: float, fall: float,
+                 suggestion: str, confidence: float, below: bool = False):
+        if (fall < rise) if below else (fall > rise):
+            raise ValueError(f"{category}: fall threshold must not be past the rise threshold")
+
+        self.category = category
+        self.metric = metric
+        self.rise = rise
+        self.fall = fall
+        self.suggestion = suggestion
+        self.confidence = confidence
+        self.below = below
+
+    def triggers(self, value: float) -> bool:
+        return value < self.rise if self.below else value > self.rise
+
+    def clears(self, value: float) -> bool:
+        return value > self.fall if self.below else value < self.fall
+
+
+DEFAULT_RULES = (
+    SuggestionRule("speech_rate", "speech_rate", rise=160, fall=145,
+                   suggestion="Consider slowing down your speech rate", confidence=0.9),
+    SuggestionRule("filler_words", "filler_percentage", rise=10, fall=8,
+                   suggestion="Try to reduce filler word usage", confidence=0.85),
+)
+
+# Evaluated against AcousticMetrics
+ACOUSTIC_RULES = (
+    SuggestionRule("background_noise", "snr_db", rise=15, fall=18, below=True,
+                   suggestion="Consider reducing background noise", confidence=0.8),
+    SuggestionRule("clipping", "clipping_percentage", rise=1.0, fall=0.5,
+                   suggestion="Your audio is distorting, lower your input gain or move back from the microphone",
+                   confidence=0.9),
+    SuggestionRule("volume", "speech_level_db", rise=-35, fall=-32, below=True,
+                   suggestion="Speak up or move closer to the microphone", confidence=0.75),
+    SuggestionRule("monotone", "pitch_variability", rise=1.5, fall=2.0, below=True,
+                   suggestion="Vary your pitch to keep listeners engaged", confidence=0.7),
+    SuggestionRule("long_pause", "current_pause", rise=5.0, fall=0.5,
+                   suggestion="Long pause detected, try to keep your answer flowing", confidence=0.6),
+)
+
+
+# Evaluated against VisualMetrics
+VIDEO_RULES = (
+    SuggestionRule("eye_contact", "eye_contact", rise=40, fall=55, below=True,
+                   suggestion="Look into the camera more to keep eye contact", confidence=0.8),
+    SuggestionRule("confidence", "confidence", rise=35, fall=45, below=True,
+                   suggestion="Relax and let your expression show some enthusiasm", confidence=0.6),
+)
+
+
+class SuggestionGate:
+    """Decides when each rule's suggestion is (re-)emitted for one session.
+
+    A rule emits once when it becomes active, then at most once every
+    `reemit_interval` seconds while it stays active, and goes quiet again
+    once its metric moves back past the falling threshold.
+    """
+
+    def __init__(self, rules: Iterable[SuggestionRule] = DEFAULT_RULES,
+                 reemit_interval: float = 15.0, clock: Callable[[], float] = time.monotonic):
+        self.rules = tuple(rules)
+        self.reemit_interval = reemit_interval
+        self.clock = clock
+        self._active: Dict[str, bool] = {rule.category: False for rule in self.rules}
+        self._last_emitted: Dict[str, float] = {}
+
+    def observe(self, metrics: Any, now: Optional[float] = None) -> List[Tuple[SuggestionRule, float]]:
+        """Feed the latest metrics, returning the (rule, value) pairs to emit"""
+        now = self.clock() if now is None else now
+        emit = []
+        for rule in self.rules:
+            value = getattr(metrics, rule.metric)
+            category = rule.category
+            if value is None:
+                # Not measurable yet, e.g. pitch before enough voiced audio
+                continue
+
+            if not self._active[category]:
+                if rule.triggers(value):
+                    self._active[category] = True
+                    emit.append((rule, value))
+            elif rule.clears(value):
+                self._active[category] = False
+            elif now - self._last_emitted.get(category, now) >= self.reemit_interval:
+                emit.append((rule, value))
+
+        for rule, _ in emit:
+            self._last_emitted[rule.category] = now
+        return emit
+
+    def is_active(self, category: str) -> bool:
+        return self._active.get(category, False)
+
+
+class MetricsDeltaTracker:
+    """Reduces successive metric snapshots to the fields that changed.
+
+    Numbers only count as changed once they move by more than their
+    tolerance from the last value sent, and dict fields are diffed per key.
+    """
+
+    def __init__(self, tolerances: Optional[Dict[str, float]] = None, default_tolerance: float = 0.05):
+        self.tolerances = tolerances or {}
+        self.default_tolerance = default_tolerance
+        self._sent: Dict[str, Any] = {}
+
+    def delta(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        changes: Dict[str, Any] = {}
+        for key, value in values.items():
+            previous = self._sent.get(key)
+
+            if isinstance(value, dict):
+                previous = previous or {}
+                changed = {k: v for k, v in value.items() if self._differs(key, previous.get(k), v)}
+                if changed:
+                    changes[key] = changed
+                    self._sent[key] = {**previous, **changed}
+            elif self._differs(key, previous, value):
+                changes[key] = value
+                self._sent[key] = value
+        return changes
+
+    def _differs(self, key: str, previous: Any, value: Any) -> bool:
+        if previous is None or value is None:
+            return previous is not value
+        if isinstance(value, float) or isinstance(previous, float):
+            return abs(value - previous) > self.tolerances.get(key, self.default_tolerance)
+        return value != previous
@@ -3,8 +3,6 @@ import soundcard as sc
 import numpy as np
 import asyncio
 import time
-from collections import deque
-from amazon_transcribe.client import TranscribeStreamingClient
 from amazon_transcribe.handlers import TranscriptResultStreamHandler
 from amazon_transcribe.model import TranscriptEvent
 import tkinter as tk
@@ -12,6 +10,8 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.pyplot as plt
 import warnings
 from dotenv import load_dotenv
+from speech import TranscriptAccumulator, WordRateCounter, compile_fillers
+from transcription import create_transcription_backend
 
 load_dotenv()
 
@@ -25,46 +25,26 @@ filler_percentages = []
 
 class SpeechMetrics:
     def __init__(self, window_seconds=60):
-        self.filler_words = {
-            'um': 0, 'uh': 0, 'er': 0, 'ah': 0, 'like': 0,
-            'you know': 0, 'sort of': 0, 'kind of': 0
-        }
+        self.fillers = compile_fillers()
+        self.filler_words = dict.fromkeys(self.fillers.phrases, 0)
+        self.transcripts = TranscriptAccumulator(self.fillers)
         self.total_words = 0
         self.window_seconds = window_seconds
-        self.word_timestamps = deque()
         self.start_time = time.time()
+        self.word_rate = WordRateCounter(windows=(window_seconds,))
 
-    def add_words(self, text: str):
-        current_time = time.time()
-        words = text.lower().split()
+    def update_result(self, result_id, text, is_partial):
+        """Apply the change in a partial or final transcript result to the counts."""
+        words, fillers = self.transcripts.update(result_id, text, is_partial)
 
-        self.total_words += len(words)  # Update total words count
-
-        # Record timestamps for each word to calculate speech rate
-        for _ in words:
-            self.word_timestamps.append(current_time)
-
-        # Remove words that are outside the time window for speech rate calculation
-        while (self.word_timestamps and
-               current_time - self.word_timestamps[0] > self.window_seconds):
-            self.word_timestamps.popleft()
-
-        # Count filler words
-        for filler in self.filler_words:
-            self.filler_words[filler] += text.lower().count(filler)
+        self.total_words += words
+        self.word_rate.add(words)
+        for filler, count in fillers.items():
+            self.filler_words[filler] += count
 
     def get_speech_rate(self):
-        """Calculate words per minute based on the timestamps within the window."""
-        if not self.word_timestamps:
-            return 0
-
-        current_time = time.time()
-        window_words = len([t for t in self.word_timestamps
-                            if current_time - t <= self.window_seconds])
-
-        minutes = min(self.window_seconds / 60,
-                      (current_time - self.start_time) / 60)
-        return ((window_words / minutes)/10) if minutes > 0 else 0
+        """Calculate words per minute based on the words recorded within the window."""
+        return self.word_rate.rate(self.window_seconds) / 10
 
     def get_filler_percentage(self):
         """Calculate the percentage of filler words out of total words."""
@@ -82,12 +62,13 @@ class MyEventHandler(TranscriptResultStreamHandler):
         results = transcript_event.transcript.results
 
         for result in results:
-            for alt in result.alternatives:
+            # Only the best alternative is counted
+            for alt in result.alternatives[:1]:
                 words = alt.transcript.strip().split()
                 current_words = set(words)
 
-                # Process words immediately, even if they are partial (not final)
-                metrics.add_words(alt.transcript)
+                # Partials only contribute what changed since the previous one
+                metrics.update_result(result.result_id, alt.transcript, result.is_partial)
 
                 # Display live words on the console
                 new_words = current_words - self.last_printed_words
@@ -160,10 +141,9 @@ async def capture_audio(stream):
     await audio_stream()
 
 async def main():
-    client = TranscribeStreamingClient(region="us-west-2")
-    stream = await client.start_stream_transcription(
+    stream = await create_transcription_backend().start_stream(
         language_code="en-US",
-        media_sample_rate_hz=16000,
+        sample_rate=16000,
         media_encoding="pcm"
     )
     handler = MyEventHandler(stream.output_stream)
@@ -6,11 +6,14 @@ import base64
 import json
 import requests
 from datetime import datetime
+from protocol import AUDIO_FORMAT_BINARY, pack_audio_frame
 
 class AudioStreamer:
-    def __init__(self, server_url="http://localhost:8000", websocket_url="ws://localhost:8000"):
+    def __init__(self, server_url="http://localhost:8000", websocket_url="ws://localhost:8000",
+                 audio_format=AUDIO_FORMAT_BINARY):
         self.server_url = server_url
         self.websocket_url = websocket_url
+        self.audio_format = audio_format
         self.session_id = None
         
         # Audio recording settings
@@ -41,7 +44,18 @@ class AudioStreamer:
             if isinstance(message, str):
                 try:
                     suggestions = json.loads(message)
-                    if suggestions:
+                    if isinstance(suggestions, dict):
+                        # Metric updates only carry the fields that changed
+                        if suggestions.get("type") == "metrics":
+                            print("\nMetrics update:")
+                            for key, value in suggestions.get("delta", {}).items():
+                                print(f"- {key}: {value}")
+                        # Audio still queued for transcription on the server
+                        elif suggestions.get("type") == "ingest":
+                            lag = suggestions.get("delta", {}).get("lag_seconds")
+                            if lag is not None:
+                                print(f"\nServer ingest lag: {lag:.2f}s")
+                    elif suggestions:
                         print("\nProcessed suggestions:")
                         for suggestion in suggestions:
                             print("\nSuggestion details:")
@@ -49,7 +63,7 @@ class AudioStreamer:
                             print(f"- Suggestion: {suggestion.get('suggestion', 'N/A')}")
                             print(f"- Confidence: {suggestion.get('confidence', 'N/A')}")
                             
-                            if 'speech_metrics' in suggestion:
+                            if suggestion.get('speech_metrics'):
                                 metrics = suggestion['speech_metrics']
                                 print("\nSpeech metrics:")
                                 print(f"- Speech rate: {metrics.get('speech_rate', 0):.1f} words/min")
@@ -81,6 +95,7 @@ class AudioStreamer:
             with self.mic.recorder(samplerate=self.samplerate, channels=1, blocksize=self.chunk_size) as recorder:
                 print("\n🎤 Listening... Press Ctrl+C to stop.")
                 print("Waiting for speech analysis results...")
+                sequence = 0
                 while True:
                     # Record audio chunk
                     data = recorder.record(self.chunk_size)
@@ -90,17 +105,24 @@ class AudioStreamer:
                     # Convert float32 to int16 PCM correctly
                     data = np.clip(data, -1, 1)
                     audio_chunk = (data * 32767.0).astype(np.int16).tobytes()
+                    start_time = datetime.utcnow().timestamp()
+                    end_time = start_time + (self.chunk_size / self.samplerate)
                     
-                    # Create audio segment payload
-                    payload = {
-                        "start_time": datetime.utcnow().timestamp(),
-                        "end_time": datetime.utcnow().timestamp() + (self.chunk_size / self.samplerate),
-                        "audio_data": base64.b64encode(audio_chunk).decode('utf-8'),
-                        "sample_rate": self.samplerate
-                    }
+                    if self.audio_format == AUDIO_FORMAT_BINARY:
+                        payload = pack_audio_frame(sequence, start_time, end_time,
+                                                   self.samplerate, audio_chunk)
+                    else:
+                        # Create audio segment payload
+                        payload = json.dumps({
+                            "start_time": start_time,
+                            "end_time": end_time,
+                            "audio_data": base64.b64encode(audio_chunk).decode('utf-8'),
+                            "sample_rate": self.samplerate
+                        })
+                    sequence += 1
                     
                     try:
-                        await websocket.send(json.dumps(payload))
+                        await websocket.send(payload)
                     except Exception as e:
                         print(f"\nError sending audio data: {str(e)}")
                         raise
@@ -121,7 +143,7 @@ class AudioStreamer:
         if not self.session_id:
             raise ValueError("No active session. Call create_session() first.")
             
-        websocket_endpoint = f"{self.websocket_url}/ws/{self.session_id}"
+        websocket_endpoint = f"{self.websocket_url}/ws/{self.session_id}?audio_format={self.audio_format}"
         print(f"\nConnecting to WebSocket at: {websocket_endpoint}")
         
         try:
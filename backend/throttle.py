@@ -0,0 +1,201 @@
+"""Call budgeting and failure handling for face analysis backends.
+
+Rekognition limits ``detect_faces`` calls per second per account, so with
+many video sessions on one server the calls have to be shared out rather
+than made as fast as frames arrive:
+
+  FairShareLimiter  a token bucket over all sessions; when calls have to
+                    wait, the session served least recently goes next, and
+                    sessions whose scene changed go before periodic refreshes
+  backoff_delay     full-jitter exponential backoff for throttled calls
+  CircuitBreaker    stops calling a backend that keeps failing, so sessions
+                    keep their last metrics instead of queueing doomed calls
+"""
+import asyncio
+import random
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Error codes AWS uses when a call was refused for rate rather than content
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "ProvisionedThroughputExceededException",
+    "LimitExceededException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded"
+}
+
+
+# Errors caused by the request itself, which say nothing about the backend's health
+REQUEST_ERROR_CODES = {
+    "InvalidImageFormatException",
+    "ImageTooLargeException",
+    "InvalidParameterException"
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose circuit breaker is open"""
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """True for a botocore ClientError whose code means 'slow down'"""
+    response = getattr(error, "response", None)
+    return isinstance(response, dict) and response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+
+def is_request_error(error: Exception) -> bool:
+    """True for errors a bad frame causes, such as an undecodable image"""
+    if isinstance(error, ValueError):
+        return True
+    response = getattr(error, "response", None)
+    return isinstance(response, dict) and response.get("Error", {}).get("Code") in REQUEST_ERROR_CODES
+
+
+def backoff_delay(attempt: int, base: float = 0.2, cap: float = 5.0) -> float:
+    """Seconds to wait before retry `attempt` (0-based), uniformly jittered"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class FairShareLimiter:
+    """Token bucket of `rate` calls per second shared fairly between keys
+
+    A key (a session) asks for a call with `acquire`. While tokens are
+    left calls go straight through; once they run out, waiting keys are
+    granted tokens as they refill, the key served least recently first, so
+    every active session gets an equal slice of the budget. A priority
+    request counts as if its key was served `priority_boost` seconds
+    earlier, which moves it up the line without letting it starve others.
+    A rate of 0 means no limit.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0, priority_boost: float = 0.5,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.priority_boost = priority_boost
+        self.clock = clock
+        self._tokens = self.burst
+        self._refilled = clock()
+        # Pending requests: future -> (key, priority)
+        self._waiting: Dict[asyncio.Future, Tuple[str, bool]] = {}
+        self._last_served: Dict[str, float] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.granted = 0
+        self.waited = 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def _grant(self, key: str, now: float) -> None:
+        self._tokens -= 1.0
+        self._last_served[key] = now
+        self.granted += 1
+
+    async def acquire(self, key: str, priority: bool = False) -> None:
+        """Wait for this key's turn to make one call"""
+        if self.rate <= 0:
+            self.granted += 1
+            return
+        now = self.clock()
+        self._refill(now)
+        if not self._waiting and self._tokens >= 1.0:
+            self._grant(key, now)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[future] = (key, priority)
+        self.waited += 1
+        self._schedule()
+        try:
+            await future
+        finally:
+            self._waiting.pop(future, None)
+
+    def _schedule(self) -> None:
+        if self._timer is None and self._waiting:
+            delay = max(0.0, (1.0 - self._tokens) / self.rate)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _dispatch(self) -> None:
+        self._timer = None
+        now = self.clock()
+        self._refill(now)
+        while self._waiting and self._tokens >= 1.0:
+            future = min(self._waiting, key=self._turn)
+            key, _ = self._waiting.pop(future)
+            if future.done():
+                continue
+            self._grant(key, now)
+            future.set_result(None)
+        self._schedule()
+
+    def _turn(self, future: asyncio.Future) -> float:
+        key, priority = self._waiting[future]
+        return self._last_served.get(key, float("-inf")) - (self.priority_boost if priority else 0.0)
+
+    def forget(self, key: str) -> None:
+        """Drop a finished session's history"""
+        self._last_served.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate": self.rate,
+            "waiting": len(self._waiting),
+            "granted": self.granted,
+            "waited": self.waited
+        }
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures
+
+    While open, `allow` is False for `reset_timeout` seconds. After that a
+    single trial call is let through (half open): success closes the
+    circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # When the half-open trial call went out; a trial that never reports back expires
+        self._trial_at: Optional[float] = None
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        now = self.clock()
+        if state == "half_open" and (self._trial_at is None or now - self._trial_at >= self.reset_timeout):
+            self._trial_at = now
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial_at is not None or (self.opened_at is None and self.failures >= self.failure_threshold):
+            self.opened_at = self.clock()
+            self.trips += 1
+        self._trial_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "trips": self.trips}
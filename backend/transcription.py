@@ -0,0 +1,348 @@
+"""Pluggable speech-to-text backends.
+
+Every backend opens streams shaped like amazon_transcribe's
+StartStreamTranscriptionEventStream: audio goes in through
+``stream.input_stream.send_audio_event`` / ``end_stream`` and
+TranscriptEvents come out of ``stream.output_stream``, so
+TranscriptResultStreamHandler subclasses work with any of them.
+
+The backend is chosen per deployment with TRANSCRIPTION_BACKEND:
+``aws`` (default) streams to Amazon Transcribe, ``replay`` plays back a
+scripted interview locally for load tests and CI.
+
+`WarmStreamPool` wraps a backend and keeps a few streams already open, so
+a new session starts transcribing without waiting for stream setup.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from amazon_transcribe.model import Alternative, Result, Transcript, TranscriptEvent
+
+from awsclients import shared_clients
+
+DEFAULT_REPLAY_SCRIPT = [
+    "Um so I think my biggest strength is, you know, working with other people",
+    "In my last internship I kind of led a small team of three developers",
+    "We had like a really tight deadline and uh we shipped the feature on time",
+    "I would say I'm sort of a detail oriented person but I also like the big picture",
+    "Uh one thing I'm working on is, um, speaking up earlier in meetings",
+]
+
+
+class TranscriptionBackend:
+    """Opens transcription streams for a session"""
+
+    name = "base"
+
+    async def start_stream(self, language_code: str = "en-US", sample_rate: int = 16000,
+                           media_encoding: str = "pcm"):
+        raise NotImplementedError
+
+
+class AWSTranscriptionBackend(TranscriptionBackend):
+    """Amazon Transcribe streaming"""
+
+    name = "aws"
+
+    def __init__(self, region: str = "us-west-2"):
+        self.region = region
+
+    async def start_stream(self, language_code: str = "en-US", sample_rate: int = 16000,
+                           media_encoding: str = "pcm"):
+        # Streams share the registry's connections, so only the first pays for TLS setup
+        client = shared_clients().transcribe(self.region)
+        return await client.start_stream_transcription(
+            language_code=language_code,
+            media_sample_rate_hz=sample_rate,
+            media_encoding=media_encoding
+        )
+
+
+# --- Local replay backend ---
+
+class _ReplayInputStream:
+    def __init__(self, stream: "ReplayStream"):
+        self._stream = stream
+
+    async def send_audio_event(self, audio_chunk: Optional[bytes]):
+        self._stream.feed(len(audio_chunk) if audio_chunk else 0)
+
+    async def end_stream(self):
+        self._stream.close()
+
+
+class ReplayStream:
+    """Scripted transcript events released as audio arrives.
+
+    Events are scheduled on the audio clock (seconds of 16-bit mono PCM
+    received), not the wall clock, so a replay is deterministic and runs as
+    fast as the client streams. Each utterance reveals its words as growing
+    partial results and then sends a final result, like Transcribe does.
+    """
+
+    def __init__(self, script: List[str], sample_rate: int, words_per_second: float,
+                 partial_interval: float, pause_seconds: float):
+        self.sample_rate = sample_rate
+        self.audio_seconds = 0.0
+        self.input_stream = _ReplayInputStream(self)
+
+        self._schedule = self._build_schedule(script, words_per_second, partial_interval, pause_seconds)
+        self._pending: Optional[Tuple[float, TranscriptEvent]] = next(self._schedule, None)
+        self._events: "asyncio.Queue[Optional[TranscriptEvent]]" = asyncio.Queue()
+        self._closed = False
+
+    @staticmethod
+    def _event(result_id: str, start: float, end: float, text: str, is_partial: bool) -> TranscriptEvent:
+        alternative = Alternative(transcript=text, items=[], entities=[])
+        result = Result(result_id=result_id, start_time=start, end_time=end,
+                        is_partial=is_partial, alternatives=[alternative])
+        return TranscriptEvent(transcript=Transcript(results=[result]))
+
+    def _build_schedule(self, script: List[str], words_per_second: float, partial_interval: float,
+                        pause_seconds: float) -> Iterator[Tuple[float, TranscriptEvent]]:
+        # The script loops for as long as audio keeps coming
+        t = 0.0
+        utterance = 0
+        while script:
+            words = script[utterance % len(script)].split()
+            result_id = f"replay-{utterance}"
+            start = t
+            duration = len(words) / words_per_second
+
+            revealed = 0
+            while revealed < len(words):
+                t += partial_interval
+                count = min(len(words), math.ceil((t - start) * words_per_second))
+                if count > revealed:
+                    revealed = count
+                    yield t, self._event(result_id, start, t, " ".join(words[:count]), True)
+
+            t = max(t, start + duration) + partial_interval
+            yield t, self._event(result_id, start, t, " ".join(words), False)
+
+            t += pause_seconds
+            utterance += 1
+
+    def feed(self, num_bytes: int) -> None:
+        """Advance the audio clock and release every event that is now due"""
+        if self._closed:
+            return
+        self.audio_seconds += num_bytes / (2 * self.sample_rate)
+        while self._pending is not None and self._pending[0] <= self.audio_seconds:
+            self._events.put_nowait(self._pending[1])
+            self._pending = next(self._schedule, None)
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._events.put_nowait(None)
+
+    @property
+    def output_stream(self) -> AsyncIterator[TranscriptEvent]:
+        return self._iter_events()
+
+    async def _iter_events(self) -> AsyncIterator[TranscriptEvent]:
+        while True:
+            event = await self._events.get()
+            if event is None:
+                return
+            yield event
+
+
+class ReplayTranscriptionBackend(TranscriptionBackend):
+    """Deterministic local stand-in for Transcribe, no network needed"""
+
+    name = "replay"
+
+    def __init__(self, script: Optional[List[str]] = None, words_per_second: float = 2.5,
+                 partial_interval: float = 0.3, pause_seconds: float = 0.8):
+        self.script = list(script or DEFAULT_REPLAY_SCRIPT)
+        self.words_per_second = words_per_second
+        self.partial_interval = partial_interval
+        self.pause_seconds = pause_seconds
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "ReplayTranscriptionBackend":
+        """Load a script with one utterance per line"""
+        with open(path, encoding="utf-8") as f:
+            script = [line.strip() for line in f if line.strip()]
+        return cls(script, **kwargs)
+
+    async def start_stream(self, language_code: str = "en-US", sample_rate: int = 16000,
+                           media_encoding: str = "pcm"):
+        return ReplayStream(self.script, sample_rate, self.words_per_second,
+                            self.partial_interval, self.pause_seconds)
+
+
+# --- Pre-warmed streams ---
+
+StreamKey = Tuple[str, int, str]
+
+
+class WarmStreamPool(TranscriptionBackend):
+    """Backend wrapper that hands out streams started ahead of time
+
+    Up to `size` idle streams are kept open for each (language, sample
+    rate, encoding) in `keys` or asked for since. `start_stream` takes the
+    oldest ready one, falling back to starting a stream when none is, and
+    the pool is topped up in the background. Transcribe ends a stream that
+    gets no audio for 15 s, so `run` replaces idle streams before they are
+    `max_idle` seconds old and then ends them. After a failed start no more streams are
+    started ahead for that key for `retry_after` seconds.
+
+    Warm streams are not free. Each one is replaced every 0.75 * `max_idle`
+    seconds, so `size` 2 with the default `max_idle` starts 16 streams a
+    minute. Transcribe bills every stream for at least 15 seconds of audio,
+    and idle streams count against the account's concurrent stream quota.
+    Streams are therefore only kept warm for `active_for` seconds after a
+    session last asked for one. Outside that window the pool drains, and
+    the first session after a quiet spell waits for a cold start.
+    """
+
+    def __init__(self, backend: TranscriptionBackend, size: int = 2, max_idle: float = 10.0,
+                 keys: Iterable[StreamKey] = (), retry_after: float = 10.0, interval: float = 1.0,
+                 active_for: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.backend = backend
+        self.size = size
+        self.max_idle = max_idle
+        self.active_for = active_for
+        self.retry_after = retry_after
+        self.interval = interval
+        self.clock = clock
+        # Oldest first: (started, stream)
+        self._ready: Dict[StreamKey, Deque[Tuple[float, Any]]] = {key: deque() for key in keys}
+        self._starting: Dict[StreamKey, int] = {}
+        self._failed_at: Dict[StreamKey, float] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._closed = False
+        # When a session last asked for a stream; None until the first one does
+        self._requested_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+        self.retired = 0
+        self.failures = 0
+
+    @property
+    def name(self) -> str:
+        return self.backend.name
+
+    async def start_stream(self, language_code: str = "en-US", sample_rate: int = 16000,
+                           media_encoding: str = "pcm"):
+        key = (language_code, sample_rate, media_encoding)
+        ready = self._ready.setdefault(key, deque())
+        now = self.clock()
+        self._requested_at = now
+        while ready and now - ready[0][0] >= self.max_idle:
+            self._retire(ready.popleft()[1])
+        stream = ready.popleft()[1] if ready else None
+        self._fill(key)
+
+        if stream is not None:
+            self.hits += 1
+            return stream
+        self.misses += 1
+        return await self.backend.start_stream(language_code, sample_rate, media_encoding)
+
+    def _active(self) -> bool:
+        return self._requested_at is not None and self.clock() - self._requested_at < self.active_for
+
+    def _fill(self, key: StreamKey) -> None:
+        if self._closed or not self._active():
+            return
+        failed_at = self._failed_at.get(key)
+        if failed_at is not None and self.clock() - failed_at < self.retry_after:
+            return
+        # Streams in the last quarter of their idle time are replaced early,
+        # so there is no gap while their replacements start
+        fresh_after = self.clock() - 0.75 * self.max_idle
+        fresh = sum(1 for started, _ in self._ready[key] if started > fresh_after)
+        missing = self.size - fresh - self._starting.get(key, 0)
+        for _ in range(missing):
+            self._starting[key] = self._starting.get(key, 0) + 1
+            self._spawn(self._start(key))
+
+    async def _start(self, key: StreamKey) -> None:
+        try:
+            stream = await self.backend.start_stream(*key)
+        except Exception as e:
+            self.failures += 1
+            self._failed_at[key] = self.clock()
+            print(f"Could not pre-start a {self.name} transcription stream: {e}")
+            return
+        finally:
+            self._starting[key] -= 1
+        self._failed_at.pop(key, None)
+        if self._closed:
+            self._retire(stream)
+        else:
+            self._ready[key].append((self.clock(), stream))
+
+    def _retire(self, stream) -> None:
+        self.retired += 1
+        self._spawn(self._end(stream))
+
+    async def _end(self, stream) -> None:
+        try:
+            await stream.input_stream.end_stream()
+            # Read out the service's goodbye so the stream closes cleanly
+            await asyncio.wait_for(self._drain(stream), timeout=5.0)
+        except Exception:
+            pass
+
+    @staticmethod
+    async def _drain(stream) -> None:
+        async for _ in stream.output_stream:
+            pass
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def run(self) -> None:
+        """Keep every key topped up with streams younger than `max_idle`"""
+        while True:
+            now = self.clock()
+            for key, ready in self._ready.items():
+                while ready and now - ready[0][0] >= self.max_idle:
+                    self._retire(ready.popleft()[1])
+                self._fill(key)
+            await asyncio.sleep(self.interval)
+
+    async def close(self) -> None:
+        """End every idle stream and stop starting new ones"""
+        self._closed = True
+        for ready in self._ready.values():
+            while ready:
+                self._retire(ready.popleft()[1])
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=5.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "active": self._active(),
+            "ready": sum(len(ready) for ready in self._ready.values()),
+            "starting": sum(self._starting.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "retired": self.retired,
+            "failures": self.failures
+        }
+
+
+def create_transcription_backend(name: Optional[str] = None) -> TranscriptionBackend:
+    """Build the backend named by `name` or the TRANSCRIPTION_BACKEND env var"""
+    name = (name or os.environ.get("TRANSCRIPTION_BACKEND", "aws")).lower()
+    if name == AWSTranscriptionBackend.name:
+        return AWSTranscriptionBackend(region=os.environ.get("TRANSCRIBE_REGION", "us-west-2"))
+    if name == ReplayTranscriptionBackend.name:
+        script_path = os.environ.get("TRANSCRIPTION_REPLAY_SCRIPT")
+        if script_path:
+            return ReplayTranscriptionBackend.from_file(script_path)
+        return ReplayTranscriptionBackend()
+    raise ValueError(f"Unknown transcription backend: {name}")
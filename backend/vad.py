@@ -0,0 +1,121 @@
+"""Energy / zero-crossing voice activity gate for 16-bit PCM.
+
+Audio is split into short frames whose level (dBFS) and zero-crossing rate
+are computed in one vectorized pass per chunk. A frame counts as speech
+when it is loud enough relative to an adaptive noise floor, or moderately
+loud with the high zero-crossing rate of unvoiced consonants. Speech keeps
+the gate open for a hangover period, and the frames just before an onset
+are replayed from a pre-roll buffer, so word edges are not clipped. Long
+silences are replaced by a short frame of digital silence every
+`keepalive_interval` seconds so the transcription stream stays open.
+"""
+from collections import deque
+from typing import Deque, Dict, Optional
+
+import numpy as np
+
+
+class VoiceActivityGate:
+    """Drops silent stretches from a mono int16 PCM stream"""
+
+    def __init__(self, sample_rate: int = 16000, frame_ms: float = 20.0,
+                 threshold_db: float = -45.0, noise_margin_db: float = 10.0,
+                 unvoiced_zcr: float = 0.3, hangover_ms: float = 300.0,
+                 preroll_ms: float = 200.0, keepalive_interval: Optional[float] = 5.0,
+                 keepalive_ms: float = 20.0):
+        self.sample_rate = sample_rate
+        self.frame_samples = max(1, int(sample_rate * frame_ms / 1000))
+        self.threshold_db = threshold_db
+        self.noise_margin_db = noise_margin_db
+        self.unvoiced_zcr = unvoiced_zcr
+        self.hangover_frames = int(round(hangover_ms / frame_ms))
+        self.keepalive_samples = int(keepalive_interval * sample_rate) if keepalive_interval else None
+        self._keepalive_frame = np.zeros(int(sample_rate * keepalive_ms / 1000), dtype=np.int16)
+
+        self.noise_floor = threshold_db - noise_margin_db
+        self._hang = 0
+        self._pending = np.zeros(0, dtype=np.int16)
+        self._preroll: Deque[np.ndarray] = deque(maxlen=int(round(preroll_ms / frame_ms)))
+        self._silent_samples = 0
+
+        self.passed_samples = 0
+        self.skipped_samples = 0
+        self.keepalives = 0
+
+    @property
+    def active(self) -> bool:
+        """Whether the gate is inside speech or its hangover"""
+        return self._hang > 0
+
+    def frame_features(self, frames: np.ndarray):
+        """Level in dBFS and zero-crossing rate of each row of `frames`"""
+        samples = frames.astype(np.float32)
+        rms = np.sqrt(np.mean(samples * samples, axis=1))
+        level = 20 * np.log10(rms / 32768.0 + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frames.shape[1] - 1)
+        return level, zcr
+
+    def process(self, pcm: np.ndarray) -> Optional[np.ndarray]:
+        """Feed a chunk of samples, returning the audio to forward (or None)"""
+        if len(self._pending):
+            pcm = np.concatenate((self._pending, pcm))
+        n_frames = len(pcm) // self.frame_samples
+        usable = n_frames * self.frame_samples
+        self._pending = pcm[usable:].copy()
+        if n_frames == 0:
+            return None
+
+        frames = pcm[:usable].reshape(n_frames, self.frame_samples)
+        levels, zcrs = self.frame_features(frames)
+
+        out = []
+        for frame, level, zcr in zip(frames, levels, zcrs):
+            threshold = max(self.threshold_db, self.noise_floor + self.noise_margin_db)
+            speech = level > threshold or (
+                level > threshold - self.noise_margin_db / 2 and zcr > self.unvoiced_zcr
+            )
+
+            if speech:
+                if self._hang == 0 and self._preroll:
+                    # Onset: replay the audio just before it
+                    out.extend(self._preroll)
+                    self._preroll.clear()
+                self._hang = self.hangover_frames
+                out.append(frame)
+                self._silent_samples = 0
+                continue
+
+            # Follow the noise floor down quickly and up slowly
+            if level < self.noise_floor:
+                self.noise_floor = level
+            else:
+                self.noise_floor += 0.02 * (level - self.noise_floor)
+
+            if self._hang > 0:
+                self._hang -= 1
+                out.append(frame)
+                continue
+
+            if len(self._preroll) == self._preroll.maxlen:
+                # Whatever falls out of the pre-roll is never sent
+                self.skipped_samples += self.frame_samples
+            self._preroll.append(frame)
+            self._silent_samples += self.frame_samples
+            if self.keepalive_samples and self._silent_samples >= self.keepalive_samples:
+                out.append(self._keepalive_frame)
+                self.keepalives += 1
+                self._silent_samples = 0
+
+        if not out:
+            return None
+        audio = np.concatenate(out)
+        self.passed_samples += len(audio)
+        return audio
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "passed_seconds": round(self.passed_samples / self.sample_rate, 3),
+            "skipped_seconds": round(self.skipped_samples / self.sample_rate, 3),
+            "keepalives": self.keepalives
+        }
@@ -0,0 +1,331 @@
+"""Server-side video frame analysis.
+
+Each video session keeps only its newest unanalysed frame in a
+`LatestFrameSlot`; frames that arrive while the previous one is still
+being analysed replace it instead of queueing, so analysis never falls
+behind the camera. The face analysis itself is blocking (a Rekognition
+call or CPU work), so `FrameAnalysisPool` runs it on a shared thread pool.
+
+The desktop apps get the same latest-frame-wins behaviour from
+`FaceAnalysisWorker`, which runs the analysis on its own threads so the
+capture and render loop never waits for it.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Generic, List, Optional, Tuple, TypeVar
+
+import numpy as np
+
+from faceanalysis import CachedFaceAnalyzer, FaceAnalyzer, FaceCropTracker, FaceImage, score_face
+from throttle import CircuitBreaker, CircuitOpenError, FairShareLimiter, backoff_delay, is_request_error, is_throttling_error
+
+T = TypeVar("T")
+
+
+class LatestFrameSlot(Generic[T]):
+    """Single-slot mailbox where a newer item overwrites an unread one"""
+
+    def __init__(self):
+        self._item: Optional[T] = None
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.offered = 0
+        self.dropped = 0
+
+    def offer(self, item: T) -> None:
+        if self._item is not None:
+            self.dropped += 1
+        self._item = item
+        self.offered += 1
+        self._ready.set()
+
+    async def take(self) -> Optional[T]:
+        """Newest item, waiting for one; None once closed"""
+        while self._item is None:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        item, self._item = self._item, None
+        return item
+
+    def poll(self) -> Optional[T]:
+        """Newest item if there is one, without waiting"""
+        item, self._item = self._item, None
+        return item
+
+    def close(self) -> None:
+        self._closed = True
+        self._ready.set()
+
+
+class FrameAnalysisPool:
+    """Runs a FaceAnalyzer on worker threads shared by all sessions
+
+    Calls are spread over the sessions by `limiter` and retried with
+    jittered backoff when the backend throttles them. After repeated
+    failures `breaker` opens and `analyze` raises CircuitOpenError without
+    calling the backend, so sessions keep their last metrics.
+    """
+
+    def __init__(self, analyzer: FaceAnalyzer, workers: int = 4, limiter: Optional[FairShareLimiter] = None,
+                 breaker: Optional[CircuitBreaker] = None, max_retries: int = 3):
+        self.analyzer = analyzer
+        self.workers = workers
+        self.limiter = limiter or FairShareLimiter(rate=0)
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frame-analysis")
+        self.in_flight = 0
+        self.analyzed = 0
+        self.errors = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.cache_hits = 0
+
+    async def analyze(self, image: FaceImage, key: str = "", priority: bool = False,
+                      refresh: Optional[Callable[[], Optional[FaceImage]]] = None,
+                      cache: Optional[CachedFaceAnalyzer] = None,
+                      tracker: Optional[FaceCropTracker] = None) -> List[Dict[str, Any]]:
+        """Faces in `image` once `key` gets its share of the call budget
+
+        `refresh` is called when the call may go ahead and can return a
+        newer image to analyse instead, so waiting for the budget doesn't
+        make the result stale. `cache` is the session's own result cache;
+        a hit is returned before any budget is spent, so only frames the
+        backend has to see count against the rate limit. `tracker` crops
+        only the frames sent to the backend and follows their results, so
+        cache hits don't use up its periodic full-frame checks.
+        """
+        if cache is not None:
+            # Hashing the preview is quick CPU work, kept off the executor
+            # where it could queue behind blocking backend calls
+            faces = await asyncio.to_thread(cache.lookup, image)
+            if faces is not None:
+                self.cache_hits += 1
+                return faces
+
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError(f"{self.analyzer.name} face analysis paused after repeated failures")
+
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(key, priority)
+            if attempt == 0:
+                if refresh is not None:
+                    image = refresh() or image
+                if tracker is not None:
+                    image.crop = tracker.next_crop()
+
+            self.in_flight += 1
+            try:
+                faces = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._detect, image, cache)
+            except Exception as e:
+                if is_throttling_error(e) and attempt < self.max_retries:
+                    self.throttled += 1
+                    await asyncio.sleep(backoff_delay(attempt))
+                    continue
+                self.errors += 1
+                if not is_request_error(e):
+                    self.breaker.record_failure()
+                raise
+            finally:
+                self.in_flight -= 1
+
+            self.breaker.record_success()
+            self.analyzed += 1
+            if tracker is not None:
+                tracker.update(faces, image.crop)
+            return faces
+
+    def _detect(self, image: FaceImage, cache: Optional[CachedFaceAnalyzer]) -> List[Dict[str, Any]]:
+        faces = self.analyzer.detect_faces(image)
+        if cache is not None:
+            cache.store(image, faces)
+        return faces
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.analyzer.name,
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "analyzed": self.analyzed,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "rejected": self.rejected,
+            "cache_hits": self.cache_hits,
+            "limiter": self.limiter.stats(),
+            "breaker": self.breaker.stats(),
+            **self.analyzer.stats()
+        }
+
+
+class FaceAnalysisWorker:
+    """Background face analysis fed from a single-slot mailbox of frames
+
+    `submit` never blocks: a frame that no thread has picked up yet is
+    replaced by the newer one. Up to `in_flight` frames are analysed at
+    once, and results are passed to `on_result` one at a time in capture
+    order; a result that finishes after a newer one is dropped. Published
+    results steer `tracker`, which crops the frames that follow.
+
+    Throttled calls are retried with jittered backoff. While `breaker` is
+    open frames are skipped, leaving the last published metrics in place.
+    """
+
+    def __init__(self, analyzer: FaceAnalyzer, on_result: Callable[[List[Dict[str, Any]]], None],
+                 in_flight: int = 1, on_error: Optional[Callable[[Exception], None]] = None,
+                 tracker: Optional[FaceCropTracker] = None, breaker: Optional[CircuitBreaker] = None,
+                 max_retries: int = 3):
+        self.analyzer = analyzer
+        self.on_result = on_result
+        self.on_error = on_error
+        self.tracker = tracker or FaceCropTracker()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self._mailbox = threading.Condition()
+        self._frame: Optional[Tuple[int, np.ndarray]] = None
+        self._sequence = 0
+        self._closed = False
+        # Serialises on_result and remembers the newest frame published
+        self._publish = threading.Lock()
+        self._published = 0
+
+        self.submitted = 0
+        self.dropped = 0
+        self.analyzed = 0
+        self.stale = 0
+        self.errors = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+
+        self._threads = [threading.Thread(target=self._run, name=f"face-analysis-{i}", daemon=True)
+                         for i in range(in_flight)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, frame: np.ndarray) -> None:
+        """Queue a BGR frame for analysis, replacing any frame still waiting"""
+        with self._mailbox:
+            if self._frame is not None:
+                self.dropped += 1
+            self._sequence += 1
+            self._frame = (self._sequence, frame)
+            self.submitted += 1
+            self._mailbox.notify()
+
+    def _take(self) -> Optional[Tuple[int, np.ndarray]]:
+        with self._mailbox:
+            while self._frame is None and not self._closed:
+                self._mailbox.wait()
+            if self._closed:
+                return None
+            frame, self._frame = self._frame, None
+            return frame
+
+    def _run(self) -> None:
+        while True:
+            taken = self._take()
+            if taken is None:
+                return
+            sequence, frame = taken
+            with self._publish:
+                if not self.breaker.allow():
+                    self.rejected += 1
+                    continue
+                crop = self.tracker.next_crop()
+            try:
+                faces = self._detect(FaceImage(bgr=frame, crop=crop))
+            except Exception as e:
+                with self._publish:
+                    self.errors += 1
+                    self.last_error = str(e)
+                    if not is_request_error(e):
+                        self.breaker.record_failure()
+                if self.on_error:
+                    self.on_error(e)
+                continue
+
+            with self._publish:
+                if sequence < self._published:
+                    self.stale += 1
+                    continue
+                self.breaker.record_success()
+                self._published = sequence
+                self.analyzed += 1
+                self.tracker.update(faces, crop)
+                self.on_result(faces)
+
+    def _detect(self, image: FaceImage) -> List[Dict[str, Any]]:
+        for attempt in range(self.max_retries):
+            try:
+                return self.analyzer.detect_faces(image)
+            except Exception as e:
+                if not is_throttling_error(e):
+                    raise
+                with self._publish:
+                    self.throttled += 1
+                time.sleep(backoff_delay(attempt))
+        return self.analyzer.detect_faces(image)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Stop taking frames; waits up to `timeout` for analyses in flight"""
+        with self._mailbox:
+            self._closed = True
+            self._frame = None
+            self._mailbox.notify_all()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.analyzer.name,
+            "in_flight": len(self._threads),
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "analyzed": self.analyzed,
+            "stale": self.stale,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "rejected": self.rejected,
+            "breaker": self.breaker.stats(),
+            **self.tracker.stats(),
+            **self.analyzer.stats()
+        }
+
+
+class VisualTracker:
+    """Rolling eye contact percentage and confidence score for one session"""
+
+    def __init__(self, window_seconds: float = 10.0, initial_confidence: float = 50):
+        self.window_seconds = window_seconds
+        self.confidence = initial_confidence
+        self.face_detected = False
+        self._eye_contact: Deque[Tuple[float, int]] = deque()
+        self._eye_contact_sum = 0
+
+    def update(self, faces: List[Dict[str, Any]], now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        self.face_detected = bool(faces)
+        eye_contact = 0
+        if faces:
+            eye_contact, self.confidence = score_face(faces[0], self.confidence)
+
+        self._eye_contact.append((now, eye_contact))
+        self._eye_contact_sum += eye_contact
+        while self._eye_contact and now - self._eye_contact[0][0] > self.window_seconds:
+            self._eye_contact_sum -= self._eye_contact.popleft()[1]
+
+    @property
+    def eye_contact(self) -> float:
+        """Share of recently analysed frames with eye contact, in percent"""
+        return self._eye_contact_sum / len(self._eye_contact) if self._eye_contact else 0.0